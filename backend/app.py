@@ -4,32 +4,104 @@
 Flask API сервер для приюта "Дом Лап"
 Обрабатывает донаты, подписки, админ-панель и интеграцию с YooMoney
 """
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
+from sqlalchemy import func, extract, tuple_, or_, not_, cast, select, Integer, Float
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import json
 import os
+import threading
+import base64
 import hashlib
 import hmac
-import requests
 from typing import Optional, Dict, Any
+from contextlib import ExitStack
 
-from database import init_db, get_db, User, Donation, Subscription, PaymentMethod, engine, SessionLocal
+from database import init_db, start_db_maintenance, get_db, User, Donation, Subscription, PaymentMethod, engine, SessionLocal, donation_effective_date, DB_DIAGNOSTICS, query_scope, read_data_versions, month_version, user_upsert_statement, resolve_user_ids, existing_donation_ids
+from donation_stats import daily_totals
+from donation_export import iter_csv, iter_xlsx
+from yoomoney_client import YooMoneyClient
+from recurring_charges import calculate_next_charge_date, run_due_charges
+from payment_outbox import enqueue_payment, notify_new_intents, start_payment_workers, wait_for_intent
+from webhook_queue import enqueue_event, start_webhook_workers
+from session_store import create_session_store
+from rate_limit import create_rate_limiter
+from metrics import init_app as init_metrics, metrics, rate_limit_collector, response_cache_collector, events_collector, yoomoney_collector
+from response_cache import response_cache, begin_read, finish_read
+from json_provider import init_app as init_json
+from events import event_hub, donation_created_event
 import random
 import string
 
 app = Flask(__name__)
-CORS(app)  # Разрешаем CORS для фронтенда
+CORS(app, expose_headers=['ETag'])  # Разрешаем CORS для фронтенда
+JSON_BACKEND = init_json(app)  # orjson, если установлен (JSON_PROVIDER)
+
+# Максимальный размер страницы для списков
+MAX_PAGE_SIZE = 1000
+
+# Построчный JSON (?stream=1 или Accept: application/x-ndjson) и размер порции чтения из курсора
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_CHUNK_ROWS = 500
+
+# Статусы донатов, которые учитываются в суммах
+# (в тестовом режиме pending считается завершенным)
+COUNTED_STATUSES = ['succeeded', 'completed', 'pending']
 
 # Конфигурация YooMoney
 YOOMONEY_SHOP_ID = os.getenv('YOOMONEY_SHOP_ID', '')  # ID магазина в YooMoney
 YOOMONEY_SECRET_KEY = os.getenv('YOOMONEY_SECRET_KEY', '')  # Секретный ключ
 YOOMONEY_WEBHOOK_SECRET = os.getenv('YOOMONEY_WEBHOOK_SECRET', '')  # Секрет для проверки webhook
+YOOMONEY_API_URL = os.getenv('YOOMONEY_API_URL', 'https://yoomoney.ru/api/v3/payments')  # Можно указать локальную заглушку
+
+# Клиент YooMoney: пул соединений, таймауты, повторы и circuit breaker (см. yoomoney_client.py)
+yoomoney_client = YooMoneyClient(
+    YOOMONEY_API_URL,
+    YOOMONEY_SECRET_KEY,
+    connect_timeout=float(os.getenv('YOOMONEY_CONNECT_TIMEOUT', '3')),
+    read_timeout=float(os.getenv('YOOMONEY_READ_TIMEOUT', '15')),
+    max_concurrency=int(os.getenv('YOOMONEY_MAX_CONCURRENCY', '20')),
+    max_retries=int(os.getenv('YOOMONEY_MAX_RETRIES', '2')),
+    failure_threshold=int(os.getenv('YOOMONEY_BREAKER_THRESHOLD', '5')),
+    reset_timeout=float(os.getenv('YOOMONEY_BREAKER_RESET', '30'))
+)
 BASE_URL = os.getenv('BASE_URL', 'http://localhost:8000')  # Базовый URL для return_url
 
+# Имена тестовых доноров, которые не учитываются на дашборде админки (через запятую)
+DASHBOARD_EXCLUDED_NAMES = [
+    name.strip() for name in os.getenv('DASHBOARD_EXCLUDED_NAMES', 'влад,nikita,никита').split(',')
+    if name.strip()
+]
+DASHBOARD_RECENT_LIMIT = int(os.getenv('DASHBOARD_RECENT_LIMIT', '10'))
+
+# Ограничение частоты send-code и создания донатов (см. rate_limit.py)
+rate_limiter = create_rate_limiter()
+# Сколько обратных прокси перед API дописывают адрес в X-Forwarded-For (0 - заголовок не читается)
+RATE_LIMIT_TRUST_PROXY = int(os.getenv('RATE_LIMIT_TRUST_PROXY', '0'))
+
+# Метрики Prometheus (GET /metrics) и проверка живости (GET /healthz), см. metrics.py
+init_metrics(app, engine)
+metrics.register_collector(yoomoney_collector(lambda: yoomoney_client))
+metrics.register_collector(rate_limit_collector(lambda: rate_limiter))
+metrics.register_collector(response_cache_collector(lambda: response_cache))
+metrics.register_collector(events_collector(lambda: event_hub))
+
+if DB_DIAGNOSTICS:
+    # Диагностика БД: повторяющиеся запросы считаются в пределах одного HTTP-запроса
+    @app.before_request
+    def _open_query_scope():
+        g.query_scope = ExitStack()
+        rule = request.url_rule.rule if request.url_rule else request.path
+        g.query_scope.enter_context(query_scope(f'{request.method} {rule}'))
+
+    @app.teardown_request
+    def _close_query_scope(exc):
+        stack = g.pop('query_scope', None)
+        if stack is not None:
+            stack.close()
+
 # Инициализация БД при старте
 init_db()
 
@@ -37,36 +109,243 @@ init_db()
 # ==================== УТИЛИТЫ ====================
 
 def get_or_create_user(phone: str, email: Optional[str] = None, full_name: Optional[str] = None, db: Session = None) -> User:
-    """Получить или создать пользователя"""
-    user = db.query(User).filter(User.phone == phone).first()
-    if not user:
-        user = User(phone=phone, email=email, full_name=full_name)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    else:
-        # Обновляем данные, если они изменились
-        if email and user.email != email:
-            user.email = email
-        if full_name and user.full_name != full_name:
-            user.full_name = full_name
-        db.commit()
+    """
+    Получить или создать пользователя одним INSERT ... ON CONFLICT DO UPDATE ... RETURNING
+    
+    email и имя обновляются, только если переданы и отличаются от сохраненных.
+    Коммит делает вызывающий код - вместе с остальной записью.
+    Для многих телефонов сразу - database.resolve_user_ids.
+    """
+    stmt = user_upsert_statement([{'phone': phone, 'email': email or None, 'full_name': full_name or None}])
+    user = db.scalars(stmt.returning(User), execution_options={'populate_existing': True}).first()
+    if user is None:
+        # Данные не изменились: UPSERT ничего не записал и строку не вернул
+        user = db.query(User).filter(User.phone == phone).one()
     return user
 
 
-def calculate_next_charge_date(frequency: str, from_date: Optional[datetime] = None) -> datetime:
-    """Вычислить дату следующего списания"""
-    if from_date is None:
-        from_date = datetime.utcnow()
+def normalize_phone(phone: str) -> str:
+    """Нормализовать телефон: убрать пробелы, скобки и дефисы"""
+    return phone.replace(' ', '').replace('(', '').replace(')', '').replace('-', '')
+
+
+def client_ip() -> str:
+    """
+    IP клиента для ограничения частоты
+
+    За RATE_LIMIT_TRUST_PROXY прокси адрес клиента - N-й справа в X-Forwarded-For:
+    его дописал ближайший к клиенту доверенный прокси (как ProxyFix с x_for=N).
+    Значения левее присылает сам клиент, по ним ведро не выбирается.
+    """
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = [ip.strip() for ip in request.headers.get('X-Forwarded-For', '').split(',') if ip.strip()]
+        if len(forwarded) >= RATE_LIMIT_TRUST_PROXY:
+            return forwarded[-RATE_LIMIT_TRUST_PROXY]
+    return request.remote_addr or ''
+
+
+def too_many_requests(retry_after: int):
+    """Ответ 429 с заголовком Retry-After"""
+    response = jsonify({'error': 'Слишком много запросов, попробуйте позже', 'retry_after': retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Закодировать позицию (created_at, id) в непрозрачный курсор"""
+    raw = json.dumps([created_at.isoformat(), row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Раскодировать курсор в (created_at, id). ValueError, если курсор поврежден"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw.decode('utf-8'))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError('Некорректный курсор')
+
+
+def parse_date_param(value: Optional[str], end_of_day: bool = False) -> Optional[datetime]:
+    """
+    Разобрать дату из query-параметра (YYYY-MM-DD или ISO 8601)
     
-    if frequency == 'weekly':
-        return from_date + timedelta(weeks=1)
-    elif frequency == 'monthly':
-        return from_date + relativedelta(months=1)
-    elif frequency == 'quarterly':
-        return from_date + relativedelta(months=3)
-    else:
-        return from_date + relativedelta(months=1)  # По умолчанию месяц
+    Для верхней границы в формате YYYY-MM-DD возвращается начало следующего дня,
+    чтобы фильтр "< date_to" включал весь указанный день.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Некорректная дата: {value}')
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def parse_bool_param(value: Optional[str]) -> Optional[bool]:
+    """Разобрать булев query-параметр (true/false/1/0)"""
+    if value is None or value == '':
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def excluded_names_condition():
+    """
+    SQL-условие "имя донора содержит одно из исключенных имен" или None, если список пуст
+    
+    LIKE в SQLite не учитывает регистр только для латиницы, поэтому
+    для каждого имени проверяются варианты: строчными, с заглавной, прописными.
+    """
+    patterns = set()
+    for name in DASHBOARD_EXCLUDED_NAMES:
+        for variant in (name.lower(), name.capitalize(), name.upper()):
+            patterns.add(f'%{variant}%')
+    if not patterns:
+        return None
+    return or_(*[Donation.public_name.like(pattern) for pattern in sorted(patterns)])
+
+
+# ==================== БЫСТРОЕ ЧТЕНИЕ СПИСКОВ ====================
+# Списки выбирают только нужные колонки кортежами, без ORM-объектов: даты приводятся
+# к ISO 8601, а суммы к REAL прямо в SQLite, поэтому строки не проходят через
+# datetime и Decimal и сразу складываются в словари ответа.
+
+def iso_datetime(column):
+    """
+    Дата в формате datetime.isoformat() средствами SQLite
+    
+    DateTime хранится как 'YYYY-MM-DD HH:MM:SS.ffffff'; нулевые микросекунды
+    isoformat() не выводит, поэтому они отбрасываются так же.
+    """
+    return func.replace(func.replace(column, ' ', 'T'), '.000000', '')
+
+
+def as_float(column):
+    """Numeric как REAL: в ответе то же значение, что float(Decimal)"""
+    return cast(column, Float)
+
+
+# Поле ответа -> выражение; порядок полей не важен, jsonify сортирует ключи
+DONATION_LIST_COLUMNS = {
+    'id': Donation.id,
+    'public_name': Donation.public_name,
+    'amount': as_float(Donation.amount),
+    'purpose': Donation.purpose,
+    'status': Donation.status,
+    'paid_at': iso_datetime(Donation.paid_at),
+    'created_at': iso_datetime(Donation.created_at),
+    'phone': Donation.phone,
+    'email': Donation.email,
+    'is_recurring': Donation.is_recurring,
+}
+
+DONATION_HISTORY_COLUMNS = {
+    name: DONATION_LIST_COLUMNS[name]
+    for name in ('id', 'amount', 'purpose', 'status', 'paid_at', 'created_at', 'is_recurring')
+}
+
+SUBSCRIPTION_LIST_COLUMNS = {
+    'id': Subscription.id,
+    'user_id': Subscription.user_id,
+    'amount': as_float(Subscription.amount),
+    'purpose': Subscription.purpose,
+    'frequency': Subscription.frequency,
+    'status': Subscription.status,
+    'next_charge_at': iso_datetime(Subscription.next_charge_at),
+    'last_charge_at': iso_datetime(Subscription.last_charge_at),
+    'created_at': iso_datetime(Subscription.created_at),
+}
+
+
+def project(columns: dict, *keyset_columns):
+    """
+    SELECT только колонок ответа
+    
+    keyset_columns добавляются в конец строки (например, created_at для курсора).
+    Выполняется через соединение сессии (fetch_rows) - строки не проходят загрузку ORM.
+    """
+    return select(*columns.values(), *keyset_columns)
+
+
+def fetch_rows(db, stmt) -> list:
+    """Выполнить SELECT из project() в транзакции сессии"""
+    return db.connection().execute(stmt).all()
+
+
+def rows_to_dicts(rows, columns: dict) -> list:
+    """Строки project() -> список словарей ответа (лишние колонки курсора отбрасываются)"""
+    names = tuple(columns)
+    return [dict(zip(names, row)) for row in rows]
+
+
+def ndjson_requested() -> bool:
+    """Клиент просит построчный ответ: ?stream=1 или Accept: application/x-ndjson"""
+    if request.args.get('stream') == '1':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def stream_ndjson(db, stmt, columns: dict) -> Response:
+    """
+    Потоковый ответ NDJSON: одна запись - одна строка JSON
+    
+    Строки читаются из курсора порциями по STREAM_CHUNK_ROWS и уходят клиенту
+    сразу, поэтому первый байт не ждет конца выборки, а память ограничена
+    одной порцией при любом размере таблицы. Сессия закрывается, когда
+    клиент дочитал (или оборвал) ответ.
+    """
+    names = tuple(columns)
+    dumps = app.json.dumps
+    result = db.connection().execution_options(yield_per=STREAM_CHUNK_ROWS).execute(stmt)
+    
+    def generate():
+        for rows in result.partitions():
+            yield ''.join([dumps(dict(zip(names, row))) + '\n' for row in rows]).encode('utf-8')
+    
+    response = Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+    response.call_on_close(db.close)
+    return response
+
+
+def filter_donations(query, args):
+    """
+    Применить фильтры списка донатов из query-параметров
+    
+    Поддерживаются: status, purpose, date_from, date_to (по created_at), is_recurring.
+    status принимает несколько значений через запятую: ?status=succeeded,pending.
+    """
+    statuses = [s.strip() for s in (args.get('status') or '').split(',') if s.strip()]
+    purpose = args.get('purpose')
+    date_from = parse_date_param(args.get('date_from'))
+    date_to = parse_date_param(args.get('date_to'), end_of_day=True)
+    is_recurring = parse_bool_param(args.get('is_recurring'))
+    
+    if len(statuses) == 1:
+        query = query.filter(Donation.status == statuses[0])
+    elif statuses:
+        query = query.filter(Donation.status.in_(statuses))
+    if purpose:
+        query = query.filter(Donation.purpose == purpose)
+    if date_from:
+        query = query.filter(Donation.created_at >= date_from)
+    if date_to:
+        query = query.filter(Donation.created_at < date_to)
+    if is_recurring is not None:
+        query = query.filter(Donation.is_recurring == is_recurring)
+    return query
+
+
+def donation_list_query(query, args):
+    """Фильтры списка донатов и позиция keyset-курсора (?cursor=); ValueError - неверный параметр"""
+    query = filter_donations(query, args)
+    cursor = args.get('cursor')
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Donation.created_at, Donation.id) < (cursor_created_at, cursor_id))
+    return query
 
 
 # ==================== YOOMONEY ИНТЕГРАЦИЯ ====================
@@ -76,11 +355,15 @@ def create_yoomoney_payment(
     description: str,
     return_url: str,
     metadata: Dict[str, Any],
-    payment_method: str = 'card'
+    payment_method: str = 'card',
+    idempotence_key: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Создать платеж в YooMoney
     
+    idempotence_key передается в заголовке Idempotence-Key: повтор запроса
+    с тем же ключом вернет уже созданный платеж, а не создаст новый.
+    
     Это упрощенная версия. В реальности нужно использовать официальный SDK YooMoney
     или делать HTTP запросы к их API согласно документации.
     
@@ -105,11 +388,6 @@ def create_yoomoney_payment(
         }
     
     # Реальная интеграция (пример структуры запроса)
-    url = 'https://yoomoney.ru/api/v3/payments'
-    headers = {
-        'Authorization': f'Bearer {YOOMONEY_SECRET_KEY}',
-        'Content-Type': 'application/json'
-    }
     # Определяем тип платежного метода для YooMoney
     # bank_card - обычная карта; для СБП и других методов нужно смотреть документацию YooMoney
     if payment_method == 'card':
@@ -140,33 +418,29 @@ def create_yoomoney_payment(
     }
     
     try:
-        response = requests.post(url, json=data, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        return yoomoney_client.create_payment(data, idempotence_key)
     except Exception as e:
         print(f"[ERROR] YooMoney API error: {e}")
         raise
 
 
-def verify_yoomoney_webhook(data: Dict[str, Any], signature: str) -> bool:
+def verify_yoomoney_webhook(raw_body: bytes, signature: str) -> bool:
     """
     Проверить подпись webhook от YooMoney
-    
-    ВАЖНО: Реальная проверка зависит от формата подписи, который использует YooMoney.
-    Обычно это HMAC-SHA256 от тела запроса с секретным ключом.
+
+    HMAC-SHA256 считается по исходным байтам тела запроса: повторная
+    сериализация JSON меняет порядок ключей и экранирование, и подпись не совпадает.
     """
     if not YOOMONEY_WEBHOOK_SECRET:
         # В режиме разработки пропускаем проверку
         return True
-    
-    # Пример проверки (нужно адаптировать под реальный формат YooMoney)
-    body_str = json.dumps(data, sort_keys=True, ensure_ascii=False)
+
     expected_signature = hmac.new(
         YOOMONEY_WEBHOOK_SECRET.encode('utf-8'),
-        body_str.encode('utf-8'),
+        raw_body,
         hashlib.sha256
     ).hexdigest()
-    
+
     return hmac.compare_digest(expected_signature, signature)
 
 
@@ -174,34 +448,53 @@ def verify_yoomoney_webhook(data: Dict[str, Any], signature: str) -> bool:
 
 @app.route('/api/admin/donations', methods=['GET'])
 def get_admin_donations():
-    """Получить список донатов для админ-панели"""
+    """
+    Получить список донатов для админ-панели
+    
+    Keyset-пагинация по (created_at, id): ответ - {donations, next_cursor},
+    как у /api/donations/history; next_cursor передается обратно в ?cursor=.
+    Время ответа не зависит от глубины прокрутки. Ответ кэшируется
+    до следующей записи донатов, ETag - по версии донатов (см. response_cache.py).
+    
+    С ?stream=1 или Accept: application/x-ndjson отдается вся выборка построчно
+    (stream_ndjson): фильтры и cursor те же, limit по умолчанию не ограничен,
+    next_cursor нет - поток заканчивается вместе с выборкой.
+    """
+    if ndjson_requested():
+        return stream_admin_donations()
+    
     db = next(get_db())
     try:
-        limit = request.args.get('limit', 50, type=int)
-        status = request.args.get('status', None)
-        
-        query = db.query(Donation)
-        if status:
-            query = query.filter(Donation.status == status)
+        limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_PAGE_SIZE)
         
-        donations = query.order_by(Donation.created_at.desc()).limit(limit).all()
-        
-        result = []
-        for d in donations:
-            result.append({
-                'id': d.id,
-                'public_name': d.public_name,
-                'amount': float(d.amount),
-                'purpose': d.purpose,
-                'status': d.status,
-                'paid_at': d.paid_at.isoformat() if d.paid_at else None,
-                'created_at': d.created_at.isoformat(),
-                'phone': d.phone,
-                'email': d.email,
-                'is_recurring': d.is_recurring
-            })
-        
-        return jsonify(result)
+        # Параметры и курсор проверяются до ETag: на некорректный запрос - 400, а не 304
+        try:
+            query = donation_list_query(
+                project(DONATION_LIST_COLUMNS, Donation.created_at.label('cursor_created_at')), request.args
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        ready, read = begin_read(lambda names: read_data_versions(db.connection(), names), ('donations',))
+        if ready is not None:
+            return ready
+        
+        # Берем на одну запись больше, чтобы понять, есть ли следующая страница
+        rows = fetch_rows(db, query.order_by(
+            Donation.created_at.desc(), Donation.id.desc()
+        ).limit(limit + 1))
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = encode_cursor(last.cursor_created_at, last.id)
+        
+        return finish_read(read, jsonify({
+            'donations': rows_to_dicts(rows, DONATION_LIST_COLUMNS),
+            'next_cursor': next_cursor
+        }))
     except Exception as e:
         print(f"[ERROR] get_admin_donations: {e}")
         return jsonify({'error': str(e)}), 500
@@ -209,64 +502,129 @@ def get_admin_donations():
         db.close()
 
 
+def stream_admin_donations():
+    """Вся выборка донатов админки в NDJSON, без кэша ответов и ETag"""
+    db = next(get_db())
+    try:
+        query = donation_list_query(project(DONATION_LIST_COLUMNS), request.args)
+    except ValueError as e:
+        db.close()
+        return jsonify({'error': str(e)}), 400
+    
+    query = query.order_by(Donation.created_at.desc(), Donation.id.desc())
+    limit = request.args.get('limit', type=int)
+    if limit:
+        query = query.limit(max(limit, 1))
+    try:
+        return stream_ndjson(db, query, DONATION_LIST_COLUMNS)
+    except Exception as e:
+        db.close()
+        print(f"[ERROR] stream_admin_donations: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+# Форматы выгрузки: (генератор, MIME-тип, расширение файла)
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv; charset=utf-8', 'csv'),
+    'xlsx': (iter_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+@app.route('/api/admin/donations/export', methods=['GET'])
+def export_admin_donations():
+    """
+    Потоковая выгрузка донатов в CSV или XLSX (?format=csv|xlsx)
+    
+    Принимает те же фильтры, что и /api/admin/donations. Строки читаются
+    из курсора порциями (yield_per) и сразу уходят клиенту, поэтому
+    скачивание начинается сразу, а память не зависит от объема выгрузки.
+    """
+    export_format = request.args.get('format', 'xlsx').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': 'Поддерживаемые форматы: csv, xlsx'}), 400
+    generator, mimetype, extension = EXPORT_FORMATS[export_format]
+    
+    db = next(get_db())
+    try:
+        query = filter_donations(db.query(
+            Donation.id,
+            Donation.public_name,
+            Donation.amount,
+            Donation.purpose,
+            Donation.status,
+            Donation.paid_at,
+            Donation.created_at,
+            Donation.phone,
+            Donation.email
+        ), request.args)
+    except ValueError as e:
+        db.close()
+        return jsonify({'error': str(e)}), 400
+    
+    rows = query.order_by(Donation.created_at.desc(), Donation.id.desc()).yield_per(1000)
+    filename = f"donations_{datetime.utcnow().strftime('%Y-%m-%d')}.{extension}"
+    
+    response = Response(stream_with_context(generator(rows)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Сессия живет, пока клиент дочитывает ответ
+    response.call_on_close(db.close)
+    return response
+
+
 @app.route('/api/admin/donations/monthly-stats', methods=['GET'])
 def get_monthly_stats():
-    """Получить статистику донатов по месяцам для графика"""
+    """
+    Получить статистику донатов по месяцам для графика
+    
+    Ответ кэшируется до изменения итогов этого месяца; итоги закрытого
+    месяца - без ограничения по времени.
+    """
     db = next(get_db())
     try:
-        year = request.args.get('year', datetime.utcnow().year, type=int)
-        month = request.args.get('month', datetime.utcnow().month, type=int)
-        
-        # Получаем все донаты за месяц со статусом succeeded, completed или pending
-        # В тестовом режиме считаем pending как завершенный
-        # Используем paid_at если есть, иначе created_at
-        from sqlalchemy import or_, case
-        donations = db.query(Donation).filter(
-            or_(
-                Donation.status == 'succeeded',
-                Donation.status == 'completed',
-                Donation.status == 'pending'
-            )
-        ).all()
+        now = datetime.utcnow()
+        year = request.args.get('year', now.year, type=int)
+        month = request.args.get('month', now.month, type=int)
+        if not 1 <= month <= 12:
+            return jsonify({'error': 'Месяц должен быть от 1 до 12'}), 400
+        
+        ready, read = begin_read(
+            lambda names: read_data_versions(db.connection(), names),
+            (month_version(year, month),), params={'year': year, 'month': month}
+        )
+        if ready is not None:
+            return ready
         
-        # Фильтруем по дате в Python, так как нужно использовать paid_at или created_at
-        filtered_donations = []
-        for d in donations:
-            donation_date = d.paid_at if d.paid_at else d.created_at
-            if donation_date and donation_date.year == year and donation_date.month == month:
-                filtered_donations.append(d)
-        donations = filtered_donations
+        # Учитываем донаты со статусом succeeded, completed или pending
+        # (в тестовом режиме считаем pending как завершенный).
+        # Дата доната - paid_at, если есть, иначе created_at. Суммы по дням берутся
+        # из сводки donation_daily_stats - это несколько десятков строк за месяц.
+        month_start = datetime(year, month, 1)
+        month_end = month_start + relativedelta(months=1)
+        totals = daily_totals(db, month_start.date(), month_end.date(), COUNTED_STATUSES)
         
-        # Группируем по дням
-        by_day = {}
-        total = 0
-        
-        for d in donations:
-            # Используем paid_at если есть, иначе created_at
-            donation_date = d.paid_at if d.paid_at else d.created_at
-            if donation_date:
-                day = donation_date.day
-                if day not in by_day:
-                    by_day[day] = 0
-                by_day[day] += float(d.amount)
-                total += float(d.amount)
+        by_day = {day.day: amount for day, (count, amount) in totals.items()}
+        total = sum(by_day.values())
         
         # Формируем массив для всех дней месяца
         from calendar import monthrange
         days_in_month = monthrange(year, month)[1]
         result_by_day = []
-        for day in range(1, days_in_month + 1):
+        for day_number in range(1, days_in_month + 1):
             result_by_day.append({
-                'day': day,
-                'amount': by_day.get(day, 0)
+                'day': day_number,
+                'amount': by_day.get(day_number, 0)
             })
         
-        return jsonify({
+        response = jsonify({
             'year': year,
             'month': month,
             'by_day': result_by_day,
             'total': total
         })
+        month_closed = month_end <= datetime(now.year, now.month, 1)
+        if month_closed:
+            return finish_read(read, response, ttl=None)
+        return finish_read(read, response)
     except Exception as e:
         print(f"[ERROR] get_monthly_stats: {e}")
         return jsonify({'error': str(e)}), 500
@@ -274,6 +632,194 @@ def get_monthly_stats():
         db.close()
 
 
+@app.route('/api/admin/dashboard', methods=['GET'])
+def get_admin_dashboard():
+    """
+    Сводка для главной страницы админки за один запрос
+    
+    Сумма и количество донатов за месяц, число активных подписок,
+    последние донаты и суммы по дням. Тестовые доноры (DASHBOARD_EXCLUDED_NAMES)
+    исключаются на сервере. ETag - по версиям донатов и подписок.
+    """
+    db = next(get_db())
+    try:
+        now = datetime.utcnow()
+        year = request.args.get('year', now.year, type=int)
+        month = request.args.get('month', now.month, type=int)
+        if not 1 <= month <= 12:
+            return jsonify({'error': 'Месяц должен быть от 1 до 12'}), 400
+        
+        ready, read = begin_read(
+            lambda names: read_data_versions(db.connection(), names),
+            ('donations', 'subscriptions', month_version(year, month)), cache=False
+        )
+        if ready is not None:
+            return ready
+        
+        month_start = datetime(year, month, 1)
+        month_end = month_start + relativedelta(months=1)
+        
+        # Суммы по дням из сводки donation_daily_stats
+        by_day = {}
+        for day, (count, amount) in daily_totals(db, month_start.date(), month_end.date(), COUNTED_STATUSES).items():
+            by_day[day.day] = [count, amount]
+        
+        # Вычитаем донаты тестовых доноров: выборка по индексу ix_donations_effective_date
+        # ограничена строками этого месяца
+        excluded = excluded_names_condition()
+        if excluded is not None:
+            effective_date = donation_effective_date()
+            day = func.cast(func.strftime('%d', effective_date), Integer)
+            excluded_rows = db.query(
+                day.label('day'),
+                func.count(Donation.id).label('count'),
+                func.sum(Donation.amount).label('amount')
+            ).filter(
+                effective_date >= month_start,
+                effective_date < month_end,
+                Donation.status.in_(COUNTED_STATUSES),
+                excluded
+            ).group_by(day).all()
+            for row in excluded_rows:
+                entry = by_day.setdefault(row.day, [0, 0])
+                entry[0] -= row.count
+                entry[1] -= float(row.amount or 0)
+        
+        from calendar import monthrange
+        days_in_month = monthrange(year, month)[1]
+        daily = [
+            {'day': day_number, 'amount': round(by_day.get(day_number, [0, 0])[1], 2)}
+            for day_number in range(1, days_in_month + 1)
+        ]
+        month_total = round(sum(amount for count, amount in by_day.values()), 2)
+        donations_count = sum(count for count, amount in by_day.values())
+        
+        active_subscriptions = db.query(func.count(Subscription.id)).filter(
+            Subscription.status == 'active'
+        ).scalar()
+        
+        recent_query = db.query(Donation)
+        if excluded is not None:
+            recent_query = recent_query.filter(not_(excluded))
+        recent = recent_query.order_by(
+            Donation.created_at.desc(), Donation.id.desc()
+        ).limit(DASHBOARD_RECENT_LIMIT).all()
+        
+        return finish_read(read, jsonify({
+            'year': year,
+            'month': month,
+            'month_total': month_total,
+            'donations_count': donations_count,
+            'active_subscriptions': active_subscriptions,
+            'recent_donations': [{
+                'id': d.id,
+                'public_name': d.public_name,
+                'amount': float(d.amount),
+                'purpose': d.purpose,
+                'status': d.status,
+                'paid_at': d.paid_at.isoformat() if d.paid_at else None,
+                'created_at': d.created_at.isoformat()
+            } for d in recent],
+            'by_day': daily
+        }))
+    except Exception as e:
+        print(f"[ERROR] get_admin_dashboard: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
+
+@app.route('/api/donations/history', methods=['GET'])
+def get_donation_history():
+    """
+    История донатов одного пользователя (для личного кабинета)
+    
+    Донаты ищутся по user_id, телефону (в исходном и нормализованном виде) или email.
+    Пагинация - как у /api/admin/donations: курсор следующей страницы в поле next_cursor.
+    Итоги за все время и по назначениям считаются на сервере.
+    ETag - по версии донатов: повторный запрос без изменений получает 304.
+    """
+    db = next(get_db())
+    try:
+        user_id = request.args.get('user_id', None, type=int)
+        phone = request.args.get('phone', '').strip()
+        email = request.args.get('email', '').strip()
+        limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        
+        conditions = []
+        if user_id:
+            conditions.append(Donation.user_id == user_id)
+        if phone:
+            conditions.append(Donation.phone.in_({phone, normalize_phone(phone)}))
+        if email:
+            conditions.append(Donation.email == email)
+        if not conditions:
+            return jsonify({'error': 'Необходим user_id, phone или email'}), 400
+        
+        # Каждое условие обслуживается своим индексом (user_id/phone/email, created_at, id)
+        owner_filter = or_(*conditions)
+        
+        query = project(DONATION_HISTORY_COLUMNS, Donation.created_at.label('cursor_created_at')).filter(owner_filter)
+        if cursor:
+            try:
+                cursor_created_at, cursor_id = decode_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            query = query.filter(
+                tuple_(Donation.created_at, Donation.id) < (cursor_created_at, cursor_id)
+            )
+        
+        ready, read = begin_read(
+            lambda names: read_data_versions(db.connection(), names), ('donations',), cache=False
+        )
+        if ready is not None:
+            return ready
+        
+        rows = fetch_rows(db, query.order_by(
+            Donation.created_at.desc(), Donation.id.desc()
+        ).limit(limit + 1))
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        result = rows_to_dicts(rows, DONATION_HISTORY_COLUMNS)
+        
+        # Итоги по назначениям - одним GROUP BY по донатам пользователя
+        by_purpose = {}
+        lifetime_amount = 0
+        lifetime_count = 0
+        totals = db.query(
+            Donation.purpose,
+            func.count(Donation.id).label('count'),
+            func.sum(Donation.amount).label('amount')
+        ).filter(
+            owner_filter,
+            Donation.status.in_(COUNTED_STATUSES)
+        ).group_by(Donation.purpose).all()
+        for row in totals:
+            by_purpose[row.purpose] = {'count': row.count, 'amount': float(row.amount or 0)}
+            lifetime_amount += float(row.amount or 0)
+            lifetime_count += row.count
+        
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = encode_cursor(last.cursor_created_at, last.id)
+        
+        return finish_read(read, jsonify({
+            'donations': result,
+            'next_cursor': next_cursor,
+            'totals': {
+                'lifetime': {'count': lifetime_count, 'amount': lifetime_amount},
+                'by_purpose': by_purpose
+            }
+        }))
+    except Exception as e:
+        print(f"[ERROR] get_donation_history: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
+
 @app.route('/api/donations', methods=['POST'])
 def create_donation():
     """Создать донат и инициировать платеж в YooMoney"""
@@ -290,10 +836,14 @@ def create_donation():
         is_recurring = data.get('is_recurring', False)
         anonymous = data.get('anonymous', False)
         full_name = data.get('full_name', '').strip()
-        phone = data.get('phone', '').strip()
+        phone = normalize_phone(data.get('phone', '').strip())
         email = data.get('email', '').strip()
         user_id = data.get('user_id', None)
         payment_method = data.get('payment_method', 'card')
+
+        retry_after = rate_limiter.check(('donations:ip', client_ip()), ('donations:phone', phone))
+        if retry_after:
+            return too_many_requests(retry_after)
         
         # Определяем публичное имя
         if anonymous:
@@ -320,10 +870,10 @@ def create_donation():
             status='pending'
         )
         db.add(donation)
-        db.commit()
-        db.refresh(donation)
+        db.flush()
         
-        # Создаем платеж в YooMoney (или мок в режиме разработки)
+        # Платеж в YooMoney создают воркеры payment_outbox.py: задание пишется
+        # в той же транзакции, что и донат, и ответ не ждет провайдера
         description = f"Пожертвование в приют 'Дом Лап': {purpose}"
         return_url = f"{BASE_URL}/frontend/donate.html?donation_id={donation.id}&status=success"
         metadata = {
@@ -332,37 +882,20 @@ def create_donation():
             'purpose': purpose,
             'payment_method': payment_method
         }
+        enqueue_payment(db, donation, description, return_url, metadata, payment_method=payment_method)
+        created_event = donation_created_event(donation)
+        db.commit()
+        event_hub.publish('donation.created', created_event)
         
-        try:
-            payment_response = create_yoomoney_payment(
-                amount,
-                description,
-                return_url,
-                metadata,
-                payment_method=payment_method
-            )
-            
-            # Сохраняем ID платежа от провайдера
-            donation.provider_payment_id = payment_response.get('id')
-            donation.provider = 'yoomoney'
-            db.commit()
-            
-            # Если это регулярное пожертвование, создаем подписку (после успешного первого платежа)
-            subscription_id = None
-            if is_recurring and user:
-                # Подписка будет создана после успешного первого платежа через webhook
-                pass
-            
-            return jsonify({
-                'donation_id': donation.id,
-                'payment_url': payment_response.get('confirmation', {}).get('confirmation_url'),
-                'status': 'pending'
-            })
-        except Exception as e:
-            print(f"[ERROR] YooMoney payment creation failed: {e}")
-            donation.status = 'failed'
-            db.commit()
-            return jsonify({'error': f'Ошибка создания платежа: {str(e)}'}), 500
+        # Подписка для регулярного пожертвования создается после успешного первого платежа через webhook
+        notify_new_intents()
+        
+        return jsonify({
+            'donation_id': donation.id,
+            'payment_url': None,
+            'payment_status_url': f'/api/donations/{donation.id}/payment',
+            'status': 'pending'
+        }), 202
         
     except Exception as e:
         print(f"[ERROR] create_donation: {e}")
@@ -372,125 +905,103 @@ def create_donation():
         db.close()
 
 
+@app.route('/api/donations/<int:donation_id>/payment', methods=['GET'])
+def get_donation_payment(donation_id: int):
+    """
+    Ссылка на оплату доната (short poll или long poll)
+    
+    Параметр wait - сколько секунд ждать создания платежа (0-30, по умолчанию 0).
+    payment_status: queued/processing - платеж еще создается, created - ссылка
+    в payment_url, failed - платеж создать не удалось.
+    """
+    wait = request.args.get('wait', 0, type=float)
+    wait = max(0.0, min(wait, 30.0))
+    try:
+        snapshot = wait_for_intent(donation_id, wait)
+        if snapshot is None:
+            return jsonify({'error': 'Payment not found'}), 404
+        return jsonify(snapshot)
+    except Exception as e:
+        print(f"[ERROR] get_donation_payment: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/yoomoney/webhook', methods=['POST'])
 def yoomoney_webhook():
-    """Обработчик webhook от YooMoney"""
-    db = next(get_db())
+    """
+    Обработчик webhook от YooMoney
+
+    Событие только проверяется и записывается в очередь webhook_events,
+    ответ 200 уходит сразу. Статусы донатов и подписки обновляют воркеры
+    webhook_queue.py; повторная доставка того же события не обрабатывается дважды.
+    """
     try:
-        # Получаем данные и подпись
-        data = request.json
+        raw_body = request.get_data(cache=False)
         signature = request.headers.get('X-YooMoney-Signature', '')  # Или другой заголовок, зависит от YooMoney
-        
+
         # Проверяем подпись
-        if not verify_yoomoney_webhook(data, signature):
+        if not verify_yoomoney_webhook(raw_body, signature):
             print("[WARNING] Invalid webhook signature")
             return jsonify({'error': 'Invalid signature'}), 401
-        
-        # Обрабатываем событие
+
+        try:
+            data = json.loads(raw_body)
+        except ValueError:
+            return jsonify({'error': 'Invalid JSON'}), 400
+
+        # Подписанное, но не того вида тело отклоняется 400: на 500 YooMoney повторял бы его бесконечно
+        if not isinstance(data, dict) or not isinstance(data.get('object'), dict):
+            return jsonify({'error': 'JSON object with object field is required'}), 400
         event_type = data.get('event', '')
-        payment_data = data.get('object', {})
-        payment_id = payment_data.get('id', '')
-        
-        # Находим донат по ID платежа
-        donation = db.query(Donation).filter(Donation.provider_payment_id == payment_id).first()
-        if not donation:
-            print(f"[WARNING] Donation not found for payment_id: {payment_id}")
-            return jsonify({'error': 'Donation not found'}), 404
-        
-        # Обновляем статус доната
-        status = payment_data.get('status', '')
-        if status == 'succeeded':
-            donation.status = 'succeeded'
-            donation.paid_at = datetime.utcnow()
-            
-            # Если это регулярное пожертвование и еще нет подписки - создаем
-            if donation.is_recurring and not donation.subscription_id and donation.user_id:
-                user = db.query(User).filter(User.id == donation.user_id).first()
-                if user:
-                    # Получаем или создаем способ оплаты
-                    payment_method = None
-                    if payment_data.get('payment_method', {}).get('id'):
-                        provider_token = payment_data['payment_method']['id']
-                        payment_method = db.query(PaymentMethod).filter(
-                            PaymentMethod.provider_payment_token == provider_token,
-                            PaymentMethod.user_id == user.id
-                        ).first()
-                        
-                        if not payment_method:
-                            payment_method = PaymentMethod(
-                                user_id=user.id,
-                                provider='yoomoney',
-                                provider_payment_token=provider_token,
-                                last4=payment_data.get('payment_method', {}).get('card', {}).get('last4', ''),
-                                is_active=True
-                            )
-                            db.add(payment_method)
-                            db.commit()
-                            db.refresh(payment_method)
-                    
-                    # Создаем подписку
-                    frequency = 'monthly'  # По умолчанию, можно брать из donation или запроса
-                    subscription = Subscription(
-                        user_id=user.id,
-                        payment_method_id=payment_method.id if payment_method else None,
-                        amount=donation.amount,
-                        purpose=donation.purpose,
-                        frequency=frequency,
-                        status='active',
-                        next_charge_at=calculate_next_charge_date(frequency)
-                    )
-                    db.add(subscription)
-                    db.commit()
-                    db.refresh(subscription)
-                    
-                    donation.subscription_id = subscription.id
-            
-        elif status in ['canceled', 'failed']:
-            donation.status = status
-        
-        db.commit()
-        
+        payment_id = data['object'].get('id', '')
+        if not payment_id or not isinstance(payment_id, str) or not isinstance(event_type, str):
+            return jsonify({'error': 'payment id is required'}), 400
+
+        enqueue_event(payment_id, event_type, raw_body)
         return jsonify({'status': 'ok'})
-        
+
     except Exception as e:
         print(f"[ERROR] yoomoney_webhook: {e}")
-        db.rollback()
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.close()
+
+
+def subscription_list_query(args):
+    """Подписки по ?user_id= и ?status= (по умолчанию active), новые первыми"""
+    user_id = args.get('user_id', None, type=int)
+    status = args.get('status', 'active')
+    
+    query = project(SUBSCRIPTION_LIST_COLUMNS)
+    if user_id:
+        query = query.filter(Subscription.user_id == user_id)
+    if status:
+        query = query.filter(Subscription.status == status)
+    return query.order_by(Subscription.created_at.desc())
 
 
 @app.route('/api/subscriptions', methods=['GET'])
 def get_subscriptions():
-    """Получить список подписок (для админки или профиля)"""
+    """
+    Получить список подписок (для админки или профиля); ответ кэшируется до записи подписок
+    
+    С ?stream=1 или Accept: application/x-ndjson список отдается построчно (stream_ndjson).
+    """
     db = next(get_db())
+    if ndjson_requested():
+        try:
+            return stream_ndjson(db, subscription_list_query(request.args), SUBSCRIPTION_LIST_COLUMNS)
+        except Exception as e:
+            db.close()
+            print(f"[ERROR] get_subscriptions: {e}")
+            return jsonify({'error': str(e)}), 500
+    
     try:
-        user_id = request.args.get('user_id', None, type=int)
-        status = request.args.get('status', 'active')
+        ready, read = begin_read(lambda names: read_data_versions(db.connection(), names), ('subscriptions',))
+        if ready is not None:
+            return ready
         
-        query = db.query(Subscription)
-        if user_id:
-            query = query.filter(Subscription.user_id == user_id)
-        if status:
-            query = query.filter(Subscription.status == status)
-        
-        subscriptions = query.order_by(Subscription.created_at.desc()).all()
-        
-        result = []
-        for s in subscriptions:
-            result.append({
-                'id': s.id,
-                'user_id': s.user_id,
-                'amount': float(s.amount),
-                'purpose': s.purpose,
-                'frequency': s.frequency,
-                'status': s.status,
-                'next_charge_at': s.next_charge_at.isoformat() if s.next_charge_at else None,
-                'last_charge_at': s.last_charge_at.isoformat() if s.last_charge_at else None,
-                'created_at': s.created_at.isoformat()
-            })
+        rows = fetch_rows(db, subscription_list_query(request.args))
         
-        return jsonify(result)
+        return finish_read(read, jsonify(rows_to_dicts(rows, SUBSCRIPTION_LIST_COLUMNS)))
     except Exception as e:
         print(f"[ERROR] get_subscriptions: {e}")
         return jsonify({'error': str(e)}), 500
@@ -509,7 +1020,9 @@ def cancel_subscription(subscription_id: int):
         
         subscription.status = 'canceled'
         subscription.canceled_at = datetime.utcnow()
+        canceled_event = {'id': subscription.id, 'user_id': subscription.user_id}
         db.commit()
+        event_hub.publish('subscription.canceled', canceled_event)
         
         return jsonify({'status': 'ok'})
     except Exception as e:
@@ -520,84 +1033,42 @@ def cancel_subscription(subscription_id: int):
         db.close()
 
 
+# ==================== ЛЕНТА ИЗМЕНЕНИЙ (SSE) ====================
+
+@app.route('/api/admin/events', methods=['GET'])
+def admin_events():
+    """
+    Лента изменений донатов и подписок в формате Server-Sent Events
+    
+    Соединение держится открытым; события публикуют пути записи (см. events.py).
+    Last-Event-ID (заголовок, который браузер шлет при переподключении, или
+    ?last_event_id=) - продолжить с пропущенных событий.
+    """
+    if not event_hub.acquire():
+        return jsonify({'error': 'Слишком много подключений к ленте событий'}), 503
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    response = Response(event_hub.stream(last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Не буферизовать ответ на прокси (nginx)
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(event_hub.release)
+    return response
+
+
 # ==================== КРОН-ДЖОБ ДЛЯ ПОДПИСОК ====================
 
 def process_recurring_charges():
     """
     Обработать регулярные списания по подпискам
     Вызывается по расписанию (cron или планировщик задач)
+    
+    Подписки забираются пачками с арендой и списываются параллельно,
+    см. recurring_charges.py (там же постоянный воркер: python recurring_charges.py --worker).
     """
-    db = SessionLocal()
     try:
-        now = datetime.utcnow()
-        
-        # Находим активные подписки, у которых наступило время списания
-        subscriptions = db.query(Subscription).filter(
-            Subscription.status == 'active',
-            Subscription.next_charge_at <= now
-        ).all()
-        
-        for subscription in subscriptions:
-            try:
-                # Создаем донат
-                donation = Donation(
-                    user_id=subscription.user_id,
-                    public_name=subscription.user.full_name if subscription.user else 'Анонимно',
-                    phone=subscription.user.phone if subscription.user else None,
-                    email=subscription.user.email if subscription.user else None,
-                    amount=subscription.amount,
-                    purpose=subscription.purpose,
-                    is_recurring=True,
-                    subscription_id=subscription.id,
-                    status='pending',
-                    provider='yoomoney'
-                )
-                db.add(donation)
-                db.commit()
-                db.refresh(donation)
-                
-                # Инициируем платеж через YooMoney API
-                if subscription.payment_method and subscription.payment_method.provider_payment_token:
-                    # Используем сохраненный токен для повторного списания
-                    # (это зависит от возможностей YooMoney API)
-                    description = f"Регулярное пожертвование: {subscription.purpose}"
-                    return_url = f"{BASE_URL}/frontend/profile.html"
-                    metadata = {
-                        'donation_id': donation.id,
-                        'subscription_id': subscription.id,
-                        'user_id': subscription.user_id
-                    }
-                    
-                    # Создаем платеж (в реальности нужно использовать токен для безакцептного списания)
-                    payment_response = create_yoomoney_payment(
-                        float(subscription.amount),
-                        description,
-                        return_url,
-                        metadata
-                    )
-                    
-                    donation.provider_payment_id = payment_response.get('id')
-                    db.commit()
-                    
-                    # Обновляем дату следующего списания (будет обновлена после успешного webhook)
-                    subscription.next_charge_at = calculate_next_charge_date(
-                        subscription.frequency,
-                        subscription.next_charge_at
-                    )
-                    db.commit()
-                else:
-                    # Нет способа оплаты - помечаем подписку как проблемную
-                    subscription.status = 'paused'
-                    db.commit()
-                    
-            except Exception as e:
-                print(f"[ERROR] Failed to process subscription {subscription.id}: {e}")
-                db.rollback()
-        
+        return run_due_charges(create_yoomoney_payment)
     except Exception as e:
         print(f"[ERROR] process_recurring_charges: {e}")
-    finally:
-        db.close()
 
 
 # ==================== МИГРАЦИЯ ДАННЫХ ====================
@@ -614,26 +1085,24 @@ def migrate_json_to_db():
             with open(donations_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
             
+            # Уже перенесенные донаты и пользователи - запросом на пачку, а не по строке
+            records = data.get('donations', [])
+            existing_ids = existing_donation_ids(db.connection(), [d.get('id') for d in records])
+            records = [d for d in records if d.get('id') not in existing_ids]
+            user_ids = resolve_user_ids(db.connection(), [
+                (d.get('userPhone', ''), d.get('userEmail', ''), d.get('userName', '')) for d in records
+            ])
+            
             count = 0
-            for d in data.get('donations', []):
-                # Проверяем, не существует ли уже
-                existing = db.query(Donation).filter(Donation.id == d.get('id')).first()
-                if existing:
-                    continue
-                
-                # Получаем или создаем пользователя
+            for d in records:
                 phone = d.get('userPhone', '')
                 email = d.get('userEmail', '')
                 name = d.get('userName', '')
                 
-                user = None
-                if phone:
-                    user = get_or_create_user(phone, email, name, db)
-                
                 # Создаем донат
                 donation = Donation(
                     id=d.get('id'),
-                    user_id=user.id if user else None,
+                    user_id=user_ids.get(phone),
                     public_name=name or 'Анонимно',
                     phone=phone,
                     email=email,
@@ -661,8 +1130,8 @@ def migrate_json_to_db():
 
 # ==================== АВТОРИЗАЦИЯ И РЕГИСТРАЦИЯ ====================
 
-# In-memory storage for verification codes (в продакшене использовать Redis)
-verification_sessions = {}
+# Хранилище кодов подтверждения: в памяти или общее SQLite (SESSION_STORE), см. session_store.py
+verification_sessions = create_session_store()
 
 def generate_code(length=4):
     """Генерировать код подтверждения"""
@@ -685,7 +1154,11 @@ def send_verification_code():
             return jsonify({'error': 'Номер телефона обязателен'}), 400
         
         # Normalize phone
-        normalized_phone = phone.replace(' ', '').replace('(', '').replace(')', '').replace('-', '')
+        normalized_phone = normalize_phone(phone)
+        
+        retry_after = rate_limiter.check(('send-code:ip', client_ip()), ('send-code:phone', normalized_phone))
+        if retry_after:
+            return too_many_requests(retry_after)
         
         # Generate code and session
         code = generate_code(4)
@@ -736,7 +1209,7 @@ def verify_code():
         
         # Check expiration
         if datetime.utcnow() > session['expires_at']:
-            del verification_sessions[session_id]
+            verification_sessions.pop(session_id, None)
             return jsonify({'error': 'Код истек'}), 400
         
         # Verify code
@@ -766,7 +1239,7 @@ def register():
             return jsonify({'error': 'Заполните все обязательные поля'}), 400
         
         # Normalize phone
-        normalized_phone = phone.replace(' ', '').replace('(', '').replace(')', '').replace('-', '')
+        normalized_phone = normalize_phone(phone)
         
         # Verify code first
         session = verification_sessions.get(session_id)
@@ -774,7 +1247,7 @@ def register():
             return jsonify({'error': 'Сессия не найдена или истекла'}), 404
         
         if datetime.utcnow() > session['expires_at']:
-            del verification_sessions[session_id]
+            verification_sessions.pop(session_id, None)
             return jsonify({'error': 'Код истек'}), 400
         
         if session['code'] != code or session['phone'] != normalized_phone:
@@ -796,7 +1269,7 @@ def register():
         db.refresh(user)
         
         # Clean up session
-        del verification_sessions[session_id]
+        verification_sessions.pop(session_id, None)
         
         return jsonify({
             'user': {
@@ -828,7 +1301,7 @@ def login():
             return jsonify({'error': 'Необходимы phone, code и session_id'}), 400
         
         # Normalize phone
-        normalized_phone = phone.replace(' ', '').replace('(', '').replace(')', '').replace('-', '')
+        normalized_phone = normalize_phone(phone)
         
         # Verify code
         session = verification_sessions.get(session_id)
@@ -836,7 +1309,7 @@ def login():
             return jsonify({'error': 'Сессия не найдена или истекла'}), 404
         
         if datetime.utcnow() > session['expires_at']:
-            del verification_sessions[session_id]
+            verification_sessions.pop(session_id, None)
             return jsonify({'error': 'Код истек'}), 400
         
         if session['code'] != code or session['phone'] != normalized_phone:
@@ -848,7 +1321,7 @@ def login():
             return jsonify({'error': 'Пользователь не найден. Пожалуйста, зарегистрируйтесь'}), 404
         
         # Clean up session
-        del verification_sessions[session_id]
+        verification_sessions.pop(session_id, None)
         
         return jsonify({
             'user': {
@@ -865,6 +1338,43 @@ def login():
     finally:
         db.close()
 
+# ==================== ФОНОВЫЕ ЗАДАЧИ ====================
+
+_background_lock = threading.Lock()
+_background_pid = None
+
+
+def start_background_jobs():
+    """
+    Запустить воркеры outbox платежей и очереди webhook и обслуживание БД этого процесса
+
+    Повторный вызов не создает лишних потоков. PAYMENT_WORKERS=0 и
+    WEBHOOK_WORKERS=0 - воркеры работают отдельными процессами;
+    SHELTER_DB_MAINTENANCE_INTERVAL=0 - PRAGMA optimize и checkpoint WAL не запускаются.
+    """
+    start_payment_workers(create_yoomoney_payment)
+    start_webhook_workers()
+    start_db_maintenance()
+
+
+@app.before_request
+def _ensure_background_jobs():
+    """
+    Фоновые задачи запускаются один раз на процесс - перед его первым запросом
+
+    Так они работают при любом способе запуска (python app.py, flask run,
+    WSGI-сервер) и заново стартуют в дочернем процессе после fork (gunicorn --preload),
+    а скрипты, которые импортируют из app.py функции, потоков не получают.
+    """
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    with _background_lock:
+        if _background_pid != os.getpid():
+            start_background_jobs()
+            _background_pid = os.getpid()
+
+
 # ==================== ЗАПУСК ====================
 
 if __name__ == '__main__':
@@ -873,16 +1383,24 @@ if __name__ == '__main__':
     print("=" * 50)
     print(f"\n[OK] API запущен на http://localhost:5000")
     print(f"[INFO] База данных: shelter.db")
+    print(f"[INFO] JSON: {JSON_BACKEND}")
     print("\n[INFO] Доступные эндпоинты:")
     print("  GET  /api/admin/donations")
+    print("  GET  /api/admin/donations/export")
+    print("  GET  /api/admin/events")
     print("  GET  /api/admin/donations/monthly-stats")
+    print("  GET  /api/admin/dashboard")
+    print("  GET  /api/donations/history")
     print("  POST /api/donations")
+    print("  GET  /api/donations/<id>/payment")
     print("  POST /api/yoomoney/webhook")
     print("  GET  /api/subscriptions")
     print("  POST /api/subscriptions/<id>/cancel")
     print("  POST /api/auth/send-code")
     print("  POST /api/auth/register")
     print("  POST /api/auth/login")
+    print("  GET  /metrics")
+    print("  GET  /healthz")
     print("=" * 50)
     
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк хранилищ сессий подтверждения (session_store.py)
+
+Для каждого бэкенда: вставка count живых сессий, count чтений случайных
+сессий и вставка еще count / 10 сессий поверх заполненного хранилища
+(с очисткой истекших). Печатает операции в секунду и пиковую память процесса
+(в Windows модуля resource нет - память не печатается).
+
+Запуск:
+    python bench_sessions.py                      # 1 000 000 сессий, оба бэкенда
+    python bench_sessions.py 100000 memory        # сессий, бэкенд (memory/sqlite)
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from session_store import MemorySessionStore, SQLiteSessionStore
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows
+
+
+def make_session(n: int) -> dict:
+    now = datetime.utcnow()
+    return {
+        'phone': f'+7900{n:07d}',
+        'code': f'{n % 10000:04d}',
+        'method': 'sms',
+        'created_at': now,
+        'expires_at': now + timedelta(minutes=5)
+    }
+
+
+def peak_rss_mb():
+    """Пиковая память процесса в МБ или None, если ее не узнать (Windows)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss в Linux - килобайты, в macOS - байты
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def timed(name: str, count: int, action) -> float:
+    started = time.perf_counter()
+    action()
+    elapsed = time.perf_counter() - started
+    print(f"  {name:8s} {count:>9} оп.  {elapsed:8.2f} с  {count / elapsed:>12,.0f} оп/с")
+    return count / elapsed
+
+
+def bench(store, count: int) -> dict:
+    ids = [f'{n:032d}' for n in range(count)]
+    rng = random.Random(1)
+    lookups = [rng.choice(ids) for _ in range(count)]
+
+    def insert():
+        for n, session_id in enumerate(ids):
+            store[session_id] = make_session(n)
+
+    def lookup():
+        get = store.get
+        for session_id in lookups:
+            get(session_id)
+
+    def churn():
+        for n in range(count, count + count // 10):
+            store[f'{n:032d}'] = make_session(n)
+
+    return {
+        'insert': timed('insert', count, insert),
+        'lookup': timed('lookup', count, lookup),
+        'churn': timed('churn', count // 10, churn),
+        'live': len(store),
+    }
+
+
+def main(argv) -> int:
+    count = int(argv[1]) if len(argv) > 1 else 1_000_000
+    backends = [argv[2]] if len(argv) > 2 else ['memory', 'sqlite']
+
+    for backend in backends:
+        print(f"[INFO] {backend}: {count} сессий")
+        if backend == 'memory':
+            store = MemorySessionStore(max_size=count + count // 10)
+            result = bench(store, count)
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                store = SQLiteSessionStore(os.path.join(tmp, 'sessions.db'))
+                result = bench(store, count)
+                store.close()
+        print(f"  живых сессий: {result['live']}")
+        peak = peak_rss_mb()
+        if peak is not None:
+            print(f"  пиковая память процесса: {peak:.0f} МБ")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
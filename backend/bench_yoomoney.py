@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк клиента YooMoney против локальной заглушки (fake_yoomoney.py)
+
+Сравнивает:
+- bare: requests.post на каждый платеж (новое TCP-соединение, как было раньше);
+- client: YooMoneyClient с пулом keep-alive соединений;
+- degraded: провайдер отвечает дольше read_timeout - сколько занимает отказ
+  с circuit breaker.
+
+Запуск:
+    python bench_yoomoney.py                      # 2000 платежей, 20 потоков, задержка 5 мс
+    python bench_yoomoney.py 5000 50 0.02         # платежей, потоков, задержка провайдера
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fake_yoomoney import FakeYooMoney
+from yoomoney_client import YooMoneyClient
+
+PAYLOAD = {
+    'amount': {'value': '500.0', 'currency': 'RUB'},
+    'description': 'bench',
+    'metadata': {'donation_id': 0}
+}
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] if ordered else 0.0
+
+
+def run(name: str, call, count: int, threads: int) -> dict:
+    """Выполнить count вызовов call в threads потоков и напечатать результат"""
+    latencies = []
+    errors = 0
+
+    def one(_):
+        started = time.perf_counter()
+        try:
+            call()
+            return time.perf_counter() - started, False
+        except Exception:
+            return time.perf_counter() - started, True
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        for latency, failed in pool.map(one, range(count)):
+            latencies.append(latency)
+            errors += failed
+    elapsed = time.perf_counter() - started
+
+    result = {
+        'name': name,
+        'requests': count,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(count / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+    print(f"  {name:10s} {result['rps']:>9} req/s  p50 {result['p50_ms']:>8} ms  "
+          f"p99 {result['p99_ms']:>8} ms  ошибок {errors}")
+    return result
+
+
+def main(argv) -> int:
+    count = int(argv[1]) if len(argv) > 1 else 2000
+    threads = int(argv[2]) if len(argv) > 2 else 20
+    delay = float(argv[3]) if len(argv) > 3 else 0.005
+
+    server = FakeYooMoney(delay=delay).start()
+    print(f"[INFO] {count} платежей, {threads} потоков, задержка провайдера {delay * 1000:.0f} мс")
+    try:
+        headers = {'Authorization': 'Bearer test', 'Content-Type': 'application/json'}
+
+        def bare():
+            response = requests.post(server.url, json=PAYLOAD, headers=headers)
+            response.raise_for_status()
+            return response.json()
+
+        before = len(server.connections)
+        run('bare', bare, count, threads)
+        bare_connections = len(server.connections) - before
+
+        client = YooMoneyClient(server.url, 'test', max_concurrency=threads)
+        before = len(server.connections)
+        run('client', lambda: client.create_payment(PAYLOAD), count, threads)
+        client_connections = len(server.connections) - before
+        print(f"  TCP-соединений: bare {bare_connections}, client {client_connections}")
+        print(f"  Счетчики клиента: {client.stats()}")
+
+        # Деградация: провайдер отвечает дольше таймаута чтения
+        server.delay = 1.0
+        degraded = YooMoneyClient(server.url, 'test', read_timeout=0.2, max_retries=1,
+                                  max_concurrency=threads, failure_threshold=5, reset_timeout=60)
+        run('degraded', lambda: degraded.create_payment(PAYLOAD), min(count, 200), threads)
+        stats = degraded.stats()
+        print(f"  circuit breaker: {stats['circuit_state']}, отклонено без запроса: {stats['circuit_rejected']}")
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк эндпоинтов API на сгенерированных наборах данных
+
+Для каждого размера (по умолчанию 10 000, 100 000 и 1 000 000 донатов):
+1. БД строится генератором (generate_test_data.py --bulk, seed 42) и кэшируется
+   в папке --data-dir; повторные запуски используют готовый файл.
+2. Замеры идут в отдельном процессе на копии БД (SHELTER_DB_PATH читается при
+   импорте database.py, а запись донатов и webhook меняет данные).
+3. Каждый эндпоинт вызывается через тестовый клиент Flask; для каждого
+   считаются p50/p99 задержки и строк в секунду (строк ответа или записанных строк).
+   process_recurring_charges замеряется на заранее наступивших подписках.
+
+Результаты пишутся в JSON и сравниваются с базовой линией: если p50 вырос
+больше чем в --threshold раз, замер помечается как регрессия и код возврата - 1.
+Число SQL-запросов одного вызова сверяется с QUERY_BUDGETS (database.query_budget):
+превышение, например запрос в цикле по строкам, - тоже код возврата 1.
+
+Запуск:
+    python benchmark.py                                   # все размеры, сравнение с benchmark_baseline.json
+    python benchmark.py --sizes 10000 --iterations 20
+    python benchmark.py --save-baseline                   # записать текущие результаты как базовую линию
+    python benchmark.py --response-cache                  # с кэшем ответов (по умолчанию выключен)
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = [10000, 100000, 1000000]
+DEFAULT_DATA_DIR = os.path.join(BACKEND_DIR, 'bench_data')
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, 'benchmark_baseline.json')
+# Регрессия - p50 выше базового в threshold раз и больше чем на MIN_REGRESSION_MS
+DEFAULT_THRESHOLD = 1.5
+MIN_REGRESSION_MS = 0.5
+# Замеры из нескольких вызовов (webhook_apply, recurring) слишком шумные для сравнения
+MIN_CALLS = 5
+# Бюджет SQL-запросов на один вызов эндпоинта: не зависит от размера набора,
+# поэтому запрос в цикле по строкам (N+1) сразу его превышает
+QUERY_BUDGETS = {
+    'list': 3,
+    'list_1000': 3,
+    'list_filtered': 3,
+    'monthly_stats': 3,
+    'dashboard': 6,
+    'history': 4,
+    'subscriptions': 2,
+    'export_csv': 5,
+    'create': 10,
+    'webhook': 2,
+    'send_code': 1,
+}
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] if ordered else 0.0
+
+
+def summarize(latencies: list, rows: int) -> dict:
+    """p50/p99/среднее в миллисекундах и строк в секунду по всем вызовам"""
+    total = sum(latencies)
+    return {
+        'calls': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(total / len(latencies) * 1000, 3) if latencies else 0.0,
+        'rows_per_sec': round(rows / total, 1) if total else 0.0,
+    }
+
+
+# ==================== ПОСТРОЕНИЕ НАБОРОВ ====================
+
+def dataset_path(data_dir: str, size: int) -> str:
+    return os.path.join(data_dir, f'bench-{size}.db')
+
+
+def build_dataset(data_dir: str, size: int, rebuild: bool = False) -> str:
+    """Сгенерировать БД на size донатов (если ее еще нет) отдельным процессом генератора"""
+    path = dataset_path(data_dir, size)
+    if os.path.exists(path) and not rebuild:
+        return path
+    os.makedirs(data_dir, exist_ok=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    users, subscriptions, methods = max(size // 10, 100), max(size // 100, 50), max(size // 70, 70)
+    print(f"[INFO] Генерация набора {size:,} донатов: {path}")
+    subprocess.run(
+        [sys.executable, os.path.join(BACKEND_DIR, 'generate_test_data.py'), '--bulk',
+         str(users), str(size), str(subscriptions), str(methods), '--seed', '42'],
+        env=dict(os.environ, SHELTER_DB_PATH=path), cwd=BACKEND_DIR, check=True, stdout=subprocess.DEVNULL
+    )
+    # Один файл без -wal: копию для замера можно брать обычным копированием
+    with sqlite3.connect(path) as conn:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return path
+
+
+# ==================== ЗАМЕРЫ (дочерний процесс) ====================
+
+def measure(client, call, iterations: int, warmup: int = 3, budget: int = None, name: str = '') -> dict:
+    """
+    Вызвать call(client, n) warmup + iterations раз; call возвращает число строк
+
+    Первый прогрев выполняется под query_budget: в результат попадает число
+    SQL-запросов одного вызова и, если бюджет превышен, описание нарушения.
+    """
+    from database import QueryBudgetExceeded, query_budget
+
+    queries, budget_error = None, None
+    try:
+        with query_budget(budget if budget is not None else 10 ** 9, name) as scope:
+            call(client, 0)
+    except QueryBudgetExceeded as e:
+        budget_error = str(e)
+    queries = scope.count
+    for n in range(1, warmup):
+        call(client, n)
+    latencies = []
+    rows = 0
+    for n in range(warmup, warmup + iterations):
+        started = time.perf_counter()
+        rows += call(client, n)
+        latencies.append(time.perf_counter() - started)
+    result = summarize(latencies, rows)
+    result['queries'] = queries
+    if budget_error:
+        result['budget_error'] = budget_error
+    return result
+
+
+def response_rows(response) -> int:
+    """Строк в ответе: длина списка, списка donations или 1"""
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.path}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}")
+    if response.mimetype != 'application/json':
+        return response.get_data().count(b'\n')
+    data = response.get_json()
+    if isinstance(data, list):
+        return len(data)
+    if isinstance(data, dict) and isinstance(data.get('donations'), list):
+        return len(data['donations'])
+    return 1
+
+
+def run_child(size: int, iterations: int, result_file: str, skip: set):
+    """Замеры на уже подготовленной копии БД (SHELTER_DB_PATH выставлен родителем)"""
+    import app as app_module
+    import webhook_queue
+    from database import SessionLocal, Donation, Subscription
+
+    client = app_module.app.test_client()
+    db = SessionLocal()
+    sample = db.query(Donation.phone, Donation.provider_payment_id).filter(
+        Donation.phone.isnot(None), Donation.provider_payment_id.isnot(None)
+    ).limit(200).all()
+    db.close()
+    phones = [row[0] for row in sample]
+    payment_ids = [row[1] for row in sample]
+    now = datetime.utcnow()
+
+    def get(url):
+        return lambda c, n: response_rows(c.get(url))
+
+    def history(c, n):
+        return response_rows(c.get('/api/donations/history', query_string={'phone': phones[n % len(phones)]}))
+
+    def create(c, n):
+        return response_rows(c.post('/api/donations', json={
+            'amount': 500, 'purpose': 'food', 'full_name': 'Бенчмарк', 'phone': f'+7000{n:07d}'
+        }))
+
+    def webhook(c, n):
+        body = json.dumps({
+            'event': 'payment.succeeded',
+            'object': {'id': payment_ids[n % len(payment_ids)], 'status': 'succeeded'}
+        }).encode()
+        response = c.post('/api/yoomoney/webhook', data=body, content_type='application/json')
+        return response_rows(response)
+
+    def send_code(c, n):
+        return response_rows(c.post('/api/auth/send-code', json={'phone': f'+7001{n:07d}'}))
+
+    endpoints = {
+        'list': (get('/api/admin/donations?limit=50'), iterations),
+        'list_1000': (get('/api/admin/donations?limit=1000'), iterations),
+        'list_filtered': (get('/api/admin/donations?limit=50&purpose=medical&status=succeeded'), iterations),
+        'monthly_stats': (get(f'/api/admin/donations/monthly-stats?year={now.year}&month={now.month}'), iterations),
+        'dashboard': (get('/api/admin/dashboard'), iterations),
+        'history': (history, iterations),
+        'subscriptions': (get('/api/subscriptions'), iterations),
+        'export_csv': (get('/api/admin/donations/export?format=csv'), max(3, iterations // 10)),
+        'create': (create, iterations),
+        'webhook': (webhook, iterations),
+        'send_code': (send_code, iterations),
+    }
+
+    results = {}
+    for name, (call, count) in endpoints.items():
+        if name in skip:
+            continue
+        results[name] = measure(client, call, count, budget=QUERY_BUDGETS.get(name), name=name)
+
+    if 'verify_code' not in skip:
+        # Сессию создает send-code, в замер входит только verify-code
+        latencies = []
+        for n in range(iterations):
+            session_id = client.post('/api/auth/send-code', json={'phone': f'+7002{n:07d}'}).get_json()['session_id']
+            code = app_module.verification_sessions.get(session_id)['code']
+            started = time.perf_counter()
+            response_rows(client.post('/api/auth/verify-code', json={'session_id': session_id, 'code': code}))
+            latencies.append(time.perf_counter() - started)
+        results['verify_code'] = summarize(latencies, iterations)
+
+    if 'webhook_apply' not in skip:
+        # Применение накопленных webhook воркером одной пачкой
+        started = time.perf_counter()
+        applied = webhook_queue.run_once('bench', limit=10000)
+        results['webhook_apply'] = summarize([time.perf_counter() - started], applied)
+
+    if 'recurring' not in skip:
+        latencies, charged = [], 0
+        for _ in range(3):
+            db = SessionLocal()
+            due_ids = [row[0] for row in db.query(Subscription.id).filter(
+                Subscription.status == 'active', Subscription.claimed_by.is_(None)
+            ).order_by(Subscription.next_charge_at).limit(max(size // 100, 50))]
+            db.query(Subscription).filter(Subscription.id.in_(due_ids)).update(
+                {Subscription.next_charge_at: datetime.utcnow() - timedelta(hours=1)}, synchronize_session=False
+            )
+            db.commit()
+            db.close()
+            started = time.perf_counter()
+            result = app_module.process_recurring_charges() or {}
+            latencies.append(time.perf_counter() - started)
+            charged += result.get('charged', 0)
+        results['recurring'] = summarize(latencies, charged)
+
+    with open(result_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f)
+
+
+def run_size(db_path: str, size: int, iterations: int, skip: set, response_cache: bool = False) -> dict:
+    """Скопировать набор во временную папку и выполнить замеры дочерним процессом"""
+    with tempfile.TemporaryDirectory(prefix='shelter-bench-') as tmp:
+        work_db = os.path.join(tmp, 'shelter.db')
+        shutil.copyfile(db_path, work_db)
+        result_file = os.path.join(tmp, 'result.json')
+        env = dict(
+            os.environ,
+            SHELTER_DB_PATH=work_db,
+            SESSION_DB_PATH=os.path.join(tmp, 'sessions.db'),
+            RATE_LIMIT_ENABLED='0',
+            PAYMENT_WORKERS='0',
+            WEBHOOK_WORKERS='0',
+            SHELTER_DB_MAINTENANCE_INTERVAL='0',
+            # Повторные вызовы с теми же параметрами иначе мерили бы попадания в кэш, а не запросы к БД
+            RESPONSE_CACHE_ENABLED='1' if response_cache else '0',
+            YOOMONEY_SHOP_ID='',
+            YOOMONEY_SECRET_KEY='',
+            YOOMONEY_WEBHOOK_SECRET='',
+        )
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', str(size),
+             '--iterations', str(iterations), '--result-file', result_file, '--skip', ','.join(sorted(skip))],
+            env=env, cwd=BACKEND_DIR, check=True, stdout=subprocess.DEVNULL
+        )
+        with open(result_file, encoding='utf-8') as f:
+            return json.load(f)
+
+
+# ==================== СРАВНЕНИЕ С БАЗОВОЙ ЛИНИЕЙ ====================
+
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """Список регрессий: (размер, замер, базовый p50, текущий p50)"""
+    regressions = []
+    for size, endpoints in results.get('results', {}).items():
+        base_endpoints = baseline.get('results', {}).get(size, {})
+        for name, current in endpoints.items():
+            base = base_endpoints.get(name)
+            if not base or min(base['calls'], current['calls']) < MIN_CALLS:
+                continue
+            if (current['p50_ms'] > base['p50_ms'] * threshold
+                    and current['p50_ms'] - base['p50_ms'] > MIN_REGRESSION_MS):
+                regressions.append((size, name, base['p50_ms'], current['p50_ms']))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Бенчмарк эндпоинтов API "Дом Лап"')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='размеры наборов через запятую')
+    parser.add_argument('--iterations', type=int, default=50, help='вызовов каждого эндпоинта')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='папка для сгенерированных БД')
+    parser.add_argument('--rebuild', action='store_true', help='сгенерировать наборы заново')
+    parser.add_argument('--out', default='benchmark_results.json', help='файл результатов')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='файл базовой линии')
+    parser.add_argument('--save-baseline', action='store_true', help='записать результаты как базовую линию')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='допустимый рост p50 (раз)')
+    parser.add_argument('--skip', default='', help='замеры, которые пропустить (через запятую)')
+    parser.add_argument('--response-cache', action='store_true', help='замерять с включенным кэшем ответов')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    skip = {name for name in args.skip.split(',') if name}
+
+    if args.child:
+        run_child(args.child, args.iterations, args.result_file, skip)
+        return 0
+
+    report = {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'iterations': args.iterations,
+        'results': {},
+    }
+    for size in [int(value) for value in args.sizes.split(',') if value]:
+        db_path = build_dataset(args.data_dir, size, args.rebuild)
+        print(f"[INFO] Замеры на {size:,} донатов")
+        report['results'][str(size)] = run_size(db_path, size, args.iterations, skip, args.response_cache)
+        for name, stats in report['results'][str(size)].items():
+            queries = f"{stats['queries']:>4} SQL" if stats.get('queries') is not None else ''
+            print(f"  {name:16s} p50 {stats['p50_ms']:>9} ms  p99 {stats['p99_ms']:>9} ms  "
+                  f"{stats['rows_per_sec']:>12} строк/с  {queries}")
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[OK] Результаты: {args.out}")
+
+    # Превышение бюджета SQL-запросов - ошибка независимо от базовой линии
+    over_budget = [
+        (size, name, stats['budget_error'])
+        for size, endpoints in report['results'].items()
+        for name, stats in endpoints.items() if stats.get('budget_error')
+    ]
+    for size, name, error in over_budget:
+        print(f"[ERROR] Бюджет запросов {name} на {int(size):,} донатов: {error}")
+    if over_budget:
+        return 1
+
+    if args.save_baseline:
+        shutil.copyfile(args.out, args.baseline)
+        print(f"[OK] Базовая линия обновлена: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"[INFO] Базовой линии нет ({args.baseline}), сравнение пропущено. Создать: --save-baseline")
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.threshold)
+    if not regressions:
+        print(f"[OK] Регрессий нет (порог x{args.threshold})")
+        return 0
+    for size, name, before, after in regressions:
+        print(f"[WARNING] Регрессия {name} на {int(size):,} донатов: p50 {before} -> {after} ms")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
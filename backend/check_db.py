@@ -51,9 +51,12 @@ def check_database():
         if users_count > 0:
             print(f"\n[ПОЛЬЗОВАТЕЛИ]")
             users = db.query(User).limit(10).all()
+            # Донаты всех показанных пользователей - одним GROUP BY, а не запросом на пользователя
+            donations_by_user = dict(db.query(Donation.user_id, func.count(Donation.id)).filter(
+                Donation.user_id.in_([u.id for u in users])
+            ).group_by(Donation.user_id).all())
             for u in users:
-                donations_by_user = db.query(Donation).filter(Donation.user_id == u.id).count()
-                print(f"  ID: {u.id:3d} | {u.phone:20s} | {u.full_name or 'N/A':30s} | Донатов: {donations_by_user}")
+                print(f"  ID: {u.id:3d} | {u.phone:20s} | {u.full_name or 'N/A':30s} | Донатов: {donations_by_user.get(u.id, 0)}")
         
         # Проверяем на фейковые данные
         print(f"\n[ПРОВЕРКА НА ФЕЙКОВЫЕ ДАННЫЕ]")
@@ -4,19 +4,83 @@
 База данных для приюта "Дом Лап"
 Использует SQLite для простоты развертывания
 """
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Numeric, Text
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Numeric, Text, Index, UniqueConstraint, func, text, event, inspect, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, column_property
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime
 import os
+import random
+import re
+import sys
+import threading
+import time
+import traceback
 
 Base = declarative_base()
 
-# Путь к БД - в папке backend
-DB_PATH = os.path.join(os.path.dirname(__file__), 'shelter.db')
+# Путь к БД - в папке backend (можно переопределить через SHELTER_DB_PATH)
+DB_PATH = os.getenv('SHELTER_DB_PATH', os.path.join(os.path.dirname(__file__), 'shelter.db'))
+
+# Настройки SQLite, применяются к каждому соединению (см. _configure_sqlite_connection).
+# WAL позволяет читать параллельно с записью, busy_timeout - ждать блокировку,
+# а не сразу падать с "database is locked".
+SQLITE_JOURNAL_MODE = os.getenv('SHELTER_SQLITE_JOURNAL_MODE', 'WAL').upper()
+SQLITE_SYNCHRONOUS = os.getenv('SHELTER_SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SHELTER_SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_MMAP_SIZE = int(os.getenv('SHELTER_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # байты, 0 - отключить
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SHELTER_SQLITE_CACHE_SIZE_KB', str(64 * 1024)))  # кэш страниц на соединение
+SQLITE_TEMP_STORE = os.getenv('SHELTER_SQLITE_TEMP_STORE', 'MEMORY').upper()
+
+# Обслуживание БД: PRAGMA optimize и checkpoint журнала WAL
+DB_MAINTENANCE_INTERVAL = int(os.getenv('SHELTER_DB_MAINTENANCE_INTERVAL', '3600'))  # секунды, 0 - отключить
+SQLITE_CHECKPOINT_MODE = os.getenv('SHELTER_SQLITE_CHECKPOINT_MODE', 'PASSIVE').upper()
+
+# Диагностика запросов (см. query_scope): лог медленных запросов с EXPLAIN QUERY PLAN
+# и поиск одинаковых запросов в цикле (N+1). По умолчанию выключена.
+DB_DIAGNOSTICS = os.getenv('SHELTER_DB_DIAGNOSTICS', '0') == '1'
+DB_SLOW_QUERY_MS = float(os.getenv('SHELTER_DB_SLOW_QUERY_MS', '100'))
+DB_REPEAT_THRESHOLD = int(os.getenv('SHELTER_DB_REPEAT_THRESHOLD', '10'))  # повторов одного запроса в scope
+
+_ALLOWED_PRAGMA_VALUES = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+    'temp_store': {'DEFAULT', 'FILE', 'MEMORY'},
+    'checkpoint_mode': {'PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'},
+}
+for _name, _value in (('journal_mode', SQLITE_JOURNAL_MODE), ('synchronous', SQLITE_SYNCHRONOUS),
+                      ('temp_store', SQLITE_TEMP_STORE), ('checkpoint_mode', SQLITE_CHECKPOINT_MODE)):
+    if _value not in _ALLOWED_PRAGMA_VALUES[_name]:
+        raise ValueError(f"Недопустимое значение {_name} для SQLite: {_value}")
 
 # Создание движка БД
-engine = create_engine(f'sqlite:///{DB_PATH}', echo=False)
+engine = create_engine(
+    f'sqlite:///{DB_PATH}',
+    echo=False,
+    connect_args={
+        'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000,
+        # Соединения из пула используют разные потоки Flask и фоновых воркеров
+        'check_same_thread': False,
+    }
+)
+
+
+@event.listens_for(engine, 'connect')
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """Выставить PRAGMA для каждого нового соединения"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f'PRAGMA journal_mode={SQLITE_JOURNAL_MODE}')
+        cursor.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+        cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+        cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+        cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+        cursor.execute(f'PRAGMA temp_store={SQLITE_TEMP_STORE}')
+    finally:
+        cursor.close()
+
 
 # Фабрика сессий
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -65,21 +129,48 @@ class Donation(Base):
     public_name = Column(String(255), nullable=False)  # ФИО или "Анонимно"
     phone = Column(String(20), nullable=True)
     email = Column(String(255), nullable=True)
-    amount = Column(Numeric(10, 2), nullable=False)
-    purpose = Column(String(100), nullable=False)  # food, medical, maintenance, general (назначение пожертвования)
+    # Поля, от которых зависит сводка donation_daily_stats, помечены active_history:
+    # при изменении SQLAlchemy сохраняет старое значение, даже если объект был expired
+    amount = column_property(Column(Numeric(10, 2), nullable=False), active_history=True)
+    purpose = column_property(Column(String(100), nullable=False), active_history=True)  # food, medical, maintenance, general (назначение пожертвования)
     is_recurring = Column(Boolean, default=False)
     subscription_id = Column(Integer, ForeignKey('subscriptions.id'), nullable=True)
     
     # Платежная информация
     provider = Column(String(50), nullable=False, default='yoomoney')
     provider_payment_id = Column(String(255), nullable=True, index=True)  # ID платежа в YooMoney
-    status = Column(String(50), nullable=False, default='pending')  # pending, succeeded, canceled, failed (статус платежа)
-    paid_at = Column(DateTime, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    status = column_property(Column(String(50), nullable=False, default='pending'), active_history=True)  # pending, succeeded, canceled, failed (статус платежа)
+    paid_at = column_property(Column(DateTime, nullable=True), active_history=True)
+    created_at = column_property(Column(DateTime, default=datetime.utcnow), active_history=True)
     
     # Связи
     user = relationship("User", back_populates="donations")
     subscription = relationship("Subscription", back_populates="donations")
+    
+    __table_args__ = (
+        # Ключ keyset-пагинации списка донатов: ORDER BY created_at DESC, id DESC
+        Index('ix_donations_created_at_id', 'created_at', 'id'),
+        # История донатов одного пользователя: поиск по user_id, телефону или email
+        # сразу в порядке выдачи (created_at, id)
+        Index('ix_donations_user_id_created_at', 'user_id', 'created_at', 'id'),
+        Index('ix_donations_phone_created_at', 'phone', 'created_at', 'id'),
+        Index('ix_donations_email_created_at', 'email', 'created_at', 'id'),
+    )
+
+
+def donation_effective_date():
+    """
+    Дата, на которую учитывается донат в статистике: paid_at, если он есть, иначе created_at
+    
+    Выражение должно совпадать с выражением индекса ix_donations_effective_date,
+    иначе SQLite не сможет использовать индекс.
+    """
+    return func.coalesce(Donation.paid_at, Donation.created_at)
+
+
+# Индекс по выражению для статистики по дням: диапазон месяца выбирается по индексу,
+# а status и amount берутся прямо из индекса без обращения к таблице
+Index('ix_donations_effective_date', donation_effective_date(), Donation.status, Donation.amount)
 
 
 class Subscription(Base):
@@ -97,19 +188,470 @@ class Subscription(Base):
     last_charge_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     canceled_at = Column(DateTime, nullable=True)
+    # Аренда подписки обработчиком списаний (recurring_charges.py): пока она не истекла,
+    # другой процесс или поток эту подписку не возьмет
+    claimed_by = Column(String(100), nullable=True)
+    claim_expires_at = Column(DateTime, nullable=True)
     
     # Связи
     user = relationship("User", back_populates="subscriptions")
     payment_method = relationship("PaymentMethod", back_populates="subscriptions")
     donations = relationship("Donation", back_populates="subscription")
+    
+    __table_args__ = (
+        # Подсчет активных подписок и выбор подписок к списанию
+        Index('ix_subscriptions_status_next_charge_at', 'status', 'next_charge_at'),
+    )
+
+
+class DonationDailyStat(Base):
+    """
+    Сводка донатов по дням (день, назначение, статус)
+    
+    День - дата paid_at, а если его нет - created_at. Таблица поддерживается
+    инкрементально при каждом flush сессии (см. _track_donation_daily_stats),
+    пересобрать и сверить ее с donations можно командой donation_stats.py.
+    """
+    __tablename__ = 'donation_daily_stats'
+    
+    day = Column(Date, primary_key=True)
+    purpose = Column(String(100), primary_key=True)
+    status = Column(String(50), primary_key=True)
+    donations_count = Column(Integer, nullable=False, default=0)
+    amount_kopecks = Column(Integer, nullable=False, default=0)  # Сумма в копейках, чтобы не копить ошибку округления
+
+
+class DataVersion(Base):
+    """
+    Версии данных для сброса кэша ответов (см. response_cache.py)
+
+    Версия увеличивается в той же транзакции, что и запись, поэтому ее видят
+    все процессы (API, воркер регулярных списаний). Имена версий:
+    donations, subscriptions и donations:ГГГГ-ММ - итоги донатов за месяц.
+    """
+    __tablename__ = 'data_versions'
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class PaymentIntent(Base):
+    """
+    Задание на создание платежа у провайдера (transactional outbox)
+
+    Пишется в одной транзакции с донатом; платеж у провайдера создают
+    воркеры payment_outbox.py, забирая задания с арендой (claimed_by, claim_expires_at).
+    """
+    __tablename__ = 'payment_intents'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    donation_id = Column(Integer, ForeignKey('donations.id'), nullable=False, unique=True)
+    status = Column(String(20), nullable=False, default='queued')  # queued, processing, created, failed
+    amount = Column(Numeric(10, 2), nullable=False)
+    description = Column(String(255), nullable=False)
+    return_url = Column(String(500), nullable=False)
+    payment_method = Column(String(20), nullable=False, default='card')
+    metadata_json = Column(Text, nullable=False, default='{}')  # metadata платежа в JSON
+    idempotence_key = Column(String(64), nullable=False)  # Повторный запрос к провайдеру не создаст второй платеж
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    claimed_by = Column(String(100), nullable=True)
+    claim_expires_at = Column(DateTime, nullable=True)
+    confirmation_url = Column(String(1000), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    # Связи
+    donation = relationship("Donation")
+
+    __table_args__ = (
+        # Выбор заданий воркерами: очередь по статусу и времени следующей попытки
+        Index('ix_payment_intents_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+
+class WebhookEvent(Base):
+    """
+    Входящие события webhook YooMoney (очередь на обработку)
+
+    Эндпоинт webhook только проверяет подпись и записывает событие; применяют
+    события пачками воркеры webhook_queue.py. Повторная доставка того же
+    события (payment_id, event_type) не создает второй строки.
+    """
+    __tablename__ = 'webhook_events'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    payment_id = Column(String(255), nullable=False)
+    event_type = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)  # Тело запроса как пришло
+    status = Column(String(20), nullable=False, default='queued')  # queued, processing, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    claimed_by = Column(String(100), nullable=True)
+    claim_expires_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint('payment_id', 'event_type', name='uq_webhook_events_payment_event'),
+        # Выбор событий воркерами: очередь по статусу и времени следующей попытки
+        Index('ix_webhook_events_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+
+# ==================== ПОЛЬЗОВАТЕЛИ ====================
+
+# Строк в одном INSERT пакетного upsert пользователей (4 параметра на строку,
+# лимит SQLite - 32766 параметров на запрос)
+USER_UPSERT_BATCH = 2000
+
+
+def user_upsert_statement(rows: list):
+    """
+    INSERT ... ON CONFLICT(phone) DO UPDATE для пользователей (строки: phone, email, full_name)
+    
+    Пустые email и full_name не затирают сохраненные. Существующая строка
+    перезаписывается, только если email или имя действительно меняются; для
+    пользователя без изменений RETURNING строку не вернет - ее id читается отдельно.
+    """
+    table = User.__table__
+    stmt = sqlite_insert(User).values(rows)
+    email = func.coalesce(func.nullif(stmt.excluded.email, ''), table.c.email)
+    full_name = func.coalesce(func.nullif(stmt.excluded.full_name, ''), table.c.full_name)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.phone],
+        set_={'email': email, 'full_name': full_name},
+        where=or_(table.c.email.is_distinct_from(email), table.c.full_name.is_distinct_from(full_name))
+    )
+
+
+def resolve_user_ids(connection, users) -> dict:
+    """
+    Телефоны -> id пользователей: недостающие создаются, изменившиеся обновляются
+    
+    users - кортежи (телефон, email, имя); для повторяющегося телефона берутся
+    последние непустые email и имя. На каждые USER_UPSERT_BATCH телефонов - один
+    INSERT ... RETURNING и, если есть пользователи без изменений, один SELECT.
+    Коммит делает вызывающий код.
+    """
+    merged = {}
+    for phone, email, full_name in users:
+        if not phone:
+            continue
+        row = merged.setdefault(phone, {'phone': phone, 'email': None, 'full_name': None})
+        if email:
+            row['email'] = email
+        if full_name:
+            row['full_name'] = full_name
+    
+    table = User.__table__
+    rows = list(merged.values())
+    ids = {}
+    for start in range(0, len(rows), USER_UPSERT_BATCH):
+        batch = rows[start:start + USER_UPSERT_BATCH]
+        ids.update(connection.execute(user_upsert_statement(batch).returning(table.c.phone, table.c.id)).all())
+        unchanged = [row['phone'] for row in batch if row['phone'] not in ids]
+        if unchanged:
+            ids.update(connection.execute(
+                select(table.c.phone, table.c.id).where(table.c.phone.in_(unchanged))
+            ).all())
+    return ids
+
+
+def existing_donation_ids(connection, ids) -> set:
+    """Какие из id донатов уже есть в БД (для повторного запуска миграции) - запрос на пачку"""
+    ids = [donation_id for donation_id in ids if donation_id is not None]
+    table = Donation.__table__
+    found = set()
+    for start in range(0, len(ids), USER_UPSERT_BATCH):
+        found.update(connection.execute(
+            select(table.c.id).where(table.c.id.in_(ids[start:start + USER_UPSERT_BATCH]))
+        ).scalars())
+    return found
+
+
+# ==================== СВОДКА ДОНАТОВ ПО ДНЯМ ====================
+
+def donation_stat_key(status, purpose, paid_at, created_at):
+    """Ключ строки donation_daily_stats для доната или None, если у доната нет даты"""
+    donation_date = paid_at or created_at
+    if donation_date is None:
+        return None
+    return (donation_date.date(), purpose, status)
+
+
+def to_kopecks(amount) -> int:
+    """Перевести сумму в рублях в целые копейки"""
+    return int(round(float(amount or 0) * 100))
+
+
+def apply_donation_stat_deltas(connection, deltas: dict):
+    """
+    Применить изменения к donation_daily_stats одним UPSERT
+    
+    deltas: {(day, purpose, status): [изменение количества, изменение суммы в копейках]}
+    Используется слушателем flush и массовыми вставками в обход ORM.
+    """
+    rows = [
+        {'day': day, 'purpose': purpose, 'status': status,
+         'donations_count': count, 'amount_kopecks': kopecks}
+        for (day, purpose, status), (count, kopecks) in deltas.items()
+        if count or kopecks
+    ]
+    if not rows:
+        return
+    table = DonationDailyStat.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.purpose, table.c.status],
+        set_={
+            'donations_count': table.c.donations_count + stmt.excluded.donations_count,
+            'amount_kopecks': table.c.amount_kopecks + stmt.excluded.amount_kopecks,
+        }
+    )
+    connection.execute(stmt, rows)
+
+
+def new_donations_stat_deltas(rows) -> dict:
+    """
+    Изменения сводки для новых донатов, вставленных в обход ORM
+
+    rows - словари с полями status, purpose, amount, paid_at, created_at
+    (дата обязательна: значения по умолчанию колонок сюда не попадают).
+    """
+    deltas = {}
+    for row in rows:
+        key = donation_stat_key(row['status'], row['purpose'], row.get('paid_at'), row.get('created_at'))
+        _add_delta(deltas, key, 1, to_kopecks(row['amount']))
+    return deltas
+
+
+def _add_delta(deltas: dict, key, count: int, kopecks: int):
+    """Накопить изменение строки сводки"""
+    if key is None:
+        return
+    entry = deltas.setdefault(key, [0, 0])
+    entry[0] += count
+    entry[1] += kopecks
+
+
+def _old_value(state, name):
+    """Значение атрибута до изменений в текущем flush"""
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return state.attrs[name].value
+
+
+# Агрегат сводки по исходной таблице: тот же ключ и то же округление до копеек,
+# что и при инкрементальном обновлении
+RAW_DAILY_STATS_SQL = """
+    SELECT date(coalesce(paid_at, created_at)) AS day,
+           purpose,
+           status,
+           count(*) AS donations_count,
+           sum(CAST(round(amount * 100) AS INTEGER)) AS amount_kopecks
+    FROM donations
+    WHERE coalesce(paid_at, created_at) IS NOT NULL
+    GROUP BY 1, 2, 3
+"""
+
+
+def rebuild_donation_daily_stats(connection) -> int:
+    """Пересобрать donation_daily_stats с нуля. Возвращает количество строк сводки"""
+    months_sql = text("SELECT DISTINCT substr(day, 1, 7) FROM donation_daily_stats")
+    months = {row[0] for row in connection.execute(months_sql)}
+    connection.execute(text("DELETE FROM donation_daily_stats"))
+    result = connection.execute(text(
+        "INSERT INTO donation_daily_stats (day, purpose, status, donations_count, amount_kopecks) "
+        + RAW_DAILY_STATS_SQL
+    ))
+    rows = result.rowcount
+    # Сводка могла измениться за любой месяц - и прежний, и новый
+    months |= {row[0] for row in connection.execute(months_sql)}
+    bump_data_versions(connection, {'donations', *(f'donations:{month}' for month in months)})
+    return rows
+
+
+# ==================== ВЕРСИИ ДАННЫХ ====================
+
+# Эпоха БД: случайное число, записывается один раз при создании data_versions.
+# Входит в ETag, чтобы версии пересозданной БД не совпали со старыми
+DATA_EPOCH = 'epoch'
+
+
+def month_version(year: int, month: int) -> str:
+    """Имя версии итогов донатов за месяц"""
+    return f'donations:{year:04d}-{month:02d}'
+
+
+def donation_stat_versions(deltas: dict) -> set:
+    """Версии месяцев, итоги которых меняет набор изменений сводки"""
+    return {
+        month_version(day.year, day.month)
+        for (day, purpose, status), (count, kopecks) in deltas.items()
+        if count or kopecks
+    }
+
+
+def bump_data_versions(connection, names):
+    """Увеличить версии данных одним UPSERT в текущей транзакции"""
+    names = sorted(set(names))
+    if not names:
+        return
+    table = DataVersion.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={'version': table.c.version + 1}
+    )
+    connection.execute(stmt, [{'name': name, 'version': 1} for name in names])
+
+
+def read_data_versions(connection, names) -> tuple:
+    """Текущие версии данных (отсутствующая версия - 0) в порядке names"""
+    table = DataVersion.__table__
+    found = dict(connection.execute(
+        table.select().with_only_columns(table.c.name, table.c.version).where(table.c.name.in_(list(names)))
+    ).all())
+    return tuple(found.get(name, 0) for name in names)
+
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _track_donation_daily_stats(session, flush_context):
+    """
+    Поддерживать donation_daily_stats в той же транзакции, что и изменения донатов
+    
+    Срабатывает для всех путей записи через ORM: создание доната, webhook,
+    регулярные списания, миграция из JSON. Здесь же увеличиваются версии
+    данных для сброса кэша ответов.
+    """
+    versions = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Donation):
+            versions.add('donations')
+        elif isinstance(obj, Subscription):
+            versions.add('subscriptions')
+    if not versions:
+        return
+    
+    deltas = {}
+    for obj in session.new:
+        if isinstance(obj, Donation):
+            key = donation_stat_key(obj.status, obj.purpose, obj.paid_at, obj.created_at)
+            _add_delta(deltas, key, 1, to_kopecks(obj.amount))
+    
+    for obj in session.dirty:
+        if not isinstance(obj, Donation):
+            continue
+        state = inspect(obj)
+        tracked = ('status', 'purpose', 'paid_at', 'created_at', 'amount')
+        if not any(state.attrs[name].history.has_changes() for name in tracked):
+            continue
+        old = {name: _old_value(state, name) for name in tracked}
+        _add_delta(deltas, donation_stat_key(old['status'], old['purpose'], old['paid_at'], old['created_at']),
+                   -1, -to_kopecks(old['amount']))
+        _add_delta(deltas, donation_stat_key(obj.status, obj.purpose, obj.paid_at, obj.created_at),
+                   1, to_kopecks(obj.amount))
+    
+    for obj in session.deleted:
+        if isinstance(obj, Donation):
+            state = inspect(obj)
+            key = donation_stat_key(_old_value(state, 'status'), _old_value(state, 'purpose'),
+                                    _old_value(state, 'paid_at'), _old_value(state, 'created_at'))
+            _add_delta(deltas, key, -1, -to_kopecks(_old_value(state, 'amount')))
+    
+    connection = session.connection()
+    apply_donation_stat_deltas(connection, deltas)
+    bump_data_versions(connection, versions | donation_stat_versions(deltas))
+
+
+@event.listens_for(SessionLocal, 'do_orm_execute')
+def _track_bulk_writes(orm_execute_state):
+    """
+    Поддерживать сводку и версии данных при массовых query.update() / query.delete()
+
+    Такие запросы идут в обход flush, и затронутые дни неизвестны: после
+    массовой записи в donations сводка donation_daily_stats пересобирается
+    целиком в той же транзакции (rebuild_donation_daily_stats увеличивает версии
+    всех ее месяцев). Массовая правка самой сводки только сбрасывает версии.
+    """
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete) or orm_execute_state.bind_mapper is None:
+        return
+    table_name = orm_execute_state.bind_mapper.local_table.name
+    connection = orm_execute_state.session.connection()
+    if table_name == 'donations':
+        result = orm_execute_state.invoke_statement()
+        rebuild_donation_daily_stats(connection)
+        return result
+    if table_name == 'donation_daily_stats':
+        bump_data_versions(connection, {'donations'})
+        connection.execute(text("UPDATE data_versions SET version = version + 1 WHERE name LIKE 'donations:%'"))
+    elif table_name == 'subscriptions':
+        bump_data_versions(connection, {'subscriptions'})
 
 
 def init_db():
     """Инициализация БД - создание всех таблиц"""
+    existing_tables = set(inspect(engine).get_table_names())
     Base.metadata.create_all(bind=engine)
+    ensure_columns()
+    ensure_indexes()
+    
+    # Сводка появилась в уже существующей БД - заполняем ее по накопленным донатам
+    if 'donations' in existing_tables and 'donation_daily_stats' not in existing_tables:
+        with engine.begin() as conn:
+            rebuild_donation_daily_stats(conn)
+    with engine.begin() as conn:
+        conn.execute(
+            sqlite_insert(DataVersion.__table__)
+            .values(name=DATA_EPOCH, version=random.randrange(1, 2 ** 31))
+            .on_conflict_do_nothing()
+        )
     print(f"[OK] База данных инициализирована: {DB_PATH}")
 
 
+def ensure_columns():
+    """
+    Добавить колонки, которых нет в уже существующих таблицах
+    
+    create_all() не изменяет существующие таблицы. Докатываются только
+    nullable-колонки без значения по умолчанию - для них хватает ALTER TABLE ADD COLUMN.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+                    print(f"[OK] Добавлена колонка {table.name}.{column.name}")
+
+
+def ensure_indexes():
+    """
+    Создать индексы, которых нет в уже существующей БД
+    
+    create_all() создает индексы только вместе с новыми таблицами,
+    поэтому индексы, добавленные в модели позже, докатываем отдельно.
+    Существующие индексы смотрим в sqlite_master: рефлексия SQLAlchemy
+    не видит индексы по выражениям.
+    """
+    with engine.begin() as conn:
+        existing = {
+            row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))
+        }
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=conn)
+
+
 def get_db():
     """Получить сессию БД (для использования в Flask)"""
     db = SessionLocal()
@@ -119,8 +661,260 @@ def get_db():
         db.close()
 
 
+def begin_immediate(db):
+    """
+    Открыть транзакцию сессии явным BEGIN IMMEDIATE
+
+    pysqlite сам выдает BEGIN только перед первым INSERT/UPDATE/DELETE. Если
+    первым оператором окажется SAVEPOINT (db.begin_nested()), он откроет
+    транзакцию сам, а его RELEASE ее закоммитит. IMMEDIATE заодно сразу берет
+    блокировку записи: пачка не упадет с SQLITE_BUSY при переходе от чтения к записи.
+    Завершается как обычно - db.commit() или db.rollback().
+    """
+    db.connection().exec_driver_sql('BEGIN IMMEDIATE')
+
+
+# ==================== ДИАГНОСТИКА ЗАПРОСОВ ====================
+
+class QueryBudgetExceeded(AssertionError):
+    """Запросов к БД больше, чем разрешено query_budget"""
+
+
+class QueryScope:
+    """Запросы одного HTTP-запроса или задания: количество и повторы одинаковых запросов"""
+
+    def __init__(self, name: str, repeat_threshold: int = None):
+        self.name = name
+        self.repeat_threshold = repeat_threshold or DB_REPEAT_THRESHOLD
+        self.count = 0
+        self.shapes = Counter()
+        self.call_sites = {}  # форма запроса -> место вызова (для повторов)
+
+    def record(self, statement: str) -> bool:
+        """Учесть запрос; True, если его форма только что достигла порога повторов"""
+        self.count += 1
+        shape = statement_shape(statement)
+        self.shapes[shape] += 1
+        if self.shapes[shape] == self.repeat_threshold:
+            self.call_sites[shape] = call_site()
+            return True
+        return False
+
+    def repeated(self) -> list:
+        """Формы запросов с числом повторов не меньше порога: (повторов, форма, место вызова)"""
+        return [
+            (count, shape, self.call_sites.get(shape, '?'))
+            for shape, count in self.shapes.most_common() if count >= self.repeat_threshold
+        ]
+
+
+_scopes = threading.local()
+_diagnostics_lock = threading.Lock()
+# Сколько scope/бюджетов сейчас используют события движка (0 - отписаны)
+_diagnostics_users = 0
+_IN_LIST_RE = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def statement_shape(statement: str) -> str:
+    """Форма запроса: без литералов-чисел, списки IN (?, ?, ...) свернуты"""
+    shape = _IN_LIST_RE.sub('(?...)', statement)
+    shape = _NUMBER_RE.sub('N', shape)
+    return _SPACE_RE.sub(' ', shape).strip()
+
+
+def call_site() -> str:
+    """Первая строка стека вне SQLAlchemy и этого модуля: кто выполнил запрос"""
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        path = frame.filename.replace('\\', '/')
+        if ('/sqlalchemy/' in path or path.startswith('<') or '/contextlib.py' in path
+                or path == __file__.replace('\\', '/')):
+            continue
+        return f'{os.path.basename(frame.filename)}:{frame.lineno} ({frame.name})'
+    return '?'
+
+
+def _scope_stack() -> list:
+    stack = getattr(_scopes, 'stack', None)
+    if stack is None:
+        stack = _scopes.stack = []
+    return stack
+
+
+def _diagnostics_listeners() -> tuple:
+    return (
+        ('before_cursor_execute', _before_cursor_execute),
+        ('after_cursor_execute', _after_cursor_execute),
+        ('handle_error', _handle_error),
+    )
+
+
+def _install_diagnostics():
+    """Подписаться на события движка; каждому вызову - парный _uninstall_diagnostics()"""
+    global _diagnostics_users
+    with _diagnostics_lock:
+        if _diagnostics_users == 0:
+            for name, listener in _diagnostics_listeners():
+                event.listen(engine, name, listener)
+        _diagnostics_users += 1
+
+
+def _uninstall_diagnostics():
+    """Отписаться от событий движка, когда их не использует ни один scope или бюджет"""
+    global _diagnostics_users
+    with _diagnostics_lock:
+        _diagnostics_users -= 1
+        if _diagnostics_users == 0:
+            for name, listener in _diagnostics_listeners():
+                event.remove(engine, name, listener)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('diagnostics_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Подписка могла появиться, пока запрос уже выполнялся: тогда времени начала нет
+    started = conn.info.get('diagnostics_started')
+    elapsed_ms = (time.perf_counter() - started.pop()) * 1000 if started else 0.0
+
+    for scope in _scope_stack():
+        if scope.record(statement) and DB_DIAGNOSTICS:
+            print(f"[DB] Повторяющийся запрос в {scope.name}: {scope.repeat_threshold}+ раз, "
+                  f"{scope.call_sites[statement_shape(statement)]}: {statement_shape(statement)[:200]}")
+
+    if DB_DIAGNOSTICS and elapsed_ms >= DB_SLOW_QUERY_MS:
+        print(f"[DB] Медленный запрос {elapsed_ms:.1f} мс, {call_site()}: {_SPACE_RE.sub(' ', statement)[:500]}")
+        for line in explain_query_plan(cursor.connection, statement, None if executemany else parameters):
+            print(f"[DB]   {line}")
+
+
+def _handle_error(context):
+    connection = context.connection
+    started = connection.info.get('diagnostics_started') if connection is not None else None
+    if started:
+        started.pop()
+
+
+def explain_query_plan(dbapi_connection, statement: str, parameters=None) -> list:
+    """Строки EXPLAIN QUERY PLAN для запроса (пустой список, если план получить нельзя)"""
+    if statement.lstrip().upper().startswith(('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')):
+        return []
+    try:
+        rows = dbapi_connection.execute(f'EXPLAIN QUERY PLAN {statement}', parameters or ()).fetchall()
+    except Exception:
+        return []
+    return [row[-1] for row in rows]
+
+
+@contextmanager
+def query_scope(name: str, repeat_threshold: int = None):
+    """
+    Учитывать запросы текущего потока как один HTTP-запрос или задание
+
+    В режиме диагностики (SHELTER_DB_DIAGNOSTICS=1) запрос одной формы,
+    выполненный repeat_threshold раз, попадает в лог с местом вызова (N+1).
+    Без диагностики scope ничего не стоит: события движка не подключаются.
+    """
+    if not DB_DIAGNOSTICS:
+        yield None
+        return
+    _install_diagnostics()
+    scope = QueryScope(name, repeat_threshold)
+    stack = _scope_stack()
+    stack.append(scope)
+    try:
+        yield scope
+    finally:
+        stack.remove(scope)
+        _uninstall_diagnostics()
+
+
+@contextmanager
+def query_budget(max_queries: int, name: str = 'query_budget'):
+    """
+    Проверка для тестов и бенчмарков: не больше max_queries запросов в блоке
+
+    Работает и без режима диагностики: события движка подключаются на время
+    блока и отключаются после него. Бросает QueryBudgetExceeded со списком
+    самых частых запросов и мест их вызова.
+    """
+    _install_diagnostics()
+    scope = QueryScope(name, repeat_threshold=2)
+    stack = _scope_stack()
+    stack.append(scope)
+    try:
+        yield scope
+    finally:
+        stack.remove(scope)
+        _uninstall_diagnostics()
+    if scope.count > max_queries:
+        details = '; '.join(
+            f'{count}x {site}: {shape[:120]}' for count, shape, site in scope.repeated()[:3]
+        )
+        raise QueryBudgetExceeded(
+            f"{name}: {scope.count} запросов к БД при бюджете {max_queries}" + (f" ({details})" if details else '')
+        )
+
+
+if DB_DIAGNOSTICS:
+    # Медленные запросы логируются и вне query_scope (фоновые воркеры, скрипты):
+    # подписка на весь процесс, парного _uninstall_diagnostics() нет
+    _install_diagnostics()
+
+
+# ==================== ОБСЛУЖИВАНИЕ БД ====================
+
+def optimize_database() -> dict:
+    """
+    Обслуживание SQLite: PRAGMA optimize (обновляет статистику планировщика)
+    и checkpoint журнала WAL, чтобы файл -wal не рос бесконечно
+    
+    Возвращает результат checkpoint: busy, страниц в журнале, перенесено страниц.
+    """
+    with engine.connect() as conn:
+        conn.exec_driver_sql('PRAGMA optimize')
+        busy, log_pages, checkpointed = conn.exec_driver_sql(
+            f'PRAGMA wal_checkpoint({SQLITE_CHECKPOINT_MODE})'
+        ).one()
+        conn.commit()
+    return {'busy': busy, 'log_pages': log_pages, 'checkpointed': checkpointed}
+
+
+_maintenance_stop = threading.Event()
+_maintenance_thread = None
+
+
+def start_db_maintenance(interval: int = DB_MAINTENANCE_INTERVAL):
+    """Запустить фоновое обслуживание БД раз в interval секунд (0 - не запускать)"""
+    global _maintenance_thread
+    if interval <= 0 or (_maintenance_thread and _maintenance_thread.is_alive()):
+        return
+    
+    def run():
+        while not _maintenance_stop.wait(interval):
+            try:
+                result = optimize_database()
+                print(f"[DB] optimize/checkpoint: {result}")
+            except Exception as e:
+                print(f"[ERROR] Обслуживание БД: {e}")
+    
+    _maintenance_stop.clear()
+    _maintenance_thread = threading.Thread(target=run, name='db-maintenance', daemon=True)
+    _maintenance_thread.start()
+
+
+def stop_db_maintenance():
+    """Остановить фоновое обслуживание БД"""
+    _maintenance_stop.set()
+
+
 if __name__ == '__main__':
-    # Создаем БД при прямом запуске
+    # Создаем БД при прямом запуске; "python database.py optimize" - разовое обслуживание
     init_db()
-    print("База данных создана успешно!")
+    if len(sys.argv) > 1 and sys.argv[1] == 'optimize':
+        print(f"[OK] Обслуживание выполнено: {optimize_database()}")
+    else:
+        print("База данных создана успешно!")
 
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Потоковая выгрузка донатов в CSV и XLSX
+
+Строки читаются из БД порциями и сразу отдаются клиенту, поэтому память
+не зависит от размера выгрузки. XLSX собирается вручную (zip + XML листа
+с inline-строками): zipfile пишет в непозиционируемый поток с data descriptor,
+и каждый сжатый кусок отдается клиенту, как только появился.
+"""
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+# Перевод назначений платежа - тот же, что в frontend/js/excel-export.js
+PURPOSE_RU = {
+    'food': 'Корм для животных',
+    'medical': 'Ветеринарное лечение',
+    'maintenance': 'Содержание приюта',
+    'general': 'Общие нужды'
+}
+
+STATUS_RU = {
+    'pending': 'В обработке',
+    'succeeded': 'Завершено',
+    'completed': 'Завершено',
+    'canceled': 'Отменено',
+    'failed': 'Ошибка'
+}
+
+EXPORT_HEADERS = ['Дата', 'Время', 'Сумма (₽)', 'Имя донора', 'Назначение', 'Статус', 'ID транзакции', 'Телефон', 'Email']
+
+# Сколько строк накапливать перед отправкой очередного куска ответа
+CHUNK_ROWS = 500
+
+# Символы, недопустимые в XML 1.0
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def export_row(row) -> list:
+    """
+    Строка выгрузки из кортежа (id, public_name, amount, purpose, status, paid_at, created_at, phone, email)
+    """
+    donation_id, public_name, amount, purpose, status, paid_at, created_at, phone, email = row
+    donation_date = paid_at or created_at
+    # Форматируем вручную: datetime.strftime заметно медленнее на миллионах строк
+    if donation_date:
+        date_text = f'{donation_date.day:02d}.{donation_date.month:02d}.{donation_date.year}'
+        time_text = f'{donation_date.hour:02d}:{donation_date.minute:02d}'
+    else:
+        date_text = time_text = ''
+    return [
+        date_text,
+        time_text,
+        float(amount or 0),
+        public_name or 'Анонимно',
+        PURPOSE_RU.get(purpose, purpose or 'Общие нужды'),
+        STATUS_RU.get(status, status or ''),
+        f'DON-{donation_id}',
+        phone or '',
+        email or ''
+    ]
+
+
+def iter_csv(rows):
+    """Сгенерировать CSV (UTF-8 с BOM, разделитель ';' - так его корректно открывает Excel)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_HEADERS)
+
+    pending = 0
+    for row in rows:
+        writer.writerow(export_row(row))
+        pending += 1
+        if pending >= CHUNK_ROWS:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    yield buffer.getvalue().encode('utf-8')
+
+
+# ==================== XLSX ====================
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Донаты" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+    '</styleSheet>'
+)
+
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+class _ChunkSink(io.RawIOBase):
+    """Непозиционируемый поток, куда zipfile пишет архив; накопленное забирается через drain()"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _xlsx_cell(value) -> str:
+    """XML ячейки: числа - как числа, остальное - inline-строкой"""
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    text = _XML_ILLEGAL.sub('', str(value))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _xlsx_row(values) -> str:
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def iter_xlsx(rows):
+    """Сгенерировать XLSX-файл кусками по мере чтения строк"""
+    sink = _ChunkSink()
+    # Минимальный уровень сжатия: выгрузка упирается в CPU, а не в сеть
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK)
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', _STYLES)
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            parts = [_SHEET_HEAD, _xlsx_row(EXPORT_HEADERS)]
+            for row in rows:
+                parts.append(_xlsx_row(export_row(row)))
+                if len(parts) >= CHUNK_ROWS:
+                    sheet.write(''.join(parts).encode('utf-8'))
+                    parts = []
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            parts.append(_SHEET_TAIL)
+            sheet.write(''.join(parts).encode('utf-8'))
+
+    yield sink.drain()
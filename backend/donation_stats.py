@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Обслуживание сводки донатов по дням (таблица donation_daily_stats)
+
+Сводка обновляется автоматически при каждом flush сессии (см. database.py).
+Этот скрипт нужен, чтобы пересобрать ее с нуля (например, после массовой
+вставки в обход ORM) и сверить с исходной таблицей donations.
+
+Запуск:
+    python donation_stats.py rebuild   # пересобрать сводку
+    python donation_stats.py verify    # сверить сводку с donations
+"""
+import sys
+from datetime import date
+
+from sqlalchemy import text, func
+
+from database import init_db, SessionLocal, DonationDailyStat, RAW_DAILY_STATS_SQL, rebuild_donation_daily_stats
+
+
+def rebuild_daily_stats(db) -> int:
+    """Пересобрать donation_daily_stats из donations. Возвращает количество строк сводки"""
+    rows = rebuild_donation_daily_stats(db.connection())
+    db.commit()
+    return rows
+
+
+def verify_daily_stats(db) -> list:
+    """
+    Сверить сводку с donations
+
+    Возвращает список расхождений: (day, purpose, status, ожидается, в сводке),
+    где значения - пары (количество, сумма в копейках). Строки сводки с нулями
+    (все донаты ушли в другой статус) расхождением не считаются.
+    """
+    expected = {
+        (row.day, row.purpose, row.status): (row.donations_count, row.amount_kopecks)
+        for row in db.execute(text(RAW_DAILY_STATS_SQL))
+    }
+    actual = {
+        (row.day.isoformat(), row.purpose, row.status): (row.donations_count, row.amount_kopecks)
+        for row in db.query(DonationDailyStat).all()
+    }
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        want = expected.get(key, (0, 0))
+        have = actual.get(key, (0, 0))
+        if want != have:
+            mismatches.append((*key, want, have))
+    return mismatches
+
+
+def daily_totals(db, start: date, end: date, statuses) -> dict:
+    """
+    Суммы донатов по дням из сводки за период [start, end)
+
+    Возвращает {day: (количество, сумма в рублях)}.
+    """
+    rows = db.query(
+        DonationDailyStat.day,
+        func.sum(DonationDailyStat.donations_count).label('donations_count'),
+        func.sum(DonationDailyStat.amount_kopecks).label('amount_kopecks')
+    ).filter(
+        DonationDailyStat.day >= start,
+        DonationDailyStat.day < end,
+        DonationDailyStat.status.in_(list(statuses))
+    ).group_by(DonationDailyStat.day).all()
+
+    return {row.day: (int(row.donations_count or 0), (row.amount_kopecks or 0) / 100) for row in rows}
+
+
+def main(argv) -> int:
+    """Точка входа командной строки"""
+    command = argv[1] if len(argv) > 1 else 'verify'
+    if command not in ('rebuild', 'verify'):
+        print(__doc__)
+        return 2
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if command == 'rebuild':
+            rows = rebuild_daily_stats(db)
+            print(f"[OK] Сводка пересобрана, строк: {rows}")
+
+        mismatches = verify_daily_stats(db)
+        if mismatches:
+            print(f"[ERROR] Расхождений со сводкой: {len(mismatches)}")
+            for day, purpose, status, want, have in mismatches[:20]:
+                print(f"  {day} | {purpose:12s} | {status:10s} | ожидается {want} | в сводке {have}")
+            return 1
+
+        print("[OK] Сводка совпадает с таблицей donations")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Лента изменений донатов и подписок для админки (Server-Sent Events)
+
+Пути записи (создание доната, webhook, отмена подписки, регулярное списание,
+сбой создания платежа) после коммита публикуют короткое событие в EventHub.
+GET /api/admin/events держит соединение и отдает события в формате SSE, так что
+открытая админка применяет изменения сама, а не перечитывает списки.
+
+Хаб живет в памяти процесса: последние EVENTS_BUFFER_SIZE событий хранятся
+в кольцевом буфере. Переподключившийся клиент присылает Last-Event-ID и получает
+пропущенные события из буфера. Если их там уже нет или процесс перезапущен
+(id другого потока), приходит событие reset - клиенту нужно перечитать данные целиком.
+События воркеров, запущенных отдельным процессом (python webhook_queue.py,
+python recurring_charges.py --worker), в этот хаб не попадают.
+
+Типы событий:
+    donation.created       {id, amount, purpose, status, public_name, phone, email, is_recurring, created_at}
+    donation.status        {id, status, amount, purpose, paid_at}
+    subscription.canceled  {id, user_id}
+    subscription.charged   {id, user_id, donation_id, amount, purpose}
+
+Настройки:
+    EVENTS_BUFFER_SIZE=1000         # событий для возобновления по Last-Event-ID
+    EVENTS_MAX_CLIENTS=100          # одновременных подключений (дальше - 503)
+    EVENTS_HEARTBEAT_SECONDS=15     # комментарий-пинг в простаивающем соединении
+"""
+import json
+import os
+import secrets
+import threading
+from collections import deque
+
+EVENTS_BUFFER_SIZE = int(os.getenv('EVENTS_BUFFER_SIZE', '1000'))
+EVENTS_MAX_CLIENTS = int(os.getenv('EVENTS_MAX_CLIENTS', '100'))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv('EVENTS_HEARTBEAT_SECONDS', '15'))
+# Через сколько миллисекунд браузер переподключается после обрыва
+EVENTS_RETRY_MS = 3000
+
+
+def format_event(event_type: str, event_id: str, payload: str) -> str:
+    """Одно событие в формате text/event-stream"""
+    return f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+
+
+class EventHub:
+    """Рассылка событий подключенным клиентам с буфером для возобновления"""
+
+    def __init__(self, buffer_size: int = EVENTS_BUFFER_SIZE, max_clients: int = EVENTS_MAX_CLIENTS):
+        self.max_clients = max_clients
+        # Поток событий этого процесса: id события - '<stream_id>-<номер>'
+        self.stream_id = secrets.token_hex(4)
+        # (номер, тип, JSON данных)
+        self._events = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._clients = 0
+        self._published = {}
+        self._condition = threading.Condition()
+
+    def event_id(self, seq: int) -> str:
+        return f'{self.stream_id}-{seq}'
+
+    def publish(self, event_type: str, data: dict) -> str:
+        """Опубликовать событие всем подключенным клиентам. Возвращает его id"""
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+        with self._condition:
+            self._seq += 1
+            self._events.append((self._seq, event_type, payload))
+            self._published[event_type] = self._published.get(event_type, 0) + 1
+            self._condition.notify_all()
+            return self.event_id(self._seq)
+
+    def acquire(self) -> bool:
+        """Занять место для нового клиента; False - достигнут EVENTS_MAX_CLIENTS"""
+        with self._condition:
+            if self._clients >= self.max_clients:
+                return False
+            self._clients += 1
+            return True
+
+    def release(self):
+        """Освободить место клиента (вызывается при закрытии ответа)"""
+        with self._condition:
+            self._clients = max(self._clients - 1, 0)
+
+    def _resume_position(self, last_event_id) -> tuple:
+        """
+        С какого номера продолжать для Last-Event-ID: (номер, нужен ли reset)
+
+        Без Last-Event-ID клиент получает только новые события. Чужой поток
+        (перезапуск процесса), номер из будущего или вытесненные из буфера
+        события - reset с текущей позиции.
+        """
+        with self._condition:
+            current = self._seq
+            oldest = self._events[0][0] if self._events else current + 1
+        if not last_event_id:
+            return current, False
+        stream_id, _, seq = str(last_event_id).rpartition('-')
+        if stream_id != self.stream_id or not seq.isdigit() or int(seq) > current:
+            return current, True
+        seq = int(seq)
+        if seq + 1 < oldest and seq < current:
+            return current, True
+        return seq, False
+
+    def wait_for(self, seq: int, timeout: float) -> tuple:
+        """
+        События с номером больше seq; ждет не дольше timeout секунд
+
+        Возвращает (события, пропуск): пропуск - клиент отстал больше чем на буфер.
+        """
+        with self._condition:
+            if self._seq == seq:
+                self._condition.wait(timeout)
+            if self._seq == seq:
+                return [], False
+            events = [event for event in self._events if event[0] > seq]
+            return events, not events or events[0][0] != seq + 1
+
+    def stream(self, last_event_id=None, heartbeat: float = EVENTS_HEARTBEAT_SECONDS):
+        """Генератор тела ответа text/event-stream (бесконечный, до отключения клиента)"""
+        seq, reset = self._resume_position(last_event_id)
+        yield f'retry: {EVENTS_RETRY_MS}\n\n'
+        if reset:
+            yield format_event('reset', self.event_id(seq), '{}')
+        while True:
+            events, gap = self.wait_for(seq, heartbeat)
+            if not events and not gap:
+                # Комментарий не дает прокси закрыть простаивающее соединение
+                yield ': ping\n\n'
+                continue
+            if gap:
+                with self._condition:
+                    seq = self._seq
+                yield format_event('reset', self.event_id(seq), '{}')
+                continue
+            yield ''.join(format_event(event_type, self.event_id(number), payload)
+                          for number, event_type, payload in events)
+            seq = events[-1][0]
+
+    def stats(self) -> dict:
+        """Подключенные клиенты, опубликованные события по типам, размер буфера"""
+        with self._condition:
+            return {
+                'clients': self._clients,
+                'published': dict(self._published),
+                'buffered': len(self._events),
+            }
+
+    def clear(self):
+        """Очистить буфер и счетчики (для тестов)"""
+        with self._condition:
+            self._events.clear()
+            self._published.clear()
+
+
+event_hub = EventHub()
+
+
+def iso(value):
+    """Дата события в ISO 8601, как в ответах API"""
+    return value.isoformat() if value else None
+
+
+def donation_created_event(donation) -> dict:
+    """Данные donation.created (после flush, до коммита)"""
+    return {
+        'id': donation.id,
+        'amount': float(donation.amount),
+        'purpose': donation.purpose,
+        'status': donation.status,
+        'public_name': donation.public_name,
+        'phone': donation.phone,
+        'email': donation.email,
+        'is_recurring': bool(donation.is_recurring),
+        'created_at': iso(donation.created_at),
+    }
+
+
+def donation_status_event(donation) -> dict:
+    """Данные donation.status; собираются до коммита, пока объект не истек"""
+    return {
+        'id': donation.id,
+        'status': donation.status,
+        'amount': float(donation.amount),
+        'purpose': donation.purpose,
+        'paid_at': iso(donation.paid_at),
+    }
+
+
+def publish_many(event_type: str, items):
+    """Опубликовать события одного типа (например, собранные для пачки до коммита)"""
+    for data in items:
+        event_hub.publish(event_type, data)
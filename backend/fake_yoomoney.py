@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальная заглушка API платежей YooMoney для тестов, бенчмарков и нагрузочных тестов
+
+Принимает POST /api/v3/payments, держит keep-alive соединения (HTTP/1.1),
+учитывает Idempotence-Key (повтор с тем же ключом возвращает тот же платеж)
+и умеет имитировать поведение провайдера:
+- задержку ответа: delay плюс случайная добавка до jitter секунд;
+- ошибки: failures_left следующих запросов или доля error_rate всех запросов;
+- webhook: после создания платежа через webhook_delay секунд на webhook_url
+  асинхронно уходит уведомление payment.succeeded (или payment.canceled с
+  вероятностью 1 - success_rate), подписанное HMAC-SHA256 (webhook_secret).
+  Неудачная доставка повторяется с паузой, как у настоящего провайдера;
+  доля duplicate_rate уведомлений доставляется дважды.
+
+Запуск:
+    python fake_yoomoney.py                       # порт 8099
+    python fake_yoomoney.py 8099 0.05             # порт и задержка ответа, секунды
+    python fake_yoomoney.py 8099 0.05 --jitter 0.2 --error-rate 0.02 \\
+        --webhook-url http://127.0.0.1:5000/api/yoomoney/webhook --webhook-delay 1
+
+Затем API можно направить на заглушку:
+    YOOMONEY_API_URL=http://127.0.0.1:8099/api/v3/payments YOOMONEY_SHOP_ID=test YOOMONEY_SECRET_KEY=test python app.py
+"""
+import argparse
+import hashlib
+import heapq
+import hmac
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Попыток доставки webhook и пауза между ними, секунды
+WEBHOOK_ATTEMPTS = 5
+WEBHOOK_RETRY_DELAY = 1.0
+
+
+class FakeYooMoney(ThreadingHTTPServer):
+    """Сервер-заглушка; параметры поведения можно менять на лету"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        delay: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        webhook_url: str = None,
+        webhook_delay: float = 0.0,
+        webhook_secret: str = '',
+        success_rate: float = 1.0,
+        duplicate_rate: float = 0.0,
+        webhook_workers: int = 4,
+        seed: int = None
+    ):
+        super().__init__((host, port), _Handler)
+        self.delay = delay          # Задержка каждого ответа, секунды
+        self.jitter = jitter        # Случайная добавка к задержке, до jitter секунд
+        self.error_rate = error_rate  # Доля запросов, завершаемых ошибкой failure_status
+        self.failures_left = 0      # Сколько следующих запросов завершить ошибкой
+        self.failure_status = 500
+        self.requests = []          # Idempotence-Key каждого запроса
+        self.connections = set()    # Адреса клиентов (порт = отдельное TCP-соединение)
+        self.payments = {}          # Idempotence-Key -> платеж
+
+        self.webhook_url = webhook_url
+        self.webhook_delay = webhook_delay
+        self.webhook_secret = webhook_secret
+        self.success_rate = success_rate
+        self.duplicate_rate = duplicate_rate
+        # Счетчики доставки webhook и задержки HTTP-запросов доставки, секунды
+        self.webhook_stats = {'scheduled': 0, 'delivered': 0, 'retried': 0, 'failed': 0}
+        self.webhook_latencies = []
+
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._webhooks = []          # Куча (время отправки, номер, тело, попытка)
+        self._webhook_seq = 0
+        self._webhooks_in_flight = 0
+        self._webhook_cond = threading.Condition(self._lock)
+        self._webhook_pool = ThreadPoolExecutor(webhook_workers, thread_name_prefix='fake-webhook')
+        self._webhook_local = threading.local()
+        self._stopping = False
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}/api/v3/payments'
+
+    def start(self) -> 'FakeYooMoney':
+        """Запустить сервер и отправку webhook в фоновых потоках"""
+        threading.Thread(target=self.serve_forever, args=(0.05,), name='fake-yoomoney', daemon=True).start()
+        threading.Thread(target=self._webhook_loop, name='fake-yoomoney-webhooks', daemon=True).start()
+        return self
+
+    def stop(self):
+        with self._webhook_cond:
+            self._stopping = True
+            self._webhook_cond.notify_all()
+        self.shutdown()
+        self.server_close()
+        self._webhook_pool.shutdown(wait=False, cancel_futures=True)
+
+    def handle_error(self, request, client_address):
+        # Клиент ушел по таймауту, не дождавшись медленного ответа, - это сценарий теста, а не ошибка
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    # ---------- поведение ответа ----------
+
+    def next_response(self) -> tuple:
+        """Задержка ответа и признак ошибки для очередного запроса"""
+        with self._lock:
+            fail = self.failures_left > 0
+            if fail:
+                self.failures_left -= 1
+            elif self.error_rate:
+                fail = self._random.random() < self.error_rate
+            delay = self.delay + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        return delay, fail
+
+    # ---------- webhook ----------
+
+    def schedule_webhook(self, payment: dict):
+        """Поставить уведомление об исходе платежа в очередь отправки"""
+        if not self.webhook_url:
+            return
+        with self._webhook_cond:
+            status = 'succeeded' if self._random.random() < self.success_rate else 'canceled'
+            copies = 2 if self.duplicate_rate and self._random.random() < self.duplicate_rate else 1
+            payment_object = dict(payment, status=status, paid=status == 'succeeded')
+            if status == 'succeeded':
+                payment_object['payment_method'] = {
+                    'type': 'bank_card',
+                    'id': f"pm-{payment['id']}",
+                    'saved': True,
+                    'card': {'last4': f"{self._random.randrange(10000):04d}"}
+                }
+            body = json.dumps(
+                {'type': 'notification', 'event': f'payment.{status}', 'object': payment_object},
+                ensure_ascii=False
+            ).encode('utf-8')
+            for copy in range(copies):
+                self._push_webhook(time.monotonic() + self.webhook_delay * (copy + 1), body, 1)
+            self.webhook_stats['scheduled'] += copies
+
+    def _push_webhook(self, due: float, body: bytes, attempt: int):
+        self._webhook_seq += 1
+        heapq.heappush(self._webhooks, (due, self._webhook_seq, body, attempt))
+        self._webhook_cond.notify()
+
+    def pending_webhooks(self) -> int:
+        """Уведомлений в очереди и в процессе отправки"""
+        with self._lock:
+            return len(self._webhooks) + self._webhooks_in_flight
+
+    def wait_webhooks(self, timeout: float) -> bool:
+        """Дождаться отправки всех уведомлений; False, если время вышло"""
+        deadline = time.monotonic() + timeout
+        while self.pending_webhooks():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _webhook_loop(self):
+        with self._webhook_cond:
+            while not self._stopping:
+                if not self._webhooks:
+                    self._webhook_cond.wait()
+                    continue
+                wait = self._webhooks[0][0] - time.monotonic()
+                if wait > 0:
+                    self._webhook_cond.wait(wait)
+                    continue
+                _, _, body, attempt = heapq.heappop(self._webhooks)
+                self._webhooks_in_flight += 1
+                self._webhook_pool.submit(self._deliver, body, attempt)
+
+    def _deliver(self, body: bytes, attempt: int):
+        session = getattr(self._webhook_local, 'session', None)
+        if session is None:
+            session = self._webhook_local.session = requests.Session()
+        headers = {'Content-Type': 'application/json'}
+        if self.webhook_secret:
+            headers['X-YooMoney-Signature'] = hmac.new(
+                self.webhook_secret.encode('utf-8'), body, hashlib.sha256
+            ).hexdigest()
+
+        started = time.perf_counter()
+        try:
+            delivered = session.post(self.webhook_url, data=body, headers=headers, timeout=10).status_code == 200
+        except requests.RequestException:
+            delivered = False
+        latency = time.perf_counter() - started
+
+        with self._webhook_cond:
+            self._webhooks_in_flight -= 1
+            self.webhook_latencies.append(latency)
+            if delivered:
+                self.webhook_stats['delivered'] += 1
+            elif attempt < WEBHOOK_ATTEMPTS and not self._stopping:
+                self.webhook_stats['retried'] += 1
+                self._push_webhook(time.monotonic() + WEBHOOK_RETRY_DELAY * attempt, body, attempt + 1)
+            else:
+                self.webhook_stats['failed'] += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True  # Иначе заголовки и тело уходят с задержкой delayed ACK
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        key = self.headers.get('Idempotence-Key') or uuid.uuid4().hex
+        with server._lock:
+            server.requests.append(key)
+            server.connections.add(self.client_address)
+
+        delay, fail = server.next_response()
+        if delay:
+            time.sleep(delay)
+
+        if fail:
+            self._reply(server.failure_status, {'type': 'error', 'code': 'internal_server_error'})
+            return
+
+        created = False
+        with server._lock:
+            payment = server.payments.get(key)
+            if payment is None:
+                payment_id = f'fake-{uuid.uuid4().hex[:16]}'
+                payment = {
+                    'id': payment_id,
+                    'status': 'pending',
+                    'amount': body.get('amount'),
+                    'description': body.get('description'),
+                    'metadata': body.get('metadata', {}),
+                    'confirmation': {
+                        'type': 'redirect',
+                        'confirmation_url': f'https://yoomoney.example/checkout/{payment_id}'
+                    }
+                }
+                server.payments[key] = payment
+                created = True
+        if created:
+            server.schedule_webhook(payment)
+        self._reply(200, payment)
+
+    def _reply(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Локальная заглушка API YooMoney')
+    parser.add_argument('port', nargs='?', type=int, default=8099)
+    parser.add_argument('delay', nargs='?', type=float, default=0.0, help='задержка ответа, секунды')
+    parser.add_argument('--jitter', type=float, default=0.0, help='случайная добавка к задержке, секунды')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 500 (0..1)')
+    parser.add_argument('--webhook-url', help='куда отправлять уведомления о платежах')
+    parser.add_argument('--webhook-delay', type=float, default=1.0, help='пауза перед уведомлением, секунды')
+    parser.add_argument('--webhook-secret', default='', help='секрет подписи (YOOMONEY_WEBHOOK_SECRET API)')
+    parser.add_argument('--success-rate', type=float, default=1.0, help='доля успешных платежей (0..1)')
+    parser.add_argument('--duplicate-rate', type=float, default=0.0, help='доля уведомлений, доставляемых дважды')
+    args = parser.parse_args(argv)
+
+    server = FakeYooMoney(
+        '127.0.0.1', args.port, args.delay,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        webhook_url=args.webhook_url,
+        webhook_delay=args.webhook_delay,
+        webhook_secret=args.webhook_secret,
+        success_rate=args.success_rate,
+        duplicate_rate=args.duplicate_rate
+    )
+    threading.Thread(target=server._webhook_loop, name='fake-yoomoney-webhooks', daemon=True).start()
+    print(f"[OK] Заглушка YooMoney: {server.url} (задержка {args.delay} с, ошибок {args.error_rate:.0%})")
+    if args.webhook_url:
+        print(f"[INFO] Webhook: {args.webhook_url} через {args.webhook_delay} с")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,15 +3,34 @@
 """
 Генератор тестовых данных для приюта "Дом Лап".
 Использует Faker для создания реалистичных тестовых данных.
+
+Два режима:
+- обычный - объекты создаются по одному через ORM (сотни строк, проверка валидации);
+- массовый (--bulk) - строки собираются в памяти по столбцам и пишутся пачками
+  через executemany в нескольких транзакциях; миллионы донатов для нагрузочных тестов.
+  Одинаковые --seed и параметры дают одинаковые данные при любом --workers.
+
+Запуск:
+    python generate_test_data.py                          # 50 польз., 200 донатов, 30 подписок, 40 карт
+    python generate_test_data.py 100 500 50 80
+    python generate_test_data.py --bulk 1000000 10000000 100000 150000 --seed 42 --workers 4
 """
+import argparse
+import itertools
+import multiprocessing
 import random
+import time
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 from faker import Faker
 from faker.providers import internet, phone_number, date_time
+from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
 
-from database import init_db, SessionLocal, User, Donation, Subscription, PaymentMethod
+from database import (
+    init_db, ensure_indexes, engine, SessionLocal, User, Donation, Subscription, PaymentMethod,
+    rebuild_donation_daily_stats, bump_data_versions
+)
 
 # Инициализация Faker с русской локалью
 fake = Faker('ru_RU')
@@ -241,55 +260,60 @@ def generate_subscription(db, user: User = None, payment_method: PaymentMethod =
     return subscription
 
 
+def count_orphans(db, model, foreign_key, parent, nullable: bool = False) -> int:
+    """Сколько строк model ссылаются на несуществующую строку parent (один LEFT JOIN)"""
+    query = db.query(func.count(model.id)).outerjoin(parent, foreign_key == parent.id).filter(parent.id.is_(None))
+    if nullable:
+        query = query.filter(foreign_key.isnot(None))
+    return query.scalar()
+
+
 def validate_database(db):
-    """Валидация данных в БД"""
+    """
+    Валидация данных в БД
+
+    Каждая проверка - один агрегирующий запрос, а не запрос на каждую строку:
+    на миллионах донатов проверка занимает секунды.
+    """
     errors = []
     warnings = []
     
     # Проверка пользователей
-    users = db.query(User).all()
-    if not users:
+    phones, distinct_phones = db.query(func.count(User.phone), func.count(func.distinct(User.phone))).one()
+    if not db.query(User.id).first():
         warnings.append("В БД нет пользователей")
-    else:
+    elif phones != distinct_phones:
         # Проверка уникальности телефонов
-        phones = [u.phone for u in users]
-        if len(phones) != len(set(phones)):
-            errors.append("Найдены дубликаты телефонов у пользователей")
+        errors.append("Найдены дубликаты телефонов у пользователей")
     
     # Проверка пожертвований
-    donations = db.query(Donation).all()
-    if not donations:
+    if not db.query(Donation.id).first():
         warnings.append("В БД нет пожертвований")
     else:
         # Проверка минимальной суммы
-        invalid_amounts = [d for d in donations if float(d.amount) < 100]
+        invalid_amounts = db.query(func.count(Donation.id)).filter(Donation.amount < 100).scalar()
         if invalid_amounts:
-            errors.append(f"Найдены пожертвования с суммой менее 100 руб: {len(invalid_amounts)}")
+            errors.append(f"Найдены пожертвования с суммой менее 100 руб: {invalid_amounts}")
         
         # Проверка связей с пользователями
-        orphan_donations = [d for d in donations if d.user_id and not db.query(User).filter(User.id == d.user_id).first()]
+        orphan_donations = count_orphans(db, Donation, Donation.user_id, User, nullable=True)
         if orphan_donations:
-            errors.append(f"Найдены пожертвования с несуществующими пользователями: {len(orphan_donations)}")
+            errors.append(f"Найдены пожертвования с несуществующими пользователями: {orphan_donations}")
     
     # Проверка подписок
-    subscriptions = db.query(Subscription).all()
-    if subscriptions:
-        # Проверка связей с пользователями
-        orphan_subs = [s for s in subscriptions if not db.query(User).filter(User.id == s.user_id).first()]
-        if orphan_subs:
-            errors.append(f"Найдены подписки с несуществующими пользователями: {len(orphan_subs)}")
-        
-        # Проверка способов оплаты
-        orphan_pm = [s for s in subscriptions if s.payment_method_id and not db.query(PaymentMethod).filter(PaymentMethod.id == s.payment_method_id).first()]
-        if orphan_pm:
-            errors.append(f"Найдены подписки с несуществующими способами оплаты: {len(orphan_pm)}")
+    orphan_subs = count_orphans(db, Subscription, Subscription.user_id, User)
+    if orphan_subs:
+        errors.append(f"Найдены подписки с несуществующими пользователями: {orphan_subs}")
+    
+    # Проверка способов оплаты подписок
+    orphan_pm = count_orphans(db, Subscription, Subscription.payment_method_id, PaymentMethod, nullable=True)
+    if orphan_pm:
+        errors.append(f"Найдены подписки с несуществующими способами оплаты: {orphan_pm}")
     
     # Проверка способов оплаты
-    payment_methods = db.query(PaymentMethod).all()
-    if payment_methods:
-        orphan_pm = [pm for pm in payment_methods if not db.query(User).filter(User.id == pm.user_id).first()]
-        if orphan_pm:
-            errors.append(f"Найдены способы оплаты с несуществующими пользователями: {len(orphan_pm)}")
+    orphan_pm = count_orphans(db, PaymentMethod, PaymentMethod.user_id, User)
+    if orphan_pm:
+        errors.append(f"Найдены способы оплаты с несуществующими пользователями: {orphan_pm}")
     
     return errors, warnings
 
@@ -398,21 +422,416 @@ def generate_test_data(
         db.close()
 
 
+# ==================== МАССОВАЯ ГЕНЕРАЦИЯ ====================
+
+# Распределения массового режима: доли ближе к реальным, чем равномерный random.choice
+BULK_PURPOSE_WEIGHTS = {'food': 40, 'medical': 30, 'general': 20, 'maintenance': 10}
+BULK_DONATION_STATUS_WEIGHTS = {'succeeded': 82, 'pending': 7, 'canceled': 6, 'failed': 5}
+BULK_SUBSCRIPTION_STATUS_WEIGHTS = {'active': 70, 'canceled': 22, 'paused': 8}
+BULK_FREQUENCY_WEIGHTS = {'monthly': 80, 'weekly': 12, 'quarterly': 8}
+BULK_PROVIDER_WEIGHTS = {'yoomoney': 90, 'stripe': 6, 'paypal': 4}
+# Популярные суммы; остальные 15% - произвольная сумма, кратная 10 ₽
+BULK_AMOUNT_WEIGHTS = {100: 8, 200: 10, 300: 12, 500: 22, 1000: 20, 1500: 5, 2000: 7, 3000: 4, 5000: 6, 10000: 1}
+BULK_CUSTOM_AMOUNT_SHARE = 0.15
+# Донаты по часам суток (МСК сдвинут на 3 часа к UTC не учитываем): пик вечером
+BULK_HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 3, 4, 5, 6, 7, 7, 8, 8, 7, 7, 8, 9, 10, 11, 11, 9, 6, 3]
+BULK_ANONYMOUS_SHARE = 0.15
+BULK_GUEST_SHARE = 0.2  # неанонимные донаты без аккаунта
+BULK_RECURRING_SHARE = 0.25
+
+# Донаты добавляются без индексов, если их больше порога: индексы строятся один раз в конце
+BULK_INDEX_REBUILD_THRESHOLD = 100000
+BULK_COMMIT_EVERY = 20  # пачек на транзакцию
+
+_EPOCH = datetime(1970, 1, 1)
+_PHONE_STRIDE = 7654321  # взаимно просто с 10**9: номера по id не повторяются
+_HASH_MULTIPLIER = 2654435761
+
+_plan = None  # параметры генерации в процессе-воркере (см. _init_worker)
+
+
+def _cum_weights(weights: dict) -> tuple:
+    return list(weights), list(itertools.accumulate(weights.values()))
+
+
+def _format_ts(ts: float) -> str:
+    # isoformat в разы быстрее strftime и дает тот же формат, что SQLAlchemy
+    return (_EPOCH + timedelta(seconds=ts)).isoformat(' ', 'microseconds')
+
+
+def _random_uuid(rng: random.Random) -> str:
+    value = f'{rng.getrandbits(128):032x}'
+    return f'{value[:8]}-{value[8:12]}-{value[12:16]}-{value[16:20]}-{value[20:]}'
+
+
+def build_bulk_plan(seed: int, days: int, end: datetime = None) -> dict:
+    """
+    Общие для всех воркеров параметры: пулы имен и email, период, смещение телефонов
+
+    Пулы строит Faker один раз; дальше строки собираются только из random.Random.
+    """
+    local_fake = Faker('ru_RU')
+    local_fake.seed_instance(seed)
+    rng = random.Random(f'{seed}-plan')
+    # Конец периода - начало текущих суток: повторный запуск в тот же день дает те же даты
+    end = end or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        'seed': seed,
+        'names': [local_fake.name() for _ in range(2000)],
+        'logins': [local_fake.user_name() for _ in range(2000)],
+        'domains': ['mail.ru', 'yandex.ru', 'gmail.com', 'bk.ru', 'inbox.ru', 'list.ru', 'rambler.ru'],
+        'phone_offset': rng.randrange(10 ** 9),
+        'end_ts': (end - _EPOCH).total_seconds(),
+        'span': days * 86400,
+        'first_user_id': 1,
+        'users': 0,
+        'subscription_owners': [],  # user_id подписки: индекс = id - first_subscription_id
+        'first_subscription_id': 1,
+    }
+
+
+def bulk_user_attrs(plan: dict, user_id: int) -> tuple:
+    """Имя, телефон и email пользователя вычисляются из id: воркерам не нужна БД"""
+    h = (user_id * _HASH_MULTIPLIER) & 0xFFFFFFFF
+    name = plan['names'][h % len(plan['names'])]
+    phone = f"+79{(user_id * _PHONE_STRIDE + plan['phone_offset']) % 10 ** 9:09d}"
+    email = None
+    if h % 10:  # 90% указали email
+        login = plan['logins'][(h >> 11) % len(plan['logins'])]
+        email = f"{login}{user_id}@{plan['domains'][(h >> 22) % len(plan['domains'])]}"
+    return name, phone, email
+
+
+def _random_times(rng: random.Random, plan: dict, count: int) -> list:
+    """Моменты времени за период: поток донатов растет к концу периода, пик вечером"""
+    hours = rng.choices(range(24), cum_weights=_HOUR_CUM, k=count)
+    start = plan['end_ts'] - plan['span']
+    days = plan['span'] // 86400
+    result = []
+    for hour in hours:
+        day = int(days * rng.random() ** 0.5)
+        ts = start + day * 86400 + hour * 3600 + rng.random() * 3600
+        result.append(min(ts, plan['end_ts']))
+    return result
+
+
+_PURPOSES, _PURPOSE_CUM = _cum_weights(BULK_PURPOSE_WEIGHTS)
+_DONATION_STATUSES, _DONATION_STATUS_CUM = _cum_weights(BULK_DONATION_STATUS_WEIGHTS)
+_SUBSCRIPTION_STATUSES, _SUBSCRIPTION_STATUS_CUM = _cum_weights(BULK_SUBSCRIPTION_STATUS_WEIGHTS)
+_FREQUENCIES, _FREQUENCY_CUM = _cum_weights(BULK_FREQUENCY_WEIGHTS)
+_PROVIDERS, _PROVIDER_CUM = _cum_weights(BULK_PROVIDER_WEIGHTS)
+_AMOUNTS, _AMOUNT_CUM = _cum_weights(BULK_AMOUNT_WEIGHTS)
+_HOUR_CUM = list(itertools.accumulate(BULK_HOUR_WEIGHTS))
+
+
+def _user_rows(plan: dict, rng: random.Random, first_id: int, count: int) -> list:
+    times = _random_times(rng, plan, count)
+    rows = []
+    for offset in range(count):
+        user_id = first_id + offset
+        name, phone, email = bulk_user_attrs(plan, user_id)
+        rows.append((user_id, phone, email, name, _format_ts(times[offset])))
+    return rows
+
+
+def _donation_rows(plan: dict, rng: random.Random, first_id: int, count: int) -> list:
+    purposes = rng.choices(_PURPOSES, cum_weights=_PURPOSE_CUM, k=count)
+    statuses = rng.choices(_DONATION_STATUSES, cum_weights=_DONATION_STATUS_CUM, k=count)
+    providers = rng.choices(_PROVIDERS, cum_weights=_PROVIDER_CUM, k=count)
+    amounts = rng.choices(_AMOUNTS, cum_weights=_AMOUNT_CUM, k=count)
+    times = _random_times(rng, plan, count)
+    owners = plan['subscription_owners']
+    first_user_id, users = plan['first_user_id'], plan['users']
+    first_subscription_id = plan['first_subscription_id']
+    names = plan['names']
+    # random() вместо randrange(): на миллионах строк заметно быстрее
+    rand = rng.random
+    user_share = 1 - BULK_ANONYMOUS_SHARE - BULK_GUEST_SHARE
+
+    rows = []
+    for offset in range(count):
+        user_id = subscription_id = None
+        roll = rand()
+        if owners and roll < BULK_RECURRING_SHARE:
+            index = int(rand() * len(owners))
+            subscription_id = first_subscription_id + index
+            user_id = owners[index]
+        elif users and roll < user_share:
+            user_id = first_user_id + int(rand() * users)
+
+        if user_id is not None:
+            public_name, phone, email = bulk_user_attrs(plan, user_id)
+        elif roll < 1 - BULK_ANONYMOUS_SHARE:
+            public_name, phone, email = names[int(rand() * len(names))], None, None
+        else:
+            public_name, phone, email = 'Анонимно', None, None
+
+        amount = amounts[offset]
+        if rand() < BULK_CUSTOM_AMOUNT_SHARE:
+            amount = (10 + int(rand() * 4990)) * 10
+
+        status = statuses[offset]
+        created_ts = times[offset]
+        paid_at = None
+        if status == 'succeeded':
+            paid_at = _format_ts(created_ts + rng.expovariate(1 / 90))
+        payment_id = None
+        if status != 'pending' or rand() < 0.5:
+            payment_id = _random_uuid(rng)
+
+        rows.append((
+            first_id + offset, user_id, public_name, phone, email, float(amount), purposes[offset],
+            subscription_id is not None, subscription_id, providers[offset], payment_id, status,
+            paid_at, _format_ts(created_ts)
+        ))
+    return rows
+
+
+def _payment_method_rows(plan: dict, rng: random.Random, first_id: int, count: int) -> list:
+    providers = rng.choices(_PROVIDERS, cum_weights=_PROVIDER_CUM, k=count)
+    times = _random_times(rng, plan, count)
+    rows = []
+    for offset in range(count):
+        rows.append((
+            first_id + offset,
+            plan['first_user_id'] + rng.randrange(plan['users']),
+            providers[offset],
+            _random_uuid(rng) if rng.random() < 0.9 else None,
+            f'{rng.randrange(10000):04d}' if rng.random() < 0.9 else None,
+            rng.random() < 0.85,
+            _format_ts(times[offset])
+        ))
+    return rows
+
+
+def _subscription_rows(plan: dict, rng: random.Random, first_id: int, count: int, methods: list) -> list:
+    """methods - пары (id способа оплаты, user_id): подписка принадлежит владельцу карты"""
+    statuses = rng.choices(_SUBSCRIPTION_STATUSES, cum_weights=_SUBSCRIPTION_STATUS_CUM, k=count)
+    frequencies = rng.choices(_FREQUENCIES, cum_weights=_FREQUENCY_CUM, k=count)
+    purposes = rng.choices(_PURPOSES, cum_weights=_PURPOSE_CUM, k=count)
+    amounts = rng.choices(_AMOUNTS, cum_weights=_AMOUNT_CUM, k=count)
+    times = _random_times(rng, plan, count)
+    end = _EPOCH + timedelta(seconds=plan['end_ts'])
+    rows = []
+    for offset in range(count):
+        if methods:
+            method_id, user_id = methods[rng.randrange(len(methods))]
+        else:
+            method_id, user_id = None, plan['first_user_id'] + rng.randrange(plan['users'])
+        created_ts = times[offset]
+        status = statuses[offset]
+        next_charge_at = last_charge_at = canceled_at = None
+        if status == 'active':
+            last_charge = _EPOCH + timedelta(seconds=created_ts)
+            next_charge = calculate_next_charge_date(frequencies[offset], last_charge)
+            while next_charge <= end:
+                last_charge, next_charge = next_charge, calculate_next_charge_date(frequencies[offset], next_charge)
+            last_charge_at = last_charge.isoformat(' ', 'microseconds')
+            next_charge_at = next_charge.isoformat(' ', 'microseconds')
+        elif status == 'canceled':
+            canceled_at = _format_ts(created_ts + rng.random() * (plan['end_ts'] - created_ts))
+        rows.append((
+            first_id + offset, user_id, method_id, float(amounts[offset]), purposes[offset],
+            frequencies[offset], status, next_charge_at, last_charge_at, _format_ts(created_ts), canceled_at
+        ))
+    return rows
+
+
+_ROW_BUILDERS = {'users': _user_rows, 'donations': _donation_rows}
+
+
+def _init_worker(plan: dict):
+    global _plan
+    _plan = plan
+
+
+def _generate_chunk(task: tuple) -> list:
+    """Строки одной пачки. Генератор пачки зависит только от seed и номера пачки"""
+    kind, chunk, first_id, count = task
+    rng = random.Random(f"{_plan['seed']}-{kind}-{chunk}")
+    return _ROW_BUILDERS[kind](_plan, rng, first_id, count)
+
+
+_INSERT_SQL = {
+    'users': 'INSERT INTO users (id, phone, email, full_name, created_at) VALUES (?, ?, ?, ?, ?)',
+    'payment_methods': (
+        'INSERT INTO payment_methods (id, user_id, provider, provider_payment_token, last4, is_active, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)'
+    ),
+    'subscriptions': (
+        'INSERT INTO subscriptions (id, user_id, payment_method_id, amount, purpose, frequency, status, '
+        'next_charge_at, last_charge_at, created_at, canceled_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+    ),
+    'donations': (
+        'INSERT INTO donations (id, user_id, public_name, phone, email, amount, purpose, is_recurring, '
+        'subscription_id, provider, provider_payment_id, status, paid_at, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+    ),
+}
+
+
+def _iter_chunks(plan: dict, kind: str, first_id: int, total: int, batch_size: int, workers: int):
+    """
+    Пачки строк по порядку; при workers > 1 строятся в пуле процессов
+
+    Вперед строится не больше workers * 4 пачек, чтобы генерация не обгоняла
+    запись в БД на гигабайты памяти.
+    """
+    tasks = [
+        (kind, chunk, first_id + offset, min(batch_size, total - offset))
+        for chunk, offset in enumerate(range(0, total, batch_size))
+    ]
+    if workers <= 1:
+        _init_worker(plan)
+        yield from map(_generate_chunk, tasks)
+        return
+    window = workers * 4
+    with multiprocessing.Pool(workers, _init_worker, (plan,)) as pool:
+        for start in range(0, len(tasks), window):
+            yield from pool.imap(_generate_chunk, tasks[start:start + window])
+
+
+def _next_id(conn, table: str) -> int:
+    return conn.exec_driver_sql(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').scalar()
+
+
+def _write_chunks(conn, kind: str, chunks) -> int:
+    """Записать пачки строк; коммит каждые BULK_COMMIT_EVERY пачек"""
+    written = 0
+    started = time.perf_counter()
+    for number, rows in enumerate(chunks, 1):
+        conn.exec_driver_sql(_INSERT_SQL[kind], rows)
+        written += len(rows)
+        if number % BULK_COMMIT_EVERY == 0:
+            conn.commit()
+            elapsed = time.perf_counter() - started
+            print(f"  {kind}: {written:,} ({written / elapsed:,.0f} строк/с)")
+    conn.commit()
+    return written
+
+
+def generate_bulk_data(
+    num_users: int,
+    num_donations: int,
+    num_subscriptions: int,
+    num_payment_methods: int,
+    seed: int = 42,
+    batch_size: int = 50000,
+    workers: int = 1,
+    days: int = 730
+) -> dict:
+    """
+    Массовая генерация: пользователи и донаты строятся пачками (при workers > 1 -
+    в отдельных процессах), записываются executemany в порядке пачек
+
+    Сводка donation_daily_stats пересобирается одним запросом в конце.
+    Возвращает количество строк и время по таблицам.
+    """
+    init_db()
+    plan = build_bulk_plan(seed, days)
+    result = {}
+    started = time.perf_counter()
+
+    with engine.connect() as conn:
+        # Сбой посреди загрузки не страшен для тестовой БД, а синхронизация с диском - главная цена записи
+        conn.exec_driver_sql('PRAGMA synchronous=OFF')
+        plan['first_user_id'] = _next_id(conn, 'users')
+        plan['users'] = num_users
+        if num_users == 0:
+            # Донаты к уже загруженным пользователям (id 1..max)
+            plan['first_user_id'] = 1
+            plan['users'] = _next_id(conn, 'users') - 1
+        if plan['users'] == 0 and (num_donations or num_subscriptions or num_payment_methods):
+            raise ValueError('Для донатов и подписок нужны пользователи')
+
+        rebuild_indexes = num_donations >= BULK_INDEX_REBUILD_THRESHOLD
+        if rebuild_indexes:
+            for index in Donation.__table__.indexes:
+                conn.exec_driver_sql(f'DROP INDEX IF EXISTS {index.name}')
+            conn.commit()
+
+        stage = time.perf_counter()
+        users = _iter_chunks(plan, 'users', plan['first_user_id'], num_users, batch_size, workers)
+        result['users'] = _write_chunks(conn, 'users', users)
+        print(f"[OK] Пользователей: {result['users']:,} за {time.perf_counter() - stage:.1f} с")
+
+        # Способы оплаты и подписки нужны донатам целиком (владельцы подписок), их немного
+        stage = time.perf_counter()
+        first_method_id = _next_id(conn, 'payment_methods')
+        methods = _payment_method_rows(plan, random.Random(f'{seed}-payment_methods'),
+                                       first_method_id, num_payment_methods)
+        result['payment_methods'] = _write_chunks(conn, 'payment_methods', [methods])
+        plan['first_subscription_id'] = _next_id(conn, 'subscriptions')
+        subscriptions = _subscription_rows(
+            plan, random.Random(f'{seed}-subscriptions'), plan['first_subscription_id'], num_subscriptions,
+            [(row[0], row[1]) for row in methods if row[3] and row[5]]
+        )
+        result['subscriptions'] = _write_chunks(conn, 'subscriptions', [subscriptions])
+        plan['subscription_owners'] = [row[1] for row in subscriptions]
+        print(f"[OK] Способов оплаты: {result['payment_methods']:,}, подписок: {result['subscriptions']:,} "
+              f"за {time.perf_counter() - stage:.1f} с")
+
+        stage = time.perf_counter()
+        donations = _iter_chunks(plan, 'donations', _next_id(conn, 'donations'), num_donations, batch_size, workers)
+        result['donations'] = _write_chunks(conn, 'donations', donations)
+        print(f"[OK] Донатов: {result['donations']:,} за {time.perf_counter() - stage:.1f} с")
+
+    stage = time.perf_counter()
+    if rebuild_indexes:
+        ensure_indexes()
+    with engine.begin() as conn:
+        result['daily_stats'] = rebuild_donation_daily_stats(conn)
+        # Донаты учла пересборка сводки; подписки вставлены в обход ORM - сбрасываем кэш ответов
+        bump_data_versions(conn, {'subscriptions'})
+        # Статистика планировщика по выборке: полный ANALYZE на миллионах строк долгий
+        conn.exec_driver_sql('PRAGMA analysis_limit=1000')
+        conn.exec_driver_sql('ANALYZE')
+    print(f"[OK] Индексы, сводка и статистика за {time.perf_counter() - stage:.1f} с")
+
+    result['seconds'] = round(time.perf_counter() - started, 1)
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Генератор тестовых данных для приюта "Дом Лап"')
+    parser.add_argument('users', nargs='?', type=int, default=50)
+    parser.add_argument('donations', nargs='?', type=int, default=200)
+    parser.add_argument('subscriptions', nargs='?', type=int, default=30)
+    parser.add_argument('payment_methods', nargs='?', type=int, default=40)
+    parser.add_argument('--bulk', action='store_true', help='массовая запись пачками')
+    parser.add_argument('--seed', type=int, default=None, help='seed генератора (в --bulk по умолчанию 42)')
+    parser.add_argument('--batch', type=int, default=50000, help='строк в пачке (--bulk)')
+    parser.add_argument('--workers', type=int, default=1, help='процессов для генерации строк (--bulk)')
+    parser.add_argument('--days', type=int, default=730, help='период данных в днях (--bulk)')
+    args = parser.parse_args(argv)
+
+    if not args.bulk:
+        if args.seed is not None:
+            random.seed(args.seed)
+            fake.seed_instance(args.seed)
+        success = generate_test_data(
+            num_users=args.users,
+            num_donations=args.donations,
+            num_subscriptions=args.subscriptions,
+            num_payment_methods=args.payment_methods
+        )
+        return 0 if success else 1
+
+    try:
+        result = generate_bulk_data(
+            args.users, args.donations, args.subscriptions, args.payment_methods,
+            seed=42 if args.seed is None else args.seed,
+            batch_size=args.batch,
+            workers=args.workers,
+            days=args.days
+        )
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка при генерации данных: {e}")
+        return 1
+    print(f"\n[OK] Массовая генерация завершена: {result}")
+    return 0
+
+
 if __name__ == '__main__':
     import sys
-    
-    # Параметры по умолчанию можно изменить через аргументы командной строки
-    num_users = int(sys.argv[1]) if len(sys.argv) > 1 else 50
-    num_donations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
-    num_subscriptions = int(sys.argv[3]) if len(sys.argv) > 3 else 30
-    num_payment_methods = int(sys.argv[4]) if len(sys.argv) > 4 else 40
-    
-    success = generate_test_data(
-        num_users=num_users,
-        num_donations=num_donations,
-        num_subscriptions=num_subscriptions,
-        num_payment_methods=num_payment_methods
-    )
-    
-    sys.exit(0 if success else 1)
-
+    sys.exit(main())
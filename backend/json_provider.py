@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Быстрая сериализация JSON-ответов API (необязательная зависимость orjson)
+
+Если установлен orjson, jsonify() кодирует ответы через него: список на 1000
+строк сериализуется в несколько раз быстрее встроенного json. Формат тот же,
+что у DefaultJSONProvider Flask: ключи отсортированы, без пробелов, даты и
+прочие нестандартные типы проходят через тот же default (datetime - RFC 822).
+Единственное отличие - не-ASCII символы пишутся как есть в UTF-8, а не \\uXXXX
+(ответ короче, клиенты разбирают его так же).
+
+В режиме отладки (отступы) и при значениях, которые orjson не кодирует
+(целые больше 64 бит), используется встроенный json.
+
+Настройка:
+    JSON_PROVIDER=auto      # по умолчанию: orjson, если установлен (pip install orjson)
+    JSON_PROVIDER=default   # всегда встроенный json
+"""
+import os
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'auto').lower()
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON-провайдер Flask на orjson с откатом на встроенный json"""
+
+    # Даты отдаются в default, как во встроенном провайдере (RFC 822), а не в ISO от orjson
+    options = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj, default=self.default, option=self.options).decode('utf-8')
+        except orjson.JSONEncodeError:
+            return super().dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = orjson.dumps(obj, default=self.default, option=self.options | orjson.OPT_APPEND_NEWLINE)
+        except orjson.JSONEncodeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app, kind: str = JSON_PROVIDER) -> str:
+    """Подключить быстрый JSON-провайдер. Возвращает имя используемого: orjson или default"""
+    if kind not in ('auto', 'orjson', 'default'):
+        raise ValueError(f"Неизвестный JSON_PROVIDER: {kind}")
+    if kind == 'default':
+        return 'default'
+    if orjson is None:
+        if kind == 'orjson':
+            print("[WARNING] JSON_PROVIDER=orjson, но orjson не установлен - используется встроенный json")
+        return 'default'
+    app.json = OrjsonProvider(app)
+    return 'orjson'
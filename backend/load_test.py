@@ -0,0 +1,543 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест платежного пути против настоящего WSGI-сервера
+
+Что запускается:
+1. Локальная заглушка YooMoney (fake_yoomoney.py) с заданной задержкой, долей
+   ошибок и асинхронными webhook на /api/yoomoney/webhook тестируемого API.
+2. API (app.py) в отдельном процессе на многопоточном WSGI-сервере werkzeug
+   и воркер регулярных списаний (recurring_charges.py --worker) - оба на копии
+   сгенерированного набора данных (см. benchmark.py) и оба против заглушки.
+3. Генератор нагрузки с открытой моделью: запросы запускаются по расписанию
+   с частотой --donate-rps, задержка считается от запланированного момента,
+   поэтому очередь на стороне клиента тоже попадает в хвост задержек.
+
+Потоки нагрузки:
+- donate: POST /api/donations, затем payment_link - long poll ссылки на оплату;
+- webhook: уведомления заглушки о каждом созданном платеже (и дубли --duplicate-rate);
+- recurring: каждую секунду --recurring-rps подписок становятся к списанию,
+  их забирает воркер регулярных списаний.
+
+Отчет: пропускная способность и p50/p95/p99/max по операциям, доставка webhook,
+итоговые статусы донатов и блокировки БД - сколько ждет BEGIN IMMEDIATE
+пробного соединения (очередь на запись в SQLite) и сколько ответов 500
+пришло с "database is locked".
+
+Запуск:
+    python load_test.py                                    # 30 с, 20 донатов/с, набор 10 000 донатов
+    python load_test.py --duration 60 --donate-rps 50 --recurring-rps 10 --provider-delay 0.2
+    python load_test.py --url http://127.0.0.1:5000 --db shelter.db --provider-port 8099
+        # готовый сервер (например, gunicorn), запущенный с
+        # YOOMONEY_API_URL=http://127.0.0.1:8099/api/v3/payments
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+from benchmark import DEFAULT_DATA_DIR, build_dataset, percentile
+from fake_yoomoney import FakeYooMoney
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+PURPOSES = ['food', 'medical', 'maintenance', 'general']
+
+
+# ==================== СТАТИСТИКА ====================
+
+class OpStats:
+    """Задержки и коды ответов одной операции"""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.locked = 0  # Ответов 500 с "database is locked"
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, status, locked: bool = False):
+        with self._lock:
+            self.latencies.append(latency)
+            self.statuses[str(status)] += 1
+            self.locked += locked
+
+    def summary(self, elapsed: float) -> dict:
+        with self._lock:
+            latencies = list(self.latencies)
+            statuses = dict(self.statuses)
+            locked = self.locked
+        return {
+            'count': len(latencies),
+            'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            'max_ms': round(max(latencies, default=0.0) * 1000, 1),
+            'statuses': statuses,
+            'db_locked': locked,
+        }
+
+
+class LockProbe:
+    """
+    Проба блокировки записи SQLite
+
+    Раз в interval секунд пробное соединение выполняет BEGIN IMMEDIATE и сразу
+    ROLLBACK: время ожидания - сколько новый писатель стоит в очереди на запись.
+    """
+
+    def __init__(self, db_path: str, interval: float = 0.2, timeout: float = 5.0):
+        self.db_path = db_path
+        self.interval = interval
+        self.timeout = timeout
+        self.waits = []
+        self.timeouts = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> 'LockProbe':
+        self._thread = threading.Thread(target=self._run, name='lock-probe', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+        try:
+            while not self._stop.wait(self.interval):
+                started = time.perf_counter()
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    self.waits.append(time.perf_counter() - started)
+                    conn.execute('ROLLBACK')
+                except sqlite3.OperationalError:
+                    self.timeouts += 1
+        finally:
+            conn.close()
+
+    def summary(self) -> dict:
+        waits = list(self.waits)
+        return {
+            'probes': len(waits) + self.timeouts,
+            'p50_ms': round(percentile(waits, 0.50) * 1000, 1),
+            'p99_ms': round(percentile(waits, 0.99) * 1000, 1),
+            'max_ms': round(max(waits, default=0.0) * 1000, 1),
+            'timeouts': self.timeouts,
+        }
+
+
+# ==================== ПОТОКИ НАГРУЗКИ ====================
+
+_local = threading.local()
+
+
+def http() -> requests.Session:
+    """requests.Session на поток: keep-alive соединения с API"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+def is_locked(response) -> bool:
+    return response.status_code >= 500 and 'database is locked' in response.text
+
+
+def donate_flow(base_url: str, scheduled: float, rng: random.Random, recurring_share: float, stats: dict):
+    """Создать донат и дождаться ссылки на оплату"""
+    recurring = rng.random() < recurring_share
+    named = recurring or rng.random() < 0.5
+    payload = {
+        'amount': rng.choice([100, 300, 500, 1000, 2500]),
+        'purpose': rng.choice(PURPOSES),
+        'payment_method': 'card',
+        'is_recurring': recurring,
+        'anonymous': not named,
+    }
+    if named:
+        payload['full_name'] = 'Нагрузочный Тест'
+        payload['phone'] = f'+79{rng.randrange(10 ** 9):09d}'
+
+    try:
+        response = http().post(f'{base_url}/api/donations', json=payload, timeout=30)
+    except requests.RequestException as e:
+        stats['donate'].record(time.perf_counter() - scheduled, type(e).__name__)
+        return
+    stats['donate'].record(time.perf_counter() - scheduled, response.status_code, is_locked(response))
+    if response.status_code != 202:
+        return
+
+    started = time.perf_counter()
+    try:
+        response = http().get(f"{base_url}{response.json()['payment_status_url']}", params={'wait': 10}, timeout=30)
+        status = response.json().get('payment_status', response.status_code) if response.ok else response.status_code
+        stats['payment_link'].record(time.perf_counter() - started, status, is_locked(response))
+    except requests.RequestException as e:
+        stats['payment_link'].record(time.perf_counter() - started, type(e).__name__)
+
+
+def drive(rps: float, deadline: float, pool: ThreadPoolExecutor, task):
+    """Открытая модель: запускать task(scheduled) каждые 1/rps секунд до deadline"""
+    if rps <= 0:
+        return
+    interval = 1.0 / rps
+    scheduled = time.perf_counter()
+    while scheduled < deadline:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pool.submit(task, scheduled)
+        scheduled += interval
+
+
+def db_timestamp(moment: datetime) -> str:
+    """Формат DateTime, в котором SQLAlchemy хранит даты в SQLite"""
+    return moment.isoformat(' ', 'microseconds')
+
+
+def mark_due(db_path: str, rps: float, deadline: float, marked: list):
+    """
+    Раз в секунду переводить rps активных подписок в наступившие к списанию
+
+    Каждая подписка отмечается не больше одного раза (курсор по id), иначе
+    повторно отмеченная еще не списанная подписка искажала бы итог.
+    Возвращает False, если активные подписки в наборе закончились раньше времени.
+    """
+    if rps <= 0:
+        return True
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    carry = 0.0
+    last_id = 0
+    try:
+        while time.perf_counter() < deadline:
+            carry += rps
+            count, carry = int(carry), carry - int(carry)
+            now = datetime.utcnow()
+            if count:
+                rows = conn.execute('''
+                    UPDATE subscriptions SET next_charge_at = ?
+                    WHERE id IN (
+                        SELECT id FROM subscriptions
+                        WHERE id > ? AND status = 'active' AND payment_method_id IS NOT NULL
+                          AND claimed_by IS NULL AND next_charge_at > ?
+                        ORDER BY id LIMIT ?
+                    )
+                    RETURNING id
+                ''', (db_timestamp(now - timedelta(seconds=1)), last_id, db_timestamp(now), count)).fetchall()
+                if not rows:
+                    return False
+                ids = [row[0] for row in rows]
+                marked.extend(ids)
+                last_id = max(ids)
+            time.sleep(max(0.0, 1.0 - (datetime.utcnow() - now).total_seconds()))
+    finally:
+        conn.close()
+    return True
+
+
+# ==================== ПРОЦЕССЫ ====================
+
+def serve(port: int):
+    """Дочерний процесс: API на многопоточном WSGI-сервере werkzeug"""
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"[OK] API на http://127.0.0.1:{port}", flush=True)
+    server.serve_forever()
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base_url: str, timeout: float = 30.0):
+    """Дождаться, пока API начнет отвечать"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'{base_url}/api/donations/0/payment', timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"API не ответил за {timeout} с: {base_url}")
+
+
+def db_summary(db_path: str, first_donation_id: int) -> dict:
+    """Статусы донатов, созданных во время теста, и состояние очереди webhook"""
+    with sqlite3.connect(db_path, timeout=30) as conn:
+        donations = dict(conn.execute(
+            'SELECT status, COUNT(*) FROM donations WHERE id > ? GROUP BY status', (first_donation_id,)
+        ).fetchall())
+        try:
+            events = dict(conn.execute('SELECT status, COUNT(*) FROM webhook_events GROUP BY status').fetchall())
+        except sqlite3.OperationalError:
+            events = {}
+    return {'donations': donations, 'webhook_events': events}
+
+
+def charged_count(db_path: str, subscription_ids: list, since: datetime) -> int:
+    """Сколько отмеченных подписок списано (дата следующего списания ушла вперед)"""
+    if not subscription_ids:
+        return 0
+    with sqlite3.connect(db_path, timeout=30) as conn:
+        charged = 0
+        for start in range(0, len(subscription_ids), 500):
+            chunk = subscription_ids[start:start + 500]
+            charged += conn.execute(
+                f"SELECT COUNT(*) FROM subscriptions WHERE id IN ({','.join('?' * len(chunk))}) AND next_charge_at > ?",
+                (*chunk, db_timestamp(since))
+            ).fetchone()[0]
+    return charged
+
+
+def max_donation_id(db_path: str) -> int:
+    with sqlite3.connect(db_path, timeout=30) as conn:
+        return conn.execute('SELECT COALESCE(MAX(id), 0) FROM donations').fetchone()[0]
+
+
+# ==================== ЗАПУСК ====================
+
+def run(args, work_dir: str) -> dict:
+    webhook_secret = args.webhook_secret if args.url else uuid.uuid4().hex
+    provider = FakeYooMoney(
+        '127.0.0.1', args.provider_port, args.provider_delay,
+        jitter=args.provider_jitter,
+        error_rate=args.provider_error_rate,
+        webhook_delay=args.webhook_delay,
+        webhook_secret=webhook_secret,
+        success_rate=args.success_rate,
+        duplicate_rate=args.duplicate_rate,
+        webhook_workers=args.webhook_workers,
+        seed=args.seed
+    )
+
+    processes = []
+    db_path = args.db
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        source = args.db or build_dataset(args.data_dir, args.size)
+        db_path = os.path.join(work_dir, 'shelter.db')
+        shutil.copyfile(source, db_path)
+        base_url = f'http://127.0.0.1:{free_port()}'
+        env = dict(
+            os.environ,
+            SHELTER_DB_PATH=db_path,
+            SESSION_DB_PATH=os.path.join(work_dir, 'sessions.db'),
+            RATE_LIMIT_ENABLED='0',
+            YOOMONEY_API_URL=provider.url,
+            YOOMONEY_SHOP_ID='load-test',
+            YOOMONEY_SECRET_KEY='load-test',
+            YOOMONEY_WEBHOOK_SECRET=webhook_secret,
+        )
+        log = open(os.path.join(work_dir, 'server.log'), 'w', encoding='utf-8')
+        processes.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', base_url.rsplit(':', 1)[1]],
+            env=env, cwd=BACKEND_DIR, stdout=log, stderr=subprocess.STDOUT
+        ))
+        if args.recurring_rps > 0:
+            processes.append(subprocess.Popen(
+                [sys.executable, os.path.join(BACKEND_DIR, 'recurring_charges.py'), '--worker', '--interval', '1'],
+                env=env, cwd=BACKEND_DIR, stdout=log, stderr=subprocess.STDOUT
+            ))
+    provider.webhook_url = f'{base_url}/api/yoomoney/webhook'
+    provider.start()
+
+    stats = {'donate': OpStats(), 'payment_link': OpStats()}
+    marked = []
+    probe = LockProbe(db_path).start() if db_path else None
+    try:
+        wait_ready(base_url)
+        first_donation_id = max_donation_id(db_path) if db_path else 0
+        started_at = datetime.utcnow()
+        print(f"[INFO] Нагрузка {args.duration} с: {args.donate_rps} донатов/с, "
+              f"{args.recurring_rps} списаний/с, API {base_url}")
+
+        rng = random.Random(args.seed)
+        rng_lock = threading.Lock()
+
+        def task(scheduled):
+            with rng_lock:
+                task_rng = random.Random(rng.random())
+            donate_flow(base_url, scheduled, task_rng, args.recurring_share, stats)
+
+        started = time.perf_counter()
+        deadline = started + args.duration
+        marker = None
+        enough_subscriptions = []
+        if db_path and args.recurring_rps > 0:
+            marker = threading.Thread(
+                target=lambda: enough_subscriptions.append(mark_due(db_path, args.recurring_rps, deadline, marked)),
+                daemon=True
+            )
+            marker.start()
+        with ThreadPoolExecutor(args.concurrency, thread_name_prefix='load') as pool:
+            drive(args.donate_rps, deadline, pool, task)
+        elapsed = time.perf_counter() - started
+        if marker:
+            marker.join()
+
+        # Дать провайдеру доставить оставшиеся webhook, а воркерам - их применить
+        drained = provider.wait_webhooks(args.drain)
+        time.sleep(min(args.drain, 2.0))
+        drain_elapsed = time.perf_counter() - started
+
+        webhook_latencies = list(provider.webhook_latencies)
+        report = {
+            'config': {
+                key: getattr(args, key) for key in (
+                    'duration', 'donate_rps', 'recurring_rps', 'recurring_share', 'concurrency', 'size',
+                    'provider_delay', 'provider_jitter', 'provider_error_rate', 'webhook_delay',
+                    'success_rate', 'duplicate_rate'
+                )
+            },
+            'elapsed_sec': round(elapsed, 1),
+            'operations': {name: op.summary(elapsed) for name, op in stats.items()},
+            'provider': {
+                'payments': len(provider.payments),
+                'requests': len(provider.requests),
+            },
+            'webhooks': dict(
+                provider.webhook_stats,
+                drained=drained,
+                rps=round(len(webhook_latencies) / drain_elapsed, 1) if drain_elapsed else 0.0,
+                p50_ms=round(percentile(webhook_latencies, 0.50) * 1000, 1),
+                p99_ms=round(percentile(webhook_latencies, 0.99) * 1000, 1),
+                max_ms=round(max(webhook_latencies, default=0.0) * 1000, 1),
+            ),
+        }
+        if db_path:
+            report['database'] = db_summary(db_path, first_donation_id)
+            report['recurring'] = {
+                'marked_due': len(marked),
+                'charged': charged_count(db_path, marked, started_at),
+                'exhausted': enough_subscriptions == [False],
+            }
+        if probe:
+            probe.stop()
+            report['db_lock'] = probe.summary()
+        return report
+    finally:
+        if probe:
+            probe.stop()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        provider.stop()
+
+
+def print_report(report: dict):
+    print("\n" + "=" * 78)
+    print(f"  Нагрузочный тест: {report['elapsed_sec']} с")
+    print("=" * 78)
+    print(f"{'операция':<14}{'всего':>8}{'в сек':>8}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}{'max мс':>9}  коды")
+    for name, op in report['operations'].items():
+        print(f"{name:<14}{op['count']:>8}{op['rps']:>8}{op['p50_ms']:>9}{op['p95_ms']:>9}"
+              f"{op['p99_ms']:>9}{op['max_ms']:>9}  {op['statuses']}")
+    w = report['webhooks']
+    print(f"{'webhook':<14}{w['delivered'] + w['retried'] + w['failed']:>8}{w['rps']:>8}{w['p50_ms']:>9}"
+          f"{'':>9}{w['p99_ms']:>9}{w['max_ms']:>9}  доставлено {w['delivered']}, повторов {w['retried']}, "
+          f"не доставлено {w['failed']}")
+    print(f"\n[INFO] Провайдер: {report['provider']['payments']} платежей, {report['provider']['requests']} запросов")
+    if 'database' in report:
+        print(f"[INFO] Донаты за тест по статусам: {report['database']['donations']}")
+        print(f"[INFO] Очередь webhook: {report['database']['webhook_events']}")
+        print(f"[INFO] Регулярные списания: к списанию {report['recurring']['marked_due']}, "
+              f"списано {report['recurring']['charged']}")
+        if report['recurring']['exhausted']:
+            print("[WARNING] Активные подписки в наборе закончились раньше конца теста: увеличьте --size")
+    if 'db_lock' in report:
+        lock = report['db_lock']
+        print(f"[INFO] Ожидание блокировки записи: p50 {lock['p50_ms']} мс, p99 {lock['p99_ms']} мс, "
+              f"max {lock['max_ms']} мс, таймаутов {lock['timeouts']} из {lock['probes']}")
+    locked = sum(op['db_locked'] for op in report['operations'].values())
+    if locked:
+        print(f"[WARNING] Ответов 'database is locked': {locked}")
+    if not w['drained']:
+        print("[WARNING] Не все webhook доставлены до конца ожидания (--drain)")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Нагрузочный тест платежного пути API "Дом Лап"')
+    parser.add_argument('--duration', type=float, default=30, help='длительность нагрузки, секунды')
+    parser.add_argument('--donate-rps', type=float, default=20, help='новых донатов в секунду')
+    parser.add_argument('--recurring-rps', type=float, default=5, help='подписок к списанию в секунду')
+    parser.add_argument('--recurring-share', type=float, default=0.1, help='доля регулярных донатов')
+    parser.add_argument('--concurrency', type=int, default=64, help='одновременных клиентов')
+    parser.add_argument('--size', type=int, default=10000, help='размер набора данных (донатов)')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='папка сгенерированных наборов')
+    parser.add_argument('--db', help='своя БД вместо сгенерированной (копируется)')
+    parser.add_argument('--url', help='адрес уже запущенного API вместо дочернего процесса')
+    parser.add_argument('--webhook-secret', default=os.getenv('YOOMONEY_WEBHOOK_SECRET', ''),
+                        help='секрет подписи webhook готового сервера (для --url)')
+    parser.add_argument('--provider-port', type=int, default=0, help='порт заглушки YooMoney (0 - любой)')
+    parser.add_argument('--provider-delay', type=float, default=0.05, help='задержка провайдера, секунды')
+    parser.add_argument('--provider-jitter', type=float, default=0.1, help='случайная добавка к задержке')
+    parser.add_argument('--provider-error-rate', type=float, default=0.01, help='доля ответов 500')
+    parser.add_argument('--webhook-delay', type=float, default=1.0, help='пауза перед webhook, секунды')
+    parser.add_argument('--webhook-workers', type=int, default=8, help='потоков доставки webhook')
+    parser.add_argument('--success-rate', type=float, default=0.95, help='доля успешных платежей')
+    parser.add_argument('--duplicate-rate', type=float, default=0.05, help='доля повторно доставленных webhook')
+    parser.add_argument('--drain', type=float, default=30, help='ожидание доставки webhook после нагрузки')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help='записать отчет в JSON')
+    parser.add_argument('--log', help='сохранить вывод API и воркера списаний в файл')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.serve)
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix='shelter-load-') as work_dir:
+        try:
+            report = run(args, work_dir)
+        except Exception:
+            log = os.path.join(work_dir, 'server.log')
+            if os.path.exists(log):
+                with open(log, encoding='utf-8') as f:
+                    print(f.read()[-4000:], file=sys.stderr)
+            raise
+        finally:
+            log = os.path.join(work_dir, 'server.log')
+            if args.log and os.path.exists(log):
+                shutil.copyfile(log, args.log)
+
+    print_report(report)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n[OK] Отчет записан: {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Метрики API в текстовом формате Prometheus
+
+Что собирается:
+- задержка каждого запроса - гистограмма по маршруту (шаблон URL, а не сам
+  путь: /api/donations/<int:donation_id>/payment), методу и коду ответа;
+- число SQL-запросов и время в БД на один HTTP-запрос (события движка
+  SQLAlchemy); запросы фоновых воркеров учитываются отдельно (source="background");
+- запросы в обработке сейчас;
+- дополнительные источники (register_collector): счетчики и задержки клиента
+  YooMoney, ограничитель частоты и т.п.
+
+Отдача: GET /metrics (см. init_app). Метрики в памяти процесса: при нескольких
+процессах API Prometheus опрашивает каждый.
+
+Выключить сбор: METRICS_ENABLED=0 (эндпоинты /metrics и /healthz останутся).
+"""
+import os
+import threading
+import time
+
+from flask import Response, g, jsonify, request
+from sqlalchemy import event, text
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+
+# Границы корзин гистограмм
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+SQL_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+PREFIX = 'shelter'
+
+
+class Histogram:
+    """Гистограмма с метками: счетчики корзин, сумма и количество наблюдений"""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple, label_names: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_names = label_names
+        self._series = {}  # значения меток -> [счетчики корзин..., +Inf], сумма
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(series.items()):
+            lines.extend(histogram_lines(self.name, dict(zip(self.label_names, labels)), self.buckets, counts, total))
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def histogram_lines(name: str, labels: dict, buckets: tuple, counts: list, total: float) -> list:
+    """Строки одной серии гистограммы; counts - по корзинам (не накопительно), последняя - +Inf"""
+    lines = []
+    cumulative = 0
+    for bound, count in zip([*buckets, '+Inf'], counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{format_labels(dict(labels, le=bound))} {cumulative}')
+    lines.append(f'{name}_sum{format_labels(labels)} {total}')
+    lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+    return lines
+
+
+def metric_lines(name: str, kind: str, help_text: str, samples: list) -> list:
+    """Строки счетчика или gauge; samples - список пар (метки, значение)"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    lines.extend(f'{name}{format_labels(labels)} {value}' for labels, value in samples)
+    return lines
+
+
+class Metrics:
+    """Метрики HTTP-запросов и SQL одного процесса API"""
+
+    def __init__(self):
+        self.request_duration = Histogram(
+            f'{PREFIX}_http_request_duration_seconds', 'Время обработки HTTP-запроса',
+            REQUEST_BUCKETS, ('route', 'method', 'status')
+        )
+        self.request_sql_queries = Histogram(
+            f'{PREFIX}_http_request_sql_queries', 'SQL-запросов на один HTTP-запрос',
+            SQL_COUNT_BUCKETS, ('route', 'method')
+        )
+        self.request_sql_duration = Histogram(
+            f'{PREFIX}_http_request_sql_duration_seconds', 'Время SQL-запросов на один HTTP-запрос',
+            SQL_TIME_BUCKETS, ('route', 'method')
+        )
+        self.collectors = []
+        self._in_flight = 0
+        # source (request/background) -> [запросов, секунд]
+        self._sql_totals = {'request': [0, 0.0], 'background': [0, 0.0]}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # ---------- HTTP ----------
+
+    def request_started(self):
+        self._local.sql = [0, 0.0]
+        with self._lock:
+            self._in_flight += 1
+
+    def request_finished(self, route: str, method: str, status: int, seconds: float):
+        sql_count, sql_seconds = getattr(self._local, 'sql', None) or (0, 0.0)
+        self._local.sql = None
+        with self._lock:
+            self._in_flight -= 1
+        self.request_duration.observe((route, method, str(status)), seconds)
+        self.request_sql_queries.observe((route, method), sql_count)
+        self.request_sql_duration.observe((route, method), sql_seconds)
+
+    # ---------- SQL ----------
+
+    def sql_executed(self, seconds: float):
+        """Учесть выполненный SQL-запрос текущего потока"""
+        current = getattr(self._local, 'sql', None)
+        if current is not None:
+            current[0] += 1
+            current[1] += seconds
+        with self._lock:
+            totals = self._sql_totals['request' if current is not None else 'background']
+            totals[0] += 1
+            totals[1] += seconds
+
+    # ---------- вывод ----------
+
+    def register_collector(self, collector):
+        """Добавить источник: функция без аргументов, возвращает список строк Prometheus"""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            in_flight = self._in_flight
+            sql_totals = {source: list(values) for source, values in self._sql_totals.items()}
+        lines = []
+        lines += self.request_duration.render()
+        lines += self.request_sql_queries.render()
+        lines += self.request_sql_duration.render()
+        lines += metric_lines(f'{PREFIX}_http_requests_in_flight', 'gauge', 'HTTP-запросов в обработке', [({}, in_flight)])
+        lines += metric_lines(
+            f'{PREFIX}_sql_queries_total', 'counter', 'Выполнено SQL-запросов',
+            [({'source': source}, values[0]) for source, values in sql_totals.items()]
+        )
+        lines += metric_lines(
+            f'{PREFIX}_sql_duration_seconds_total', 'counter', 'Суммарное время SQL-запросов',
+            [({'source': source}, round(values[1], 6)) for source, values in sql_totals.items()]
+        )
+        for collector in self.collectors:
+            try:
+                lines += collector()
+            except Exception as e:
+                print(f"[ERROR] metrics collector {getattr(collector, '__name__', collector)}: {e}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Обнулить метрики запросов и SQL (для тестов)"""
+        for histogram in (self.request_duration, self.request_sql_queries, self.request_sql_duration):
+            histogram.clear()
+        with self._lock:
+            for values in self._sql_totals.values():
+                values[0], values[1] = 0, 0.0
+
+
+metrics = Metrics()
+
+
+# ==================== ИСТОЧНИКИ ====================
+
+def yoomoney_collector(get_client):
+    """Метрики клиента YooMoney: get_client() возвращает YooMoneyClient"""
+    def collect() -> list:
+        stats = get_client().stats()
+        name = f'{PREFIX}_yoomoney'
+        counters = [
+            'requests', 'attempts', 'succeeded', 'failed', 'retries',
+            'timeouts', 'http_errors', 'connection_errors', 'request_errors', 'circuit_rejected'
+        ]
+        lines = []
+        for counter in counters:
+            lines += metric_lines(f'{name}_{counter}_total', 'counter', f'YooMoney: {counter}', [({}, stats[counter])])
+        buckets = stats['latency_buckets']
+        bounds = tuple(bound for bound in buckets if bound != float('inf'))
+        lines += [f'# HELP {name}_request_duration_seconds Время HTTP-запроса к YooMoney',
+                  f'# TYPE {name}_request_duration_seconds histogram']
+        lines += histogram_lines(f'{name}_request_duration_seconds', {}, bounds, list(buckets.values()),
+                                 round(stats['latency_sum'], 6))
+        lines += metric_lines(
+            f'{name}_circuit_state', 'gauge', 'Состояние circuit breaker (1 - текущее)',
+            [({'state': state}, int(stats['circuit_state'] == state)) for state in ('closed', 'open', 'half_open')]
+        )
+        return lines
+    return collect
+
+
+def rate_limit_collector(get_limiter):
+    """Счетчики ограничителя частоты: get_limiter() возвращает RateLimiter"""
+    def collect() -> list:
+        stats = get_limiter().stats()
+        return metric_lines(
+            f'{PREFIX}_rate_limit_requests_total', 'counter', 'Проверок ограничения частоты',
+            [({'rule': rule, 'result': result}, count)
+             for rule, counters in sorted(stats.items()) for result, count in sorted(counters.items())]
+        )
+    return collect
+
+
+def response_cache_collector(get_cache):
+    """Попадания и промахи кэша ответов: get_cache() возвращает ResponseCache"""
+    def collect() -> list:
+        stats = get_cache().stats()
+        name = f'{PREFIX}_response_cache'
+        lines = metric_lines(
+            f'{name}_requests_total', 'counter',
+            'Обращений к кэшу ответов (hit, miss, stale - устарела версия или срок, not_modified - ответ 304)',
+            [({'route': route, 'result': result}, counters[result])
+             for route, counters in sorted(stats['routes'].items())
+             for result in ('hit', 'miss', 'stale', 'not_modified')]
+        )
+        lines += metric_lines(f'{name}_evictions_total', 'counter', 'Записей вытеснено по LRU', [({}, stats['evictions'])])
+        lines += metric_lines(f'{name}_entries', 'gauge', 'Записей в кэше ответов', [({}, stats['entries'])])
+        lines += metric_lines(f'{name}_bytes', 'gauge', 'Объем тел ответов в кэше', [({}, stats['bytes'])])
+        return lines
+    return collect
+
+
+def events_collector(get_hub):
+    """Лента изменений для админки: get_hub() возвращает EventHub (events.py)"""
+    def collect() -> list:
+        stats = get_hub().stats()
+        name = f'{PREFIX}_events'
+        lines = metric_lines(
+            f'{name}_published_total', 'counter', 'Опубликовано событий ленты изменений',
+            [({'type': event_type}, count) for event_type, count in sorted(stats['published'].items())]
+        )
+        lines += metric_lines(f'{name}_clients', 'gauge', 'Подключенных клиентов SSE', [({}, stats['clients'])])
+        return lines
+    return collect
+
+
+# ==================== ПОДКЛЮЧЕНИЕ ====================
+
+def instrument_engine(engine):
+    """Считать SQL-запросы движка: время от before до after_cursor_execute"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['metrics_started'].pop()
+        metrics.sql_executed(time.perf_counter() - started)
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(context):
+        started = context.connection.info.get('metrics_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def init_app(app, engine):
+    """Подключить сбор метрик к приложению и добавить /metrics и /healthz"""
+    if METRICS_ENABLED:
+        instrument_engine(engine)
+
+        @app.before_request
+        def _start_timer():
+            g.metrics_started = time.perf_counter()
+            metrics.request_started()
+
+        @app.after_request
+        def _remember_status(response):
+            g.metrics_status = response.status_code
+            return response
+
+        @app.teardown_request
+        def _record_request(exc):
+            # teardown - после отдачи потокового ответа (CSV/XLSX), поэтому время полное
+            started = g.pop('metrics_started', None)
+            if started is None:
+                return
+            status = 500 if exc is not None else g.pop('metrics_status', 500)
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics.request_finished(route, request.method, status, time.perf_counter() - started)
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        """Метрики в текстовом формате Prometheus"""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        """Проверка живости: SELECT 1 в БД и его задержка"""
+        started = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+        except Exception as e:
+            print(f"[ERROR] healthz: {e}")
+            return jsonify({'status': 'error', 'error': str(e)}), 503
+        return jsonify({'status': 'ok', 'db_latency_ms': round((time.perf_counter() - started) * 1000, 3)})
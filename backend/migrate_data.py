@@ -7,7 +7,7 @@
 import json
 import os
 from datetime import datetime
-from database import init_db, SessionLocal, User, Donation
+from database import init_db, SessionLocal, Donation, existing_donation_ids, resolve_user_ids
 
 def migrate_donations():
     """Миграция донатов из data/donations.json в БД"""
@@ -26,37 +26,23 @@ def migrate_donations():
         with open(donations_file, 'r', encoding='utf-8') as f:
             data = json.load(f)
         
-        count = 0
-        skipped = 0
+        # Уже перенесенные донаты - запросом на пачку id, а не по строке
+        records = data.get('donations', [])
+        existing_ids = existing_donation_ids(db.connection(), [d.get('id') for d in records])
+        skipped = sum(1 for d in records if d.get('id') in existing_ids)
+        records = [d for d in records if d.get('id') not in existing_ids]
         
-        for d in data.get('donations', []):
-            # Проверяем, не существует ли уже
-            existing = db.query(Donation).filter(Donation.id == d.get('id')).first()
-            if existing:
-                skipped += 1
-                continue
-            
-            # Получаем или создаем пользователя
+        # Пользователи всех донатов - одним UPSERT ... RETURNING на пачку телефонов
+        user_ids = resolve_user_ids(db.connection(), [
+            (d.get('userPhone', ''), d.get('userEmail', ''), d.get('userName', '')) for d in records
+        ])
+        
+        count = 0
+        for d in records:
             phone = d.get('userPhone', '')
             email = d.get('userEmail', '')
             name = d.get('userName', '')
             
-            user = None
-            if phone:
-                user = db.query(User).filter(User.phone == phone).first()
-                if not user:
-                    user = User(phone=phone, email=email, full_name=name)
-                    db.add(user)
-                    db.commit()
-                    db.refresh(user)
-                else:
-                    # Обновляем данные
-                    if email and user.email != email:
-                        user.email = email
-                    if name and user.full_name != name:
-                        user.full_name = name
-                    db.commit()
-            
             # Создаем донат
             donation_date = d.get('date', datetime.utcnow().isoformat())
             try:
@@ -69,7 +55,7 @@ def migrate_donations():
             
             donation = Donation(
                 id=d.get('id'),
-                user_id=user.id if user else None,
+                user_id=user_ids.get(phone),
                 public_name=name or 'Анонимно',
                 phone=phone if phone else None,
                 email=email if email else None,
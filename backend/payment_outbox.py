@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Асинхронное создание платежей у провайдера (transactional outbox)
+
+POST /api/donations в одной транзакции записывает донат и задание
+payment_intents и сразу отвечает клиенту. Платеж в YooMoney создают
+воркеры этого модуля: забирают задания пачками с арендой (claimed_by,
+claim_expires_at), вызывают провайдера и сохраняют ссылку на оплату.
+Если воркер упал, задание после истечения аренды заберет другой; повторный
+запрос уходит с тем же Idempotence-Key, поэтому второй платеж не создается.
+
+Воркеры запускаются внутри app.py (PAYMENT_WORKERS потоков) или отдельным процессом:
+    python payment_outbox.py              # PAYMENT_WORKERS потоков
+    python payment_outbox.py 8            # 8 потоков
+"""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import update, select, or_, and_
+
+from database import engine, SessionLocal, Donation, PaymentIntent, query_scope
+from events import donation_status_event, publish_many
+
+# Количество потоков-воркеров (0 - не запускать внутри app.py, только отдельным процессом)
+PAYMENT_WORKERS = int(os.getenv('PAYMENT_WORKERS', '4'))
+# Сколько заданий воркер забирает за раз
+PAYMENT_CLAIM_BATCH = int(os.getenv('PAYMENT_CLAIM_BATCH', '5'))
+# Время аренды задания: после него задание упавшего воркера заберет другой
+PAYMENT_LEASE_SECONDS = int(os.getenv('PAYMENT_LEASE_SECONDS', '120'))
+# Попыток создать платеж, прежде чем донат помечается failed
+PAYMENT_MAX_ATTEMPTS = int(os.getenv('PAYMENT_MAX_ATTEMPTS', '5'))
+# Пауза перед повтором: base * 2^(попытка-1), не больше минуты
+PAYMENT_RETRY_BASE_SECONDS = float(os.getenv('PAYMENT_RETRY_BASE_SECONDS', '2'))
+# Как часто простаивающий воркер проверяет очередь (задания из других процессов)
+PAYMENT_POLL_INTERVAL = float(os.getenv('PAYMENT_POLL_INTERVAL', '1.0'))
+
+FINAL_STATUSES = ('created', 'failed')
+
+# Будит воркеры при новом задании и ожидающих клиентов при готовом платеже
+_changed = threading.Condition()
+_generation = 0
+_workers = []
+_stop = threading.Event()
+
+
+def _notify():
+    global _generation
+    with _changed:
+        _generation += 1
+        _changed.notify_all()
+
+
+def enqueue_payment(db, donation: Donation, description: str, return_url: str,
+                    metadata: dict, payment_method: str = 'card') -> PaymentIntent:
+    """
+    Добавить в сессию задание на создание платежа для доната
+
+    Коммит - на стороне вызывающего, вместе с донатом. После коммита
+    нужно вызвать notify_new_intents(), чтобы воркеры не ждали следующего опроса.
+    """
+    intent = PaymentIntent(
+        donation=donation,
+        amount=donation.amount,
+        description=description,
+        return_url=return_url,
+        payment_method=payment_method,
+        metadata_json=json.dumps(metadata, ensure_ascii=False),
+        idempotence_key=uuid.uuid4().hex,
+        status='queued',
+        next_attempt_at=datetime.utcnow()
+    )
+    db.add(intent)
+    return intent
+
+
+def notify_new_intents():
+    """Разбудить воркеры после коммита новых заданий"""
+    _notify()
+
+
+def claim_intents(worker_id: str, limit: int = PAYMENT_CLAIM_BATCH) -> list:
+    """
+    Забрать до limit заданий: готовые к попытке и задания с истекшей арендой
+
+    Выбор и захват - один UPDATE ... RETURNING, поэтому два воркера
+    (в том числе из разных процессов) не получат одно задание.
+    """
+    now = datetime.utcnow()
+    available = or_(
+        and_(PaymentIntent.status == 'queued', PaymentIntent.next_attempt_at <= now),
+        and_(PaymentIntent.status == 'processing', PaymentIntent.claim_expires_at < now)
+    )
+    candidates = select(PaymentIntent.id).where(available).order_by(PaymentIntent.id).limit(limit)
+    stmt = (
+        update(PaymentIntent)
+        .where(PaymentIntent.id.in_(candidates.scalar_subquery()), available)
+        .values(
+            status='processing',
+            claimed_by=worker_id,
+            claim_expires_at=now + timedelta(seconds=PAYMENT_LEASE_SECONDS),
+            attempts=PaymentIntent.attempts + 1,
+            updated_at=now
+        )
+        .returning(PaymentIntent.id)
+    )
+    with engine.begin() as conn:
+        return [row[0] for row in conn.execute(stmt)]
+
+
+def process_intent(intent_id: int, worker_id: str, create_payment) -> str:
+    """
+    Создать платеж у провайдера для захваченного задания
+
+    Возвращает итоговый статус задания. Вызов провайдера идет вне транзакции:
+    медленный провайдер не держит блокировку БД.
+    """
+    db = SessionLocal()
+    try:
+        intent = db.get(PaymentIntent, intent_id)
+        if not intent or intent.status != 'processing' or intent.claimed_by != worker_id:
+            return intent.status if intent else 'missing'
+        request_args = dict(
+            amount=float(intent.amount),
+            description=intent.description,
+            return_url=intent.return_url,
+            metadata=json.loads(intent.metadata_json or '{}'),
+            payment_method=intent.payment_method,
+            idempotence_key=intent.idempotence_key
+        )
+        attempts = intent.attempts
+        db.rollback()  # Закрываем транзакцию чтения на время запроса к провайдеру
+
+        try:
+            payment_response = create_payment(**request_args)
+            error = None
+        except Exception as e:
+            payment_response = None
+            error = str(e) or e.__class__.__name__
+
+        intent = db.get(PaymentIntent, intent_id)
+        if intent.status in FINAL_STATUSES:
+            # Задание уже завершил другой воркер (наша аренда истекла)
+            return intent.status
+
+        now = datetime.utcnow()
+        status_events = []
+        intent.updated_at = now
+        intent.claimed_by = None
+        intent.claim_expires_at = None
+        if payment_response is not None:
+            intent.status = 'created'
+            intent.confirmation_url = (payment_response.get('confirmation') or {}).get('confirmation_url')
+            intent.last_error = None
+            intent.donation.provider_payment_id = payment_response.get('id')
+            intent.donation.provider = 'yoomoney'
+        elif attempts >= PAYMENT_MAX_ATTEMPTS:
+            print(f"[ERROR] Платеж для доната {intent.donation_id} не создан: {error}")
+            intent.status = 'failed'
+            intent.last_error = error
+            intent.donation.status = 'failed'
+            status_events.append(donation_status_event(intent.donation))
+        else:
+            delay = min(PAYMENT_RETRY_BASE_SECONDS * 2 ** (attempts - 1), 60)
+            print(f"[WARNING] Платеж для доната {intent.donation_id}: попытка {attempts} неудачна ({error}), повтор через {delay} с")
+            intent.status = 'queued'
+            intent.last_error = error
+            intent.next_attempt_at = now + timedelta(seconds=delay)
+        db.commit()
+        publish_many('donation.status', status_events)
+        return intent.status
+    except Exception as e:
+        print(f"[ERROR] process_intent {intent_id}: {e}")
+        db.rollback()
+        return 'error'
+    finally:
+        db.close()
+        _notify()
+
+
+def run_once(create_payment, worker_id: str, limit: int = PAYMENT_CLAIM_BATCH) -> int:
+    """Забрать пачку заданий и обработать ее. Возвращает количество обработанных заданий"""
+    with query_scope('payment_outbox'):
+        intent_ids = claim_intents(worker_id, limit)
+        for intent_id in intent_ids:
+            process_intent(intent_id, worker_id, create_payment)
+    return len(intent_ids)
+
+
+def _worker_loop(create_payment, worker_id: str):
+    while not _stop.is_set():
+        with _changed:
+            generation = _generation
+        try:
+            processed = run_once(create_payment, worker_id)
+        except Exception as e:
+            print(f"[ERROR] Воркер платежей {worker_id}: {e}")
+            processed = 0
+        if processed:
+            continue
+        with _changed:
+            if _generation == generation and not _stop.is_set():
+                _changed.wait(PAYMENT_POLL_INTERVAL)
+
+
+def start_payment_workers(create_payment, workers: int = PAYMENT_WORKERS) -> int:
+    """
+    Запустить потоки-воркеры, если они еще не запущены
+
+    create_payment - функция создания платежа у провайдера
+    (см. create_yoomoney_payment в app.py). Возвращает число живых воркеров.
+    """
+    global _workers
+    with _changed:
+        _workers = [thread for thread in _workers if thread.is_alive()]
+        if _workers or workers <= 0:
+            return len(_workers)
+        _stop.clear()
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        for number in range(workers):
+            thread = threading.Thread(
+                target=_worker_loop,
+                args=(create_payment, f'{prefix}:{number}'),
+                name=f'payment-worker-{number}',
+                daemon=True
+            )
+            thread.start()
+            _workers.append(thread)
+        return len(_workers)
+
+
+def stop_payment_workers(timeout: float = 5.0):
+    """Остановить потоки-воркеры (текущие запросы к провайдеру доработают)"""
+    _stop.set()
+    _notify()
+    for thread in _workers:
+        thread.join(timeout)
+
+
+def intent_snapshot(intent: PaymentIntent) -> dict:
+    """Состояние задания для ответа клиенту"""
+    return {
+        'donation_id': intent.donation_id,
+        'payment_status': intent.status,
+        'payment_url': intent.confirmation_url,
+        'attempts': intent.attempts,
+        'error': intent.last_error if intent.status == 'failed' else None
+    }
+
+
+def wait_for_intent(donation_id: int, timeout: float = 0) -> dict:
+    """
+    Дождаться, пока платеж для доната будет создан или окончательно не удастся
+
+    Ждет не дольше timeout секунд (0 - просто вернуть текущее состояние).
+    Возвращает intent_snapshot() или None, если задания нет.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        with _changed:
+            generation = _generation
+        db = SessionLocal()
+        try:
+            intent = db.query(PaymentIntent).filter(PaymentIntent.donation_id == donation_id).first()
+            snapshot = intent_snapshot(intent) if intent else None
+        finally:
+            db.close()
+
+        remaining = deadline - time.monotonic()
+        if snapshot is None or snapshot['payment_status'] in FINAL_STATUSES or remaining <= 0:
+            return snapshot
+        with _changed:
+            # Воркер другого процесса нас не разбудит - перечитываем БД не реже POLL_INTERVAL
+            if _generation == generation:
+                _changed.wait(min(remaining, PAYMENT_POLL_INTERVAL))
+
+
+def main(argv) -> int:
+    """Запуск воркеров отдельным процессом"""
+    from app import create_yoomoney_payment
+
+    workers = int(argv[1]) if len(argv) > 1 else max(PAYMENT_WORKERS, 1)
+    start_payment_workers(create_yoomoney_payment, workers)
+    print(f"[OK] Воркеры платежей запущены: {workers}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_payment_workers()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
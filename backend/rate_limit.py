@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ограничение частоты запросов (token bucket)
+
+Каждое правило - "емкость/период": ведро на ключ (телефон, IP) вмещает
+capacity запросов и пополняется равномерно, capacity токенов за period секунд.
+Запрос без свободного токена получает 429 с заголовком Retry-After.
+
+Бэкенды (переменная RATE_LIMIT_BACKEND):
+- memory (по умолчанию) - ведра в памяти процесса: проверка O(1), без обращения к БД;
+- sqlite - общий файл SQLite (RATE_LIMIT_DB_PATH) для нескольких процессов API:
+  одна атомарная UPSERT ... RETURNING на проверку (локальный файл, без сети).
+
+Правила задаются переменными окружения:
+    RATE_LIMIT_SEND_CODE_PHONE=3/60   # 3 кода на номер в минуту
+    RATE_LIMIT_SEND_CODE_IP=20/60
+    RATE_LIMIT_DONATIONS_IP=30/60
+    RATE_LIMIT_DONATIONS_PHONE=10/60
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from itertools import count, islice
+
+from database import DB_PATH
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()
+RATE_LIMIT_DB_PATH = os.getenv('RATE_LIMIT_DB_PATH', os.path.join(os.path.dirname(DB_PATH), 'rate_limits.db'))
+# Максимум ведер в памяти: сверх него удаляются только уже пополнившиеся ведра
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+# Сколько самых старых ведер просматривается в поисках пополнившегося
+RATE_LIMIT_EVICT_SCAN = 16
+# SQLite: раз в столько проверок из файла удаляются ведра, которые уже пополнились
+RATE_LIMIT_PRUNE_EVERY = int(os.getenv('RATE_LIMIT_PRUNE_EVERY', '1000'))
+
+
+def parse_rate(value: str) -> tuple:
+    """'5/60' -> (5, 60.0): емкость ведра и период полного пополнения в секундах"""
+    capacity, period = value.split('/')
+    capacity, period = int(capacity), float(period)
+    if capacity <= 0 or period <= 0:
+        raise ValueError(f"Недопустимое ограничение частоты: {value}")
+    return capacity, period
+
+
+DEFAULT_RULES = {
+    'send-code:phone': parse_rate(os.getenv('RATE_LIMIT_SEND_CODE_PHONE', '3/60')),
+    'send-code:ip': parse_rate(os.getenv('RATE_LIMIT_SEND_CODE_IP', '20/60')),
+    'donations:ip': parse_rate(os.getenv('RATE_LIMIT_DONATIONS_IP', '30/60')),
+    'donations:phone': parse_rate(os.getenv('RATE_LIMIT_DONATIONS_PHONE', '10/60')),
+}
+
+
+class MemoryBuckets:
+    """
+    Ведра в памяти процесса
+
+    Полное ведро неотличимо от нового, поэтому при переполнении удаляются
+    только ведра, которые уже пополнились. Если все старые ведра еще
+    пополняются, новый ключ ждет, пока освободится место: иначе клиент мог бы
+    вытеснить свое пустое ведро потоком запросов с других ключей и получить полное.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # ключ -> [токены, время обновления, время полного пополнения]
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, rate: float, now: float) -> float:
+        """Взять токен. Возвращает 0, если запрос разрешен, иначе сколько секунд ждать"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    wait = self._make_room(now)
+                    if wait:
+                        return wait
+                bucket = self._buckets[key] = [float(capacity), now, now]
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                wait = 0.0
+            else:
+                wait = (1 - bucket[0]) / rate
+            bucket[2] = now + (capacity - bucket[0]) / rate
+            return wait
+
+    def _make_room(self, now: float) -> float:
+        """
+        Удалить пополнившиеся ведра среди самых старых
+
+        Возвращает 0, если место освободилось, иначе через сколько секунд
+        пополнится ближайшее из просмотренных ведер.
+        """
+        freed, wait = False, math.inf
+        for key in list(islice(self._buckets, RATE_LIMIT_EVICT_SCAN)):
+            full_at = self._buckets[key][2]
+            if full_at <= now:
+                del self._buckets[key]
+                freed = True
+            else:
+                wait = min(wait, full_at - now)
+        return 0.0 if freed or wait == math.inf else wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBuckets:
+    """
+    Ведра в общем файле SQLite
+
+    Пополнение, проверка и списание - один оператор UPSERT, поэтому два
+    процесса не могут потратить один и тот же токен. Вместе с ведром хранится
+    время его полного пополнения (full_at): раз в prune_every проверок
+    пополнившиеся ведра удаляются - полное ведро неотличимо от нового.
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_DB_PATH, prune_every: int = RATE_LIMIT_PRUNE_EVERY):
+        self.path = path
+        self.prune_every = prune_every
+        self._takes = count(1)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                allowed INTEGER NOT NULL,
+                full_at REAL NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(rate_buckets)')}
+        if 'full_at' not in columns:
+            # Файл от предыдущей версии: старые ведра считаются пополнившимися
+            conn.execute('ALTER TABLE rate_buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_rate_buckets_full_at ON rate_buckets (full_at)')
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # В режиме WAL NORMAL не повреждает файл при сбое питания, теряются только последние записи
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, capacity: int, rate: float, now: float) -> float:
+        # В DO UPDATE все выражения видят старые значения строки
+        refill = 'min(:capacity, tokens + (:now - updated_at) * :rate)'
+        tokens = f'CASE WHEN {refill} >= 1 THEN {refill} - 1 ELSE {refill} END'
+        row = self._conn().execute(f'''
+            INSERT INTO rate_buckets (key, tokens, updated_at, allowed, full_at)
+            VALUES (:key, :capacity - 1, :now, 1, :now + 1 / :rate)
+            ON CONFLICT(key) DO UPDATE SET
+                tokens = {tokens},
+                updated_at = :now,
+                allowed = {refill} >= 1,
+                full_at = :now + (:capacity - ({tokens})) / :rate
+            RETURNING tokens, allowed
+        ''', {'key': key, 'capacity': capacity, 'rate': rate, 'now': now}).fetchone()
+        tokens, allowed = row
+        if self.prune_every > 0 and next(self._takes) % self.prune_every == 0:
+            self.prune(now)
+        return 0.0 if allowed else (1 - tokens) / rate
+
+    def prune(self, now: float) -> int:
+        """Удалить ведра, которые к моменту now уже пополнились. Возвращает число удаленных"""
+        return self._conn().execute('DELETE FROM rate_buckets WHERE full_at <= ?', (now,)).rowcount
+
+    def clear(self):
+        self._conn().execute('DELETE FROM rate_buckets')
+
+
+class RateLimiter:
+    """Набор правил поверх одного бэкенда ведер со счетчиками"""
+
+    def __init__(self, rules: dict = None, buckets=None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.rules = dict(DEFAULT_RULES if rules is None else rules)
+        self.buckets = buckets if buckets is not None else MemoryBuckets()
+        self.enabled = enabled
+        self._counters = {rule: {'allowed': 0, 'limited': 0} for rule in self.rules}
+        self._lock = threading.Lock()
+
+    def hit(self, rule: str, key: str) -> float:
+        """
+        Учесть запрос по правилу rule для ключа key (телефон, IP)
+
+        Возвращает 0, если запрос разрешен, иначе рекомендуемую паузу в секундах.
+        Пустой ключ и неизвестное правило не ограничиваются.
+        """
+        if not self.enabled or not key or rule not in self.rules:
+            return 0.0
+        capacity, period = self.rules[rule]
+        wait = self.buckets.take(f'{rule}:{key}', capacity, capacity / period, time.time())
+        with self._lock:
+            self._counters[rule]['limited' if wait else 'allowed'] += 1
+        return wait
+
+    def check(self, *checks) -> int:
+        """
+        Проверить несколько правил (пары rule, key) по порядку
+
+        Возвращает 0 или значение Retry-After в целых секундах для первого сработавшего правила.
+        """
+        for rule, key in checks:
+            wait = self.hit(rule, key)
+            if wait:
+                return max(1, math.ceil(wait))
+        return 0
+
+    def stats(self) -> dict:
+        """Счетчики разрешенных и отклоненных запросов по правилам"""
+        with self._lock:
+            return {rule: dict(counters) for rule, counters in self._counters.items()}
+
+    def reset(self):
+        """Очистить ведра и счетчики"""
+        self.buckets.clear()
+        with self._lock:
+            for counters in self._counters.values():
+                counters['allowed'] = counters['limited'] = 0
+
+
+def create_rate_limiter(kind: str = None) -> RateLimiter:
+    """Создать ограничитель по имени бэкенда (по умолчанию из RATE_LIMIT_BACKEND)"""
+    kind = (kind or RATE_LIMIT_BACKEND).lower()
+    if kind == 'memory':
+        return RateLimiter(buckets=MemoryBuckets())
+    if kind == 'sqlite':
+        return RateLimiter(buckets=SQLiteBuckets())
+    raise ValueError(f"Неизвестный бэкенд ограничения частоты: {kind}")
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Обработчик регулярных списаний по подпискам
+
+Подписки, у которых наступил next_charge_at, забираются пачками с арендой
+(claimed_by, claim_expires_at): выбор и захват - один UPDATE ... RETURNING,
+поэтому несколько процессов или потоков могут работать одновременно без
+двойных списаний. Платежи создаются параллельно (не больше concurrency
+запросов к провайдеру). Ключ идемпотентности привязан к подписке и периоду
+списания: если процесс упал после запроса к провайдеру, повтор после
+истечения аренды вернет тот же платеж, а не создаст второй.
+
+Каждая пачка обрабатывается за постоянное число SQL-запросов:
+подготовка (подписки вместе с пользователями и способами оплаты, массовая
+вставка pending-донатов, приостановка подписок без способа оплаты),
+параллельные запросы к провайдеру и сохранение результатов (executemany).
+
+Запуск:
+    python recurring_charges.py                     # один проход (для cron)
+    python recurring_charges.py --worker            # постоянный воркер, проход раз в --interval секунд
+    python recurring_charges.py --concurrency 16 --batch 200
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import update, select, or_, and_, bindparam
+from sqlalchemy.orm import joinedload
+
+from database import (
+    engine, SessionLocal, Donation, Subscription, apply_donation_stat_deltas, new_donations_stat_deltas,
+    bump_data_versions, donation_stat_versions, query_scope
+)
+from events import publish_many
+
+# Сколько подписок забирать за раз
+RECURRING_BATCH_SIZE = int(os.getenv('RECURRING_BATCH_SIZE', '100'))
+# Одновременных запросов к провайдеру
+RECURRING_CONCURRENCY = int(os.getenv('RECURRING_CONCURRENCY', '8'))
+# Аренда пачки; должна с запасом покрывать ее обработку
+RECURRING_LEASE_SECONDS = int(os.getenv('RECURRING_LEASE_SECONDS', '300'))
+# Через сколько секунд повторить списание, если провайдер вернул ошибку
+RECURRING_RETRY_SECONDS = int(os.getenv('RECURRING_RETRY_SECONDS', '600'))
+# Пауза между проходами постоянного воркера
+RECURRING_INTERVAL = int(os.getenv('RECURRING_INTERVAL', '60'))
+
+BASE_URL = os.getenv('BASE_URL', 'http://localhost:8000')
+
+_stop = threading.Event()
+
+
+def calculate_next_charge_date(frequency: str, from_date: datetime = None) -> datetime:
+    """Вычислить дату следующего списания"""
+    if from_date is None:
+        from_date = datetime.utcnow()
+    
+    if frequency == 'weekly':
+        return from_date + timedelta(weeks=1)
+    elif frequency == 'monthly':
+        return from_date + relativedelta(months=1)
+    elif frequency == 'quarterly':
+        return from_date + relativedelta(months=3)
+    else:
+        return from_date + relativedelta(months=1)  # По умолчанию месяц
+
+
+class ChargeRunStats:
+    """Счетчики прохода: итоги по подпискам и скорость обработки"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.outcomes = {'charged': 0, 'paused': 0, 'failed': 0, 'skipped': 0}
+        self._lock = threading.Lock()
+
+    def add_many(self, outcomes: dict):
+        with self._lock:
+            for outcome, count in outcomes.items():
+                self.outcomes[outcome] = self.outcomes.get(outcome, 0) + count
+
+    @property
+    def processed(self) -> int:
+        return sum(self.outcomes.values())
+
+    def as_dict(self) -> dict:
+        elapsed = time.monotonic() - self.started
+        return {
+            **self.outcomes,
+            'processed': self.processed,
+            'seconds': round(elapsed, 3),
+            'per_second': round(self.processed / elapsed, 1) if elapsed > 0 else 0.0
+        }
+
+
+def claim_due_subscriptions(worker_id: str, limit: int = RECURRING_BATCH_SIZE, now: datetime = None) -> list:
+    """Забрать до limit подписок к списанию, свободных или с истекшей арендой"""
+    now = now or datetime.utcnow()
+    available = and_(
+        Subscription.status == 'active',
+        Subscription.next_charge_at <= now,
+        or_(Subscription.claim_expires_at.is_(None), Subscription.claim_expires_at < now)
+    )
+    candidates = select(Subscription.id).where(available).order_by(Subscription.next_charge_at).limit(limit)
+    stmt = (
+        update(Subscription)
+        .where(Subscription.id.in_(candidates.scalar_subquery()), available)
+        .values(claimed_by=worker_id, claim_expires_at=now + timedelta(seconds=RECURRING_LEASE_SECONDS))
+        .returning(Subscription.id)
+    )
+    with engine.begin() as conn:
+        return [row[0] for row in conn.execute(stmt)]
+
+
+def prepare_charges(db, subscription_ids: list, worker_id: str) -> tuple:
+    """
+    Подготовить пачку списаний: подписки с пользователями и способами оплаты
+    одним запросом, приостановка подписок без способа оплаты одним UPDATE
+    и pending-донаты одной массовой вставкой
+
+    Возвращает (charges, paused): список подготовленных списаний и число приостановленных.
+    Pending-донат без платежа, оставшийся от прошлой неудачной попытки того же
+    периода, используется повторно, а не создается заново.
+    """
+    subscriptions = (
+        db.query(Subscription)
+        .options(joinedload(Subscription.user), joinedload(Subscription.payment_method))
+        .filter(Subscription.id.in_(subscription_ids), Subscription.claimed_by == worker_id)
+        .all()
+    )
+
+    to_pause = {
+        s.id for s in subscriptions
+        if not s.payment_method or not s.payment_method.provider_payment_token
+    }
+    chargeable = [s for s in subscriptions if s.id not in to_pause]
+
+    leftovers = {}
+    if chargeable:
+        rows = db.query(Donation.id, Donation.subscription_id, Donation.created_at).filter(
+            Donation.subscription_id.in_([s.id for s in chargeable]),
+            Donation.status == 'pending',
+            Donation.provider_payment_id.is_(None)
+        ).all()
+        periods = {s.id: s.next_charge_at for s in chargeable}
+        for donation_id, subscription_id, created_at in rows:
+            if created_at and created_at >= periods[subscription_id]:
+                leftovers[subscription_id] = donation_id
+
+    now = datetime.utcnow()
+    new_rows = []
+    for subscription in chargeable:
+        if subscription.id in leftovers:
+            continue
+        user = subscription.user
+        new_rows.append({
+            'user_id': subscription.user_id,
+            'public_name': user.full_name if user and user.full_name else 'Анонимно',
+            'phone': user.phone if user else None,
+            'email': user.email if user else None,
+            'amount': subscription.amount,
+            'purpose': subscription.purpose,
+            'is_recurring': True,
+            'subscription_id': subscription.id,
+            'status': 'pending',
+            'provider': 'yoomoney',
+            'paid_at': None,
+            'created_at': now
+        })
+
+    # Значения подписок читаем до commit: после него объекты expired и перечитывались бы по одной
+    prepared = [
+        (s.id, s.next_charge_at, s.frequency, float(s.amount), s.purpose, s.user_id)
+        for s in chargeable
+    ]
+
+    connection = db.connection()
+    if to_pause:
+        # Нет способа оплаты - помечаем подписки как проблемные
+        connection.execute(
+            update(Subscription.__table__)
+            .where(Subscription.__table__.c.id.in_(list(to_pause)), Subscription.__table__.c.claimed_by == worker_id)
+            .values(status='paused', claimed_by=None, claim_expires_at=None)
+        )
+    if new_rows:
+        inserted = connection.execute(
+            # RETURNING отдает и subscription_id, поэтому порядок строк не важен,
+            # и SQLAlchemy вставляет их многострочными INSERT
+            Donation.__table__.insert().returning(Donation.__table__.c.id, Donation.__table__.c.subscription_id),
+            new_rows
+        )
+        for donation_id, subscription_id in inserted:
+            leftovers[subscription_id] = donation_id
+        # Вставка в обход ORM: сводку по дням и версии для кэша ответов обновляем сами
+        deltas = new_donations_stat_deltas(new_rows)
+        apply_donation_stat_deltas(connection, deltas)
+        bump_data_versions(connection, {'donations', *donation_stat_versions(deltas)})
+    if to_pause:
+        bump_data_versions(connection, {'subscriptions'})
+    db.commit()
+
+    charges = []
+    for subscription_id, period, frequency, amount, purpose, user_id in prepared:
+        donation_id = leftovers[subscription_id]
+        charges.append({
+            'subscription_id': subscription_id,
+            'donation_id': donation_id,
+            'period': period,
+            'frequency': frequency,
+            'event': {'id': subscription_id, 'user_id': user_id, 'donation_id': donation_id,
+                      'amount': amount, 'purpose': purpose},
+            'request': dict(
+                amount=amount,
+                description=f"Регулярное пожертвование: {purpose}",
+                return_url=f"{BASE_URL}/frontend/profile.html",
+                metadata={
+                    'donation_id': donation_id,
+                    'subscription_id': subscription_id,
+                    'user_id': user_id
+                },
+                idempotence_key=f'recurring-{subscription_id}-{period:%Y%m%d%H%M%S}'
+            )
+        })
+    return charges, len(to_pause)
+
+
+def _request_payment(charge: dict, create_payment) -> dict:
+    """Запрос к провайдеру для одного списания (выполняется в пуле потоков)"""
+    try:
+        charge['payment_id'] = create_payment(**charge['request']).get('id')
+    except Exception as e:
+        print(f"[ERROR] Failed to process subscription {charge['subscription_id']}: {e}")
+        charge['payment_id'] = None
+    return charge
+
+
+def finalize_charges(db, charges: list, worker_id: str) -> dict:
+    """
+    Сохранить результаты пачки одной транзакцией
+
+    ID платежей донатов и новые даты списания пишутся двумя executemany.
+    Первым идет UPDATE ... RETURNING по аренде: он берет блокировку записи
+    и отсекает подписки, аренду которых за это время перехватил другой обработчик.
+    Неудачные списания повторятся через RECURRING_RETRY_SECONDS (pending-донат
+    останется и будет использован повторно).
+    """
+    outcomes = {'charged': 0, 'failed': 0, 'skipped': 0}
+    if not charges:
+        return outcomes
+
+    table = Subscription.__table__
+    now = datetime.utcnow()
+    connection = db.connection()
+    owned = dict(connection.execute(
+        update(table)
+        .where(table.c.id.in_([c['subscription_id'] for c in charges]), table.c.claimed_by == worker_id)
+        .values(claim_expires_at=now + timedelta(seconds=RECURRING_LEASE_SECONDS))
+        .returning(table.c.id, table.c.next_charge_at)
+    ).all())
+
+    succeeded, failed = [], []
+    for charge in charges:
+        if owned.get(charge['subscription_id']) != charge['period']:
+            outcomes['skipped'] += 1
+        elif charge['payment_id'] is None:
+            failed.append(charge)
+        else:
+            succeeded.append(charge)
+
+    if succeeded:
+        donations = Donation.__table__
+        connection.execute(
+            update(donations).where(donations.c.id == bindparam('b_donation_id'))
+            .values(provider_payment_id=bindparam('b_payment_id')),
+            [{'b_donation_id': c['donation_id'], 'b_payment_id': c['payment_id']} for c in succeeded]
+        )
+        connection.execute(
+            update(table).where(table.c.id == bindparam('b_subscription_id'))
+            .values(next_charge_at=bindparam('b_next_charge_at'), claimed_by=None, claim_expires_at=None),
+            [
+                {'b_subscription_id': c['subscription_id'],
+                 'b_next_charge_at': calculate_next_charge_date(c['frequency'], c['period'])}
+                for c in succeeded
+            ]
+        )
+        bump_data_versions(connection, {'donations', 'subscriptions'})
+    if failed:
+        connection.execute(
+            update(table)
+            .where(table.c.id.in_([c['subscription_id'] for c in failed]))
+            .values(claimed_by=None, claim_expires_at=now + timedelta(seconds=RECURRING_RETRY_SECONDS))
+        )
+    db.commit()
+    publish_many('subscription.charged', [c['event'] for c in succeeded])
+
+    outcomes['charged'] = len(succeeded)
+    outcomes['failed'] = len(failed)
+    return outcomes
+
+
+def charge_batch(subscription_ids: list, worker_id: str, create_payment, pool) -> dict:
+    """Подготовить, списать и сохранить одну захваченную пачку подписок"""
+    db = SessionLocal()
+    try:
+        charges, paused = prepare_charges(db, subscription_ids, worker_id)
+        charges = list(pool.map(lambda charge: _request_payment(charge, create_payment), charges))
+        outcomes = finalize_charges(db, charges, worker_id)
+        outcomes['paused'] = paused
+        outcomes['skipped'] += len(subscription_ids) - len(charges) - paused
+        return outcomes
+    except Exception as e:
+        # Аренда истечет, и пачку заберет следующий проход
+        print(f"[ERROR] Failed to process subscriptions {subscription_ids[:5]}...: {e}")
+        db.rollback()
+        return {'failed': len(subscription_ids)}
+    finally:
+        db.close()
+
+
+def run_due_charges(create_payment, worker_id: str = None, batch_size: int = RECURRING_BATCH_SIZE,
+                    concurrency: int = RECURRING_CONCURRENCY, now: datetime = None) -> dict:
+    """
+    Обработать все подписки, срок списания которых наступил
+
+    create_payment - функция создания платежа (create_yoomoney_payment из app.py).
+    Возвращает итоги прохода (ChargeRunStats.as_dict()).
+    """
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    stats = ChargeRunStats()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='recurring') as pool:
+        while not _stop.is_set():
+            with query_scope('recurring_charges'):
+                subscription_ids = claim_due_subscriptions(worker_id, batch_size, now)
+                if not subscription_ids:
+                    break
+                stats.add_many(charge_batch(subscription_ids, worker_id, create_payment, pool))
+            progress = stats.as_dict()
+            print(f"[INFO] Списания: обработано {progress['processed']} "
+                  f"({progress['per_second']}/с), {stats.outcomes}")
+
+    result = stats.as_dict()
+    if result['processed']:
+        print(f"[OK] Регулярные списания: {result}")
+    return result
+
+
+def run_worker(create_payment, interval: int = RECURRING_INTERVAL, **options):
+    """Постоянный воркер: проход раз в interval секунд до SIGTERM/SIGINT"""
+    _stop.clear()
+    while not _stop.is_set():
+        try:
+            run_due_charges(create_payment, **options)
+        except Exception as e:
+            print(f"[ERROR] process_recurring_charges: {e}")
+        _stop.wait(interval)
+
+
+def stop_worker(*_):
+    """Остановить постоянный воркер (текущая пачка доработает)"""
+    _stop.set()
+
+
+def main(argv) -> int:
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(description='Регулярные списания по подпискам')
+    parser.add_argument('--worker', action='store_true', help='работать постоянно, а не один проход')
+    parser.add_argument('--interval', type=int, default=RECURRING_INTERVAL, help='пауза между проходами, сек')
+    parser.add_argument('--batch', type=int, default=RECURRING_BATCH_SIZE, help='подписок в пачке')
+    parser.add_argument('--concurrency', type=int, default=RECURRING_CONCURRENCY,
+                        help='одновременных запросов к провайдеру')
+    args = parser.parse_args(argv[1:])
+
+    from app import create_yoomoney_payment
+
+    options = {'batch_size': args.batch, 'concurrency': args.concurrency}
+    if args.worker:
+        signal.signal(signal.SIGTERM, stop_worker)
+        signal.signal(signal.SIGINT, stop_worker)
+        print(f"[OK] Воркер регулярных списаний запущен (раз в {args.interval} с)")
+        run_worker(create_yoomoney_payment, args.interval, **options)
+    else:
+        run_due_charges(create_yoomoney_payment, **options)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш ответов админских эндпоинтов чтения
+
+Ответ хранится по ключу (маршрут, параметры запроса) вместе с версиями данных,
+от которых он зависит (таблица data_versions, см. database.py). Каждая запись
+донатов или подписок - создание, webhook, отмена, регулярное списание,
+миграция - увеличивает версию в той же транзакции, поэтому сброс видят все
+процессы. Проверка версий - один запрос по первичному ключу вместо пересчета.
+
+Итоги закрытого месяца зависят только от версии этого месяца и хранятся без
+ограничения по времени; остальные записи дополнительно живут не дольше
+RESPONSE_CACHE_TTL секунд (на случай правки БД в обход приложения).
+Память ограничена числом записей и суммарным размером тел: при переполнении
+удаляются дольше всех не использованные записи (LRU).
+
+Из тех же версий строится сильный ETag (begin_read/finish_read): клиент,
+приславший его в If-None-Match, получает 304 до основного запроса к БД.
+Вместе с версиями в ETag входят путь и параметры запроса (как в ключе кэша),
+чтобы ETag одной страницы не подошел к другой, и эпоха БД (случайное число,
+которое init_db записывает в новую БД), чтобы после пересоздания БД старые
+ETag не совпали. Параметры эндпоинт проверяет до begin_read: на некорректный
+запрос отвечает 400, а не 304.
+
+Настройки:
+    RESPONSE_CACHE_ENABLED=1           # 0 - выключить кэш
+    RESPONSE_CACHE_MAX_ENTRIES=1000
+    RESPONSE_CACHE_MAX_BYTES=33554432  # 32 МБ
+    RESPONSE_CACHE_TTL=300             # секунды, 0 - без ограничения
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, request
+
+from database import DATA_EPOCH
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', '1') == '1'
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '300'))
+
+# Заголовки, которые не кэшируются: их выставляет Flask или after_request заново
+_SKIP_HEADERS = {'content-length', 'x-cache'}
+# Результаты обращений, которые считаются по маршрутам
+RESULTS = ('hit', 'miss', 'stale', 'store', 'not_modified')
+
+_DEFAULT_TTL = object()
+
+
+class ResponseCache:
+    """LRU-кэш ответов с проверкой версий данных"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 ttl: float = RESPONSE_CACHE_TTL, enabled: bool = RESPONSE_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl or None
+        self.enabled = enabled
+        # ключ -> (версии, истекает в (monotonic) или None, тело, статус, заголовки)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # маршрут -> счетчики RESULTS
+        self._counters = {}
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(route: str, params) -> tuple:
+        """Ключ записи: маршрут и параметры запроса без учета их порядка"""
+        items = params.items(multi=True) if hasattr(params, 'getlist') else params.items()
+        return (route, tuple(sorted((str(name), str(value)) for name, value in items)))
+
+    def get(self, key: tuple, versions: tuple):
+        """Ответ из кэша, если он построен при тех же версиях данных и не истек, иначе None"""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._count(key[0], 'miss')
+                return None
+            cached_versions, expires_at, body, status, headers = entry
+            if cached_versions != versions or (expires_at is not None and expires_at <= now):
+                self._drop(key)
+                self._count(key[0], 'stale')
+                return None
+            self._entries.move_to_end(key)
+            self._count(key[0], 'hit')
+        response = Response(body, status=status, headers=headers)
+        response.headers['X-Cache'] = 'HIT'
+        return response
+
+    def put(self, key: tuple, versions, response: Response, ttl=_DEFAULT_TTL) -> Response:
+        """
+        Сохранить ответ (только 200) и вернуть его же
+
+        ttl - секунды жизни записи, None - без ограничения по времени
+        (по умолчанию RESPONSE_CACHE_TTL).
+        """
+        if not self.enabled:
+            return response
+        response.headers['X-Cache'] = 'MISS'
+        if response.status_code != 200 or response.is_streamed:
+            return response
+        body = response.get_data()
+        if len(body) > self.max_bytes:
+            return response
+        ttl = self.ttl if ttl is _DEFAULT_TTL else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        headers = [(name, value) for name, value in response.headers.items() if name.lower() not in _SKIP_HEADERS]
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (versions, expires_at, body, response.status_code, headers)
+            self._bytes += len(body)
+            self._count(key[0], 'store')
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self._evictions += 1
+        return response
+
+    def _drop(self, key: tuple):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry[2])
+
+    def _count(self, route: str, result: str):
+        counters = self._counters.setdefault(route, dict.fromkeys(RESULTS, 0))
+        counters[result] += 1
+
+    def count_not_modified(self, route: str):
+        """Учесть ответ 304 по If-None-Match"""
+        with self._lock:
+            self._count(route, 'not_modified')
+
+    def stats(self) -> dict:
+        """Счетчики по маршрутам, вытеснения, число записей и объем тел"""
+        with self._lock:
+            return {
+                'routes': {route: dict(counters) for route, counters in self._counters.items()},
+                'evictions': self._evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+            }
+
+    def clear(self):
+        """Очистить кэш и счетчики (для тестов)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._counters.clear()
+            self._evictions = 0
+
+
+response_cache = ResponseCache()
+
+
+def data_etag(names, versions, scope: tuple = ()) -> str:
+    """
+    Сильный ETag по версиям данных (без кавычек): меняется с каждой записью
+
+    scope - путь и параметры запроса (ключ кэша): у разных страниц разные ETag.
+    """
+    source = ';'.join(f'{name}={version}' for name, version in zip(names, versions))
+    source += '|' + repr(scope)
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:20]
+
+
+def begin_read(read_versions, names, params=None, cache: bool = True) -> tuple:
+    """
+    Начать обработку GET с ETag и кэшем ответов
+
+    Вызывается после проверки параметров запроса. read_versions(names) возвращает
+    версии данных (один запрос к data_versions); params - параметры ключа кэша
+    и ETag (по умолчанию request.args); cache=False - только ETag.
+    Возвращает (готовый ответ или None, состояние для finish_read): готовый ответ -
+    304, если If-None-Match совпал с текущим ETag, или ответ из кэша.
+    """
+    names = (DATA_EPOCH, *names)
+    versions = read_versions(names)
+    route = request.url_rule.rule
+    key = response_cache.make_key(route, request.args if params is None else params)
+    etag = data_etag(names, versions, (request.path, key[1]))
+    if request.if_none_match.contains(etag):
+        response_cache.count_not_modified(route)
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response, None
+
+    if not cache:
+        key = None
+    cached = response_cache.get(key, versions) if key else None
+    return cached, (key, versions, etag)
+
+
+def finish_read(read: tuple, response: Response, ttl=_DEFAULT_TTL) -> Response:
+    """Проставить ETag построенному ответу и сохранить его в кэш"""
+    key, versions, etag = read
+    if response.status_code == 200:
+        response.set_etag(etag)
+    if key is None:
+        return response
+    return response_cache.put(key, versions, response, ttl)
+
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилище сессий подтверждения телефона (send-code -> verify-code/register/login)
+
+Сессия - словарь с полями phone, code, method, created_at, expires_at.
+Хранилище ведет себя как словарь (store[id] = session, store.get(id),
+del store[id], clear()), но само удаляет истекшие сессии.
+
+Бэкенды (переменная SESSION_STORE):
+- memory (по умолчанию) - в памяти процесса: куча сроков истечения и
+  ограничение размера SESSION_MAX_SIZE с вытеснением давно не использованных (LRU);
+- sqlite - файл SQLite (SESSION_DB_PATH), общий для нескольких процессов
+  API (например, воркеров gunicorn).
+
+get() возвращает и истекшую, но еще не удаленную сессию: эндпоинты сами
+сравнивают expires_at, чтобы ответить "Код истек", а не "Сессия не найдена".
+"""
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from database import DB_PATH
+
+SESSION_STORE = os.getenv('SESSION_STORE', 'memory').lower()
+# Максимум сессий в памяти; самые давние по использованию вытесняются
+SESSION_MAX_SIZE = int(os.getenv('SESSION_MAX_SIZE', '200000'))
+# Срок жизни сессии, если в ней нет expires_at
+SESSION_DEFAULT_TTL = int(os.getenv('SESSION_DEFAULT_TTL', '300'))
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', os.path.join(os.path.dirname(DB_PATH), 'sessions.db'))
+# Как часто (секунды) SQLite-бэкенд удаляет истекшие сессии
+SESSION_PURGE_INTERVAL = float(os.getenv('SESSION_PURGE_INTERVAL', '30'))
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _expires_at(session: dict) -> float:
+    """Срок истечения сессии в секундах от эпохи (UTC)"""
+    expires_at = session.get('expires_at')
+    if not isinstance(expires_at, datetime):
+        expires_at = datetime.utcnow() + timedelta(seconds=SESSION_DEFAULT_TTL)
+    return (expires_at - _EPOCH).total_seconds()
+
+
+def _utc_now() -> float:
+    return time.time()
+
+
+class SessionStore(ABC):
+    """Общий интерфейс хранилищ сессий"""
+
+    @abstractmethod
+    def __setitem__(self, session_id: str, session: dict):
+        """Сохранить сессию (заменяет существующую с тем же id)"""
+
+    @abstractmethod
+    def get(self, session_id: str, default=None):
+        """Сессия по id или default; истекшая, но не удаленная, тоже возвращается"""
+
+    @abstractmethod
+    def __delitem__(self, session_id: str):
+        """Удалить сессию; отсутствующий id - KeyError"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Количество хранимых сессий"""
+
+    @abstractmethod
+    def clear(self):
+        """Удалить все сессии"""
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """Удалить истекшие сессии. Возвращает количество удаленных"""
+
+    def __getitem__(self, session_id: str) -> dict:
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def pop(self, session_id: str, default=None):
+        session = self.get(session_id)
+        if session is None:
+            return default
+        del self[session_id]
+        return session
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Сессии в памяти процесса
+
+    Истекшие сессии удаляются при каждой записи: вершина кучи (expires_at, id)
+    сравнивается с текущим временем, поэтому очистка стоит O(log n) на сессию
+    и не требует обхода всего словаря. При превышении max_size вытесняется
+    сессия, к которой дольше всего не обращались.
+    """
+
+    def __init__(self, max_size: int = SESSION_MAX_SIZE):
+        self.max_size = max_size
+        self.evicted = 0
+        self.expired = 0
+        self._data = OrderedDict()  # id -> (session, expires_at)
+        self._heap = []  # (expires_at, id); записи удаленных сессий пропускаются
+        self._lock = threading.Lock()
+
+    def __setitem__(self, session_id: str, session: dict):
+        expires_at = _expires_at(session)
+        with self._lock:
+            self._purge(_utc_now())
+            self._data[session_id] = (session, expires_at)
+            self._data.move_to_end(session_id)
+            heapq.heappush(self._heap, (expires_at, session_id))
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evicted += 1
+            # Устаревшие записи кучи (перезапись, удаление, вытеснение) не должны копиться
+            if len(self._heap) > 2 * len(self._data) + 1024:
+                self._heap = [(entry[1], key) for key, entry in self._data.items()]
+                heapq.heapify(self._heap)
+
+    def get(self, session_id: str, default=None):
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is None:
+                return default
+            self._data.move_to_end(session_id)
+            return entry[0]
+
+    def __delitem__(self, session_id: str):
+        with self._lock:
+            del self._data[session_id]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._heap.clear()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._purge(_utc_now())
+
+    def _purge(self, now: float) -> int:
+        removed = 0
+        heap = self._heap
+        while heap and heap[0][0] < now:
+            expires_at, session_id = heapq.heappop(heap)
+            entry = self._data.get(session_id)
+            if entry is not None and entry[1] == expires_at:
+                del self._data[session_id]
+                removed += 1
+        self.expired += removed
+        return removed
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _decode(obj: dict):
+    if len(obj) == 1 and '$dt' in obj:
+        return datetime.fromisoformat(obj['$dt'])
+    return obj
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Сессии в отдельном файле SQLite, общем для нескольких процессов
+
+    Каждый поток работает через свое соединение в режиме autocommit (WAL),
+    запись и чтение - один запрос по первичному ключу. Истекшие сессии удаляются
+    одним DELETE по индексу expires_at не чаще раза в purge_interval секунд.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH, purge_interval: float = SESSION_PURGE_INTERVAL):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._next_purge = 0.0
+        self._conn().executescript('''
+            CREATE TABLE IF NOT EXISTS verification_sessions (
+                session_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS ix_verification_sessions_expires_at
+                ON verification_sessions (expires_at);
+        ''')
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def __setitem__(self, session_id: str, session: dict):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO verification_sessions (session_id, data, expires_at) VALUES (?, ?, ?)',
+            (session_id, json.dumps(session, default=_encode, ensure_ascii=False), _expires_at(session))
+        )
+        if time.monotonic() >= self._next_purge:
+            self.purge_expired()
+
+    def get(self, session_id: str, default=None):
+        row = self._conn().execute(
+            'SELECT data FROM verification_sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0], object_hook=_decode)
+
+    def __delitem__(self, session_id: str):
+        cursor = self._conn().execute('DELETE FROM verification_sessions WHERE session_id = ?', (session_id,))
+        if cursor.rowcount == 0:
+            raise KeyError(session_id)
+
+    def __len__(self) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM verification_sessions').fetchone()[0]
+
+    def clear(self):
+        self._conn().execute('DELETE FROM verification_sessions')
+
+    def purge_expired(self) -> int:
+        self._next_purge = time.monotonic() + self.purge_interval
+        cursor = self._conn().execute('DELETE FROM verification_sessions WHERE expires_at < ?', (_utc_now(),))
+        return cursor.rowcount
+
+    def close(self):
+        """Закрыть соединение текущего потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def create_session_store(kind: str = None) -> SessionStore:
+    """Создать хранилище по имени бэкенда (по умолчанию из SESSION_STORE)"""
+    kind = (kind or SESSION_STORE).lower()
+    if kind == 'memory':
+        return MemorySessionStore()
+    if kind == 'sqlite':
+        return SQLiteSessionStore()
+    raise ValueError(f"Неизвестное хранилище сессий: {kind}")
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Очередь входящих webhook YooMoney
+
+POST /api/yoomoney/webhook проверяет подпись по исходным байтам тела,
+записывает событие в webhook_events (повторная доставка того же события
+игнорируется) и сразу отвечает 200. Применяют события воркеры этого модуля:
+пачка событий забирается одним UPDATE ... RETURNING, донаты пачки
+загружаются одним запросом, результат сохраняется одним коммитом.
+
+Если донат еще не найден (webhook пришел раньше, чем outbox сохранил ID платежа),
+событие повторяется через WEBHOOK_RETRY_SECONDS, но не больше WEBHOOK_MAX_ATTEMPTS раз.
+
+Воркеры запускаются внутри app.py или отдельным процессом:
+    python webhook_queue.py               # WEBHOOK_WORKERS потоков
+"""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import update, select, or_, and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import (
+    engine, SessionLocal, Donation, PaymentMethod, Subscription, User, WebhookEvent, begin_immediate, query_scope
+)
+from events import donation_status_event, publish_many
+from recurring_charges import calculate_next_charge_date
+
+# Количество потоков-воркеров (0 - не запускать внутри app.py, только отдельным процессом)
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '2'))
+# Сколько событий применять за один коммит
+WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', '200'))
+# Аренда пачки: после нее события упавшего воркера заберет другой
+WEBHOOK_LEASE_SECONDS = int(os.getenv('WEBHOOK_LEASE_SECONDS', '60'))
+# Повторы события, для которого еще нет доната
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', '10'))
+WEBHOOK_RETRY_SECONDS = float(os.getenv('WEBHOOK_RETRY_SECONDS', '5'))
+# Как часто простаивающий воркер проверяет очередь (события из других процессов)
+WEBHOOK_POLL_INTERVAL = float(os.getenv('WEBHOOK_POLL_INTERVAL', '1.0'))
+
+_wakeup = threading.Condition()
+_generation = 0
+_workers = []
+_stop = threading.Event()
+
+
+def enqueue_event(payment_id: str, event_type: str, raw_body: bytes) -> bool:
+    """
+    Записать событие в очередь. Возвращает False, если такое событие уже было
+
+    Одна короткая транзакция без ORM: INSERT ... ON CONFLICT DO NOTHING
+    по уникальному ключу (payment_id, event_type).
+    """
+    stmt = sqlite_insert(WebhookEvent.__table__).values(
+        payment_id=payment_id,
+        event_type=event_type,
+        payload=raw_body.decode('utf-8'),
+        status='queued',
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+        received_at=datetime.utcnow()
+    ).on_conflict_do_nothing(index_elements=['payment_id', 'event_type'])
+    with engine.begin() as conn:
+        inserted = conn.execute(stmt).rowcount > 0
+    if inserted:
+        _notify()
+    return inserted
+
+
+def _notify():
+    global _generation
+    with _wakeup:
+        _generation += 1
+        _wakeup.notify_all()
+
+
+def claim_events(worker_id: str, limit: int = WEBHOOK_BATCH_SIZE) -> list:
+    """Забрать до limit событий в порядке поступления"""
+    now = datetime.utcnow()
+    table = WebhookEvent.__table__
+    available = or_(
+        and_(table.c.status == 'queued', table.c.next_attempt_at <= now),
+        and_(table.c.status == 'processing', table.c.claim_expires_at < now)
+    )
+    candidates = select(table.c.id).where(available).order_by(table.c.id).limit(limit)
+    stmt = (
+        update(table)
+        .where(table.c.id.in_(candidates.scalar_subquery()), available)
+        .values(
+            status='processing',
+            claimed_by=worker_id,
+            claim_expires_at=now + timedelta(seconds=WEBHOOK_LEASE_SECONDS),
+            attempts=table.c.attempts + 1
+        )
+        .returning(table.c.id)
+    )
+    with engine.begin() as conn:
+        return sorted(row[0] for row in conn.execute(stmt))
+
+
+def apply_payment_event(db, donation: Donation, payment_data: dict, users: dict = None, payment_methods: dict = None):
+    """
+    Применить к донату данные платежа из webhook (без коммита)
+
+    users ({id: User}) и payment_methods ({(user_id, токен): PaymentMethod}) -
+    заранее загруженные для всей пачки строки; без них они читаются по одной.
+    """
+    status = payment_data.get('status', '')
+    if status == 'succeeded':
+        if donation.status != 'succeeded':
+            donation.status = 'succeeded'
+            donation.paid_at = datetime.utcnow()
+
+        # Если это регулярное пожертвование и еще нет подписки - создаем
+        if donation.is_recurring and not donation.subscription_id and donation.user_id:
+            user = users.get(donation.user_id) if users is not None else db.get(User, donation.user_id)
+            if user:
+                # Получаем или создаем способ оплаты
+                payment_method = None
+                provider_token = (payment_data.get('payment_method') or {}).get('id')
+                if provider_token:
+                    if payment_methods is not None:
+                        payment_method = payment_methods.get((user.id, provider_token))
+                    else:
+                        payment_method = db.query(PaymentMethod).filter(
+                            PaymentMethod.provider_payment_token == provider_token,
+                            PaymentMethod.user_id == user.id
+                        ).first()
+                    if not payment_method:
+                        payment_method = PaymentMethod(
+                            user_id=user.id,
+                            provider='yoomoney',
+                            provider_payment_token=provider_token,
+                            last4=payment_data.get('payment_method', {}).get('card', {}).get('last4', ''),
+                            is_active=True
+                        )
+                        db.add(payment_method)
+                        db.flush()
+                        if payment_methods is not None:
+                            payment_methods[(user.id, provider_token)] = payment_method
+
+                # Создаем подписку
+                frequency = 'monthly'  # По умолчанию, можно брать из donation или запроса
+                subscription = Subscription(
+                    user_id=user.id,
+                    payment_method_id=payment_method.id if payment_method else None,
+                    amount=donation.amount,
+                    purpose=donation.purpose,
+                    frequency=frequency,
+                    status='active',
+                    next_charge_at=calculate_next_charge_date(frequency)
+                )
+                db.add(subscription)
+                db.flush()
+                donation.subscription_id = subscription.id
+
+    elif status in ['canceled', 'failed']:
+        donation.status = status
+
+
+def process_events(event_ids: list, worker_id: str) -> dict:
+    """
+    Применить захваченные события одной транзакцией
+
+    Транзакция открывается явно (begin_immediate), поэтому ошибка одного
+    события откатывает только его SAVEPOINT, а не всю пачку, и не коммитит
+    пачку раньше времени. Возвращает счетчики done/retry/failed.
+    """
+    outcomes = {'done': 0, 'retry': 0, 'failed': 0}
+    if not event_ids:
+        return outcomes
+
+    db = SessionLocal()
+    try:
+        begin_immediate(db)
+        events = db.query(WebhookEvent).filter(
+            WebhookEvent.id.in_(event_ids), WebhookEvent.claimed_by == worker_id
+        ).order_by(WebhookEvent.id).all()
+        donations = {
+            d.provider_payment_id: d
+            for d in db.query(Donation).filter(
+                Donation.provider_payment_id.in_({e.payment_id for e in events})
+            )
+        }
+
+        payloads = {}
+        for webhook_event in events:
+            try:
+                payloads[webhook_event.id] = json.loads(webhook_event.payload).get('object', {})
+            except ValueError:
+                payloads[webhook_event.id] = None
+
+        # Пользователи и способы оплаты для первых регулярных платежей - двумя
+        # запросами на пачку, а не двумя на событие
+        subscriber_ids = {
+            d.user_id for d in donations.values() if d.is_recurring and not d.subscription_id and d.user_id
+        }
+        users, payment_methods = {}, {}
+        if subscriber_ids:
+            users = {u.id: u for u in db.query(User).filter(User.id.in_(subscriber_ids))}
+            tokens = {((data or {}).get('payment_method') or {}).get('id') for data in payloads.values()} - {None}
+            if tokens:
+                payment_methods = {
+                    (pm.user_id, pm.provider_payment_token): pm
+                    for pm in db.query(PaymentMethod).filter(
+                        PaymentMethod.user_id.in_(subscriber_ids),
+                        PaymentMethod.provider_payment_token.in_(tokens)
+                    )
+                }
+
+        now = datetime.utcnow()
+        status_events = []
+        for webhook_event in events:
+            webhook_event.claimed_by = None
+            webhook_event.claim_expires_at = None
+            donation = donations.get(webhook_event.payment_id)
+            if donation is None:
+                if webhook_event.attempts >= WEBHOOK_MAX_ATTEMPTS:
+                    print(f"[WARNING] Donation not found for payment_id: {webhook_event.payment_id}")
+                    webhook_event.status = 'failed'
+                    webhook_event.last_error = 'Donation not found'
+                    outcomes['failed'] += 1
+                else:
+                    webhook_event.status = 'queued'
+                    webhook_event.next_attempt_at = now + timedelta(seconds=WEBHOOK_RETRY_SECONDS)
+                    outcomes['retry'] += 1
+                continue
+
+            try:
+                previous_status = donation.status
+                with db.begin_nested():
+                    payment_data = payloads[webhook_event.id]
+                    if payment_data is None:
+                        raise ValueError('Invalid JSON payload')
+                    apply_payment_event(db, donation, payment_data, users, payment_methods)
+                if donation.status != previous_status:
+                    status_events.append(donation_status_event(donation))
+                webhook_event.status = 'done'
+                webhook_event.processed_at = now
+                outcomes['done'] += 1
+            except Exception as e:
+                print(f"[ERROR] yoomoney_webhook event {webhook_event.id}: {e}")
+                webhook_event.status = 'failed'
+                webhook_event.last_error = str(e)
+                outcomes['failed'] += 1
+
+        db.commit()
+        publish_many('donation.status', status_events)
+        return outcomes
+    except Exception as e:
+        # Аренда истечет, и события заберет следующий проход
+        print(f"[ERROR] process_events: {e}")
+        db.rollback()
+        return outcomes
+    finally:
+        db.close()
+
+
+def run_once(worker_id: str, limit: int = WEBHOOK_BATCH_SIZE) -> int:
+    """Забрать и применить одну пачку. Возвращает количество событий в пачке"""
+    with query_scope('webhook_queue'):
+        event_ids = claim_events(worker_id, limit)
+        process_events(event_ids, worker_id)
+    return len(event_ids)
+
+
+def _worker_loop(worker_id: str):
+    while not _stop.is_set():
+        with _wakeup:
+            generation = _generation
+        try:
+            processed = run_once(worker_id)
+        except Exception as e:
+            print(f"[ERROR] Воркер webhook {worker_id}: {e}")
+            processed = 0
+        if processed:
+            continue
+        with _wakeup:
+            if _generation == generation and not _stop.is_set():
+                _wakeup.wait(WEBHOOK_POLL_INTERVAL)
+
+
+def start_webhook_workers(workers: int = None) -> int:
+    """Запустить потоки-воркеры, если они еще не запущены. Возвращает число живых воркеров"""
+    global _workers
+    workers = WEBHOOK_WORKERS if workers is None else workers
+    with _wakeup:
+        _workers = [thread for thread in _workers if thread.is_alive()]
+        if _workers or workers <= 0:
+            return len(_workers)
+        _stop.clear()
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        for number in range(workers):
+            thread = threading.Thread(
+                target=_worker_loop,
+                args=(f'{prefix}:webhook-{number}',),
+                name=f'webhook-worker-{number}',
+                daemon=True
+            )
+            thread.start()
+            _workers.append(thread)
+        return len(_workers)
+
+
+def stop_webhook_workers(timeout: float = 5.0):
+    """Остановить потоки-воркеры (текущая пачка доработает)"""
+    _stop.set()
+    _notify()
+    for thread in _workers:
+        thread.join(timeout)
+
+
+def main(argv) -> int:
+    """Запуск воркеров отдельным процессом"""
+    workers = int(argv[1]) if len(argv) > 1 else max(WEBHOOK_WORKERS, 1)
+    start_webhook_workers(workers)
+    print(f"[OK] Воркеры webhook запущены: {workers}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_webhook_workers()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
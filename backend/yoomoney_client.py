@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP-клиент YooMoney
+
+Один клиент на процесс: пул keep-alive соединений (requests.Session),
+таймауты соединения и чтения, ограничение одновременных запросов,
+повторы с тем же Idempotence-Key и circuit breaker, который при деградации
+провайдера сразу отклоняет запросы, а не держит воркеры на таймаутах.
+Счетчики запросов, ошибок и задержек доступны через stats().
+"""
+import random
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Границы корзин гистограммы задержек, секунды
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Ответы, после которых запрос можно повторить
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class YooMoneyError(Exception):
+    """Ошибка обращения к YooMoney"""
+
+
+class CircuitOpenError(YooMoneyError):
+    """Провайдер недоступен: circuit breaker разомкнут, запрос не отправлялся"""
+
+
+class CircuitBreaker:
+    """
+    Простой circuit breaker
+
+    closed - запросы идут; после failure_threshold ошибок подряд - open:
+    запросы отклоняются reset_timeout секунд, затем half_open - пропускается
+    один пробный запрос: успех замыкает цепь, ошибка снова размыкает.
+    Если пробный запрос так и не был отправлен, место пробы освобождается
+    через release_probe(), иначе цепь осталась бы в half_open навсегда.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._probe_in_flight = False
+            if self.state == 'half_open' and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def release_probe(self):
+        """Запрос не отправлен (исход неизвестен): следующий вызов снова может стать пробой"""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+class YooMoneyClient:
+    """Клиент API платежей YooMoney"""
+
+    def __init__(
+        self,
+        api_url: str,
+        secret_key: str,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 15.0,
+        max_concurrency: int = 20,
+        max_retries: int = 2,
+        backoff: float = 0.2,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0
+    ):
+        self.api_url = api_url
+        self.secret_key = secret_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {secret_key}',
+            'Content-Type': 'application/json'
+        })
+        # Запросов сверх размера пула не пускаем: иначе urllib3 открывает лишние соединения
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._acquire_timeout = connect_timeout + read_timeout
+
+        self._stats_lock = threading.Lock()
+        self._counters = {
+            'requests': 0,        # Вызовов create_payment
+            'attempts': 0,        # HTTP-запросов, включая повторы
+            'succeeded': 0,
+            'failed': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'http_errors': 0,
+            'connection_errors': 0,
+            'request_errors': 0,  # Прочие ошибки requests (редиректы, обрыв тела ответа)
+            'circuit_rejected': 0,
+        }
+        self._latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+
+    # ==================== ПУБЛИЧНЫЕ МЕТОДЫ ====================
+
+    def create_payment(self, payload: dict, idempotence_key: str = None) -> dict:
+        """
+        Создать платеж
+
+        Все попытки уходят с одним Idempotence-Key, поэтому повтор после
+        таймаута не создаст второй платеж. Бросает CircuitOpenError, если
+        провайдер недоступен, и YooMoneyError после исчерпания повторов.
+        """
+        idempotence_key = idempotence_key or uuid.uuid4().hex
+        self._count('requests')
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._count('circuit_rejected')
+                self._count('failed')
+                raise CircuitOpenError('YooMoney временно недоступен (circuit breaker open)')
+
+            try:
+                return self._send(payload, idempotence_key)
+            except YooMoneyError as e:
+                retryable = getattr(e, 'retryable', False)
+                if not retryable or attempt >= self.max_retries:
+                    self._count('failed')
+                    raise
+                attempt += 1
+                self._count('retries')
+                delay = getattr(e, 'retry_after', None) or self.backoff * 2 ** (attempt - 1)
+                time.sleep(delay * random.uniform(0.8, 1.2))
+
+    def stats(self) -> dict:
+        """Снимок счетчиков и гистограммы задержек HTTP-запросов"""
+        with self._stats_lock:
+            counters = dict(self._counters)
+            attempts = counters['attempts']
+            counters.update({
+                'circuit_state': self.breaker.state,
+                'latency_avg': self._latency_sum / attempts if attempts else 0.0,
+                'latency_max': self._latency_max,
+                'latency_sum': self._latency_sum,
+                'latency_buckets': dict(zip([*LATENCY_BUCKETS, float('inf')], self._latency_buckets)),
+            })
+            return counters
+
+    def close(self):
+        self.session.close()
+
+    # ==================== ВНУТРЕННЕЕ ====================
+
+    def _send(self, payload: dict, idempotence_key: str) -> dict:
+        """
+        Один HTTP-запрос к YooMoney
+
+        На каждом пути исход записывается в circuit breaker: ошибка requests -
+        record_failure(), ответ - record_success()/record_failure() по статусу,
+        запрос не отправлен - release_probe(), чтобы не застрять в half_open.
+        """
+        if not self._slots.acquire(timeout=self._acquire_timeout):
+            self.breaker.release_probe()
+            raise self._error('Превышено число одновременных запросов к YooMoney', retryable=False)
+        started = time.monotonic()
+        recorded = False
+        try:
+            self._count('attempts')
+            response = self.session.post(
+                self.api_url,
+                json=payload,
+                headers={'Idempotence-Key': idempotence_key},
+                timeout=self.timeout
+            )
+            recorded = True
+        except requests.Timeout as e:
+            self._count('timeouts')
+            self.breaker.record_failure()
+            recorded = True
+            raise self._error(f'Таймаут YooMoney: {e}', retryable=True)
+        except requests.ConnectionError as e:
+            self._count('connection_errors')
+            self.breaker.record_failure()
+            recorded = True
+            raise self._error(f'Нет соединения с YooMoney: {e}', retryable=True)
+        except requests.RequestException as e:
+            self._count('request_errors')
+            self.breaker.record_failure()
+            recorded = True
+            raise self._error(f'Ошибка запроса к YooMoney: {e}', retryable=False)
+        finally:
+            self._observe(time.monotonic() - started)
+            self._slots.release()
+            if not recorded:
+                # Исключение не из requests (например, сериализация payload): исход неизвестен
+                self.breaker.release_probe()
+
+        if response.status_code >= 400:
+            self._count('http_errors')
+            retryable = response.status_code in RETRYABLE_STATUSES
+            # 4xx - ошибка запроса, а не провайдера: цепь из-за нее не размыкаем
+            if response.status_code >= 500 or response.status_code == 429:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            error = self._error(f'YooMoney ответил {response.status_code}: {response.text[:200]}', retryable)
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                error.retry_after = min(int(retry_after), 30)
+            raise error
+
+        self.breaker.record_success()
+        self._count('succeeded')
+        return response.json()
+
+    @staticmethod
+    def _error(message: str, retryable: bool) -> YooMoneyError:
+        error = YooMoneyError(message)
+        error.retryable = retryable
+        return error
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._counters[name] += 1
+
+    def _observe(self, seconds: float):
+        with self._stats_lock:
+            self._latency_sum += seconds
+            self._latency_max = max(self._latency_max, seconds)
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    self._latency_buckets[index] += 1
+                    break
+            else:
+                self._latency_buckets[-1] += 1
@@ -72,6 +72,7 @@ async function initializeDashboard() {
     loadApplications();
     loadContent();
     loadVolunteers();
+    subscribeDonationEvents();
 }
 
 // Загрузка таблицы животных
@@ -271,26 +272,12 @@ async function loadStats() {
         const currentYear = new Date().getFullYear();
         const excludeNames = ['влад', 'nikita', 'никита'];
         
-        // Загружаем данные из API (как в графике)
+        // Загружаем сводку из API: сумма за месяц считается на сервере,
+        // тестовые доноры исключаются там же
         try {
-            const response = await fetch(`http://localhost:5000/api/admin/donations?limit=1000`);
-            if (response.ok) {
-                const allApiDonations = await response.json();
-                const apiDonations = allApiDonations.filter(d => {
-                    // В тестовом режиме считаем pending, completed и succeeded как завершенные
-                    const status = (d.status || '').toLowerCase();
-                    const statusOk = status === 'succeeded' || status === 'completed' || status === 'pending';
-                    const publicName = (d.public_name || '').toLowerCase();
-                    const isFake = excludeNames.some(name => publicName.includes(name));
-                    const dateStr = d.paid_at || d.created_at;
-                    if (!dateStr) return false;
-                    const donationDate = new Date(dateStr);
-                    if (isNaN(donationDate.getTime())) return false;
-                    const sameMonth = donationDate.getMonth() === currentMonth && donationDate.getFullYear() === currentYear;
-                    return statusOk && !isFake && sameMonth;
-                });
-                
-                monthlyDonations = apiDonations.reduce((sum, d) => sum + (d.amount || 0), 0);
+            const dashboard = await fetchDashboard(currentMonth, currentYear);
+            if (dashboard) {
+                monthlyDonations = dashboard.month_total || 0;
                 console.log('Monthly donations from API:', monthlyDonations);
             }
         } catch (error) {
@@ -363,6 +350,19 @@ async function loadStats() {
     }
 }
 
+// Сводка дашборда из API за месяц (month - 0-11, как в Date)
+async function fetchDashboard(month, year) {
+    // Условный запрос: если данные не менялись, сервер отвечает 304 и берется прошлая сводка
+    const result = await window.donationsDB.fetchJSONConditional(
+        `http://localhost:5000/api/admin/dashboard?year=${year}&month=${month + 1}`
+    );
+    if (!result.ok) {
+        console.warn('Дашборд: API вернул ошибку:', result.status, result.statusText);
+        return null;
+    }
+    return result.data;
+}
+
 // Анимация статистики
 function animateStats(stats) {
     const statNumbers = document.querySelectorAll('.stats-overview .stat-number');
@@ -417,6 +417,11 @@ function translatePurpose(purpose) {
     return purposeMap[purpose] || purpose;
 }
 
+// Последние донаты в таблице админки: заполняются loadRecentDonations
+// и обновляются событиями ленты изменений (subscribeDonationEvents)
+let recentDonations = [];
+const RECENT_DONATIONS_LIMIT = 10;
+
 // Загрузка последних пожертвований из API
 async function loadRecentDonations() {
     try {
@@ -428,9 +433,10 @@ async function loadRecentDonations() {
         // Сначала пытаемся загрузить из API
         let donations = [];
         try {
-            const response = await fetch('http://localhost:5000/api/admin/donations?limit=10');
-            if (response.ok) {
-                donations = await response.json();
+            const result = await window.donationsDB.fetchJSONConditional(`http://localhost:5000/api/admin/donations?limit=${RECENT_DONATIONS_LIMIT}`);
+            if (result.ok) {
+                // Ответ - {donations, next_cursor}; для блока последних достаточно первой страницы
+                donations = result.data.donations || [];
                 // Переводим назначения для данных из API
                 donations = donations.map(d => ({
                     ...d,
@@ -453,7 +459,7 @@ async function loadRecentDonations() {
                     return !isFake;
                 });
                 
-                donations = filteredDonations.slice(0, 10).map(d => ({
+                donations = filteredDonations.slice(0, RECENT_DONATIONS_LIMIT).map(d => ({
                     id: d.id,
                     public_name: d.userName || 'Анонимно',
                     amount: d.amount,
@@ -467,49 +473,8 @@ async function loadRecentDonations() {
             }
         }
         
-        const donationsList = document.querySelector('.recent-donations .donation-list');
-        if (donationsList) {
-            if (donations.length === 0) {
-                donationsList.innerHTML = '<tr class="donation-item"><td colspan="5" style="text-align: center; padding: 2rem;">Нет донатов</td></tr>';
-            } else {
-                donationsList.innerHTML = donations.map(donation => {
-                    const date = donation.paid_at || donation.created_at;
-                    const dateObj = date ? new Date(date) : new Date();
-                    const formattedDate = dateObj.toLocaleDateString('ru-RU', {
-                        year: 'numeric',
-                        month: 'long',
-                        day: 'numeric'
-                    });
-                    
-                    // В тестовом режиме считаем и pending, и succeeded как завершенные
-                    const rawStatus = donation.status || '';
-                    const statusKey = rawStatus.toLowerCase();
-                    const normalizedStatus = (statusKey === 'pending') ? 'succeeded' : statusKey;
-                    const statusText = normalizedStatus === 'succeeded' ? 'Завершено' : 
-                                       normalizedStatus === 'failed' ? 'Ошибка' : rawStatus;
-                    const statusClass = normalizedStatus === 'succeeded' ? 'completed' : normalizedStatus;
-                    
-                    // В админке показываем полные данные (телефон, email)
-                    const phone = donation.phone || '';
-                    const email = donation.email || '';
-                    const fullName = donation.public_name || 'Анонимно';
-                    
-                    return `
-                        <tr class="donation-item">
-                            <td class="donation-date">${formattedDate}</td>
-                            <td class="donation-amount">${donation.amount.toLocaleString('ru-RU')} ₽</td>
-                            <td class="donation-donor">
-                                <strong>${fullName}</strong>
-                                ${phone ? `<div style="font-size: 0.85rem; color: var(--text-light); margin-top: 0.25rem;">📞 ${phone}</div>` : ''}
-                                ${email ? `<div style="font-size: 0.85rem; color: var(--text-light);">📧 ${email}</div>` : ''}
-                            </td>
-                            <td class="donation-purpose">${donation.purpose}</td>
-                            <td class="donation-status ${statusClass}">${statusText}</td>
-                        </tr>
-                    `;
-                }).join('');
-            }
-        }
+        recentDonations = donations;
+        renderRecentDonations();
         
         // Загрузка графика
         loadDonationsChart();
@@ -518,6 +483,118 @@ async function loadRecentDonations() {
     }
 }
 
+// Отрисовка таблицы последних донатов
+function renderRecentDonations() {
+    const donationsList = document.querySelector('.recent-donations .donation-list');
+    if (donationsList) {
+        if (recentDonations.length === 0) {
+            donationsList.innerHTML = '<tr class="donation-item"><td colspan="5" style="text-align: center; padding: 2rem;">Нет донатов</td></tr>';
+        } else {
+            donationsList.innerHTML = recentDonations.map(donation => {
+                const date = donation.paid_at || donation.created_at;
+                const dateObj = date ? new Date(date) : new Date();
+                const formattedDate = dateObj.toLocaleDateString('ru-RU', {
+                    year: 'numeric',
+                    month: 'long',
+                    day: 'numeric'
+                });
+                
+                // В тестовом режиме считаем и pending, и succeeded как завершенные
+                const rawStatus = donation.status || '';
+                const statusKey = rawStatus.toLowerCase();
+                const normalizedStatus = (statusKey === 'pending') ? 'succeeded' : statusKey;
+                const statusText = normalizedStatus === 'succeeded' ? 'Завершено' : 
+                                   normalizedStatus === 'failed' ? 'Ошибка' : rawStatus;
+                const statusClass = normalizedStatus === 'succeeded' ? 'completed' : normalizedStatus;
+                
+                // В админке показываем полные данные (телефон, email)
+                const phone = donation.phone || '';
+                const email = donation.email || '';
+                const fullName = donation.public_name || 'Анонимно';
+                
+                return `
+                    <tr class="donation-item">
+                        <td class="donation-date">${formattedDate}</td>
+                        <td class="donation-amount">${donation.amount.toLocaleString('ru-RU')} ₽</td>
+                        <td class="donation-donor">
+                            <strong>${fullName}</strong>
+                            ${phone ? `<div style="font-size: 0.85rem; color: var(--text-light); margin-top: 0.25rem;">📞 ${phone}</div>` : ''}
+                            ${email ? `<div style="font-size: 0.85rem; color: var(--text-light);">📧 ${email}</div>` : ''}
+                        </td>
+                        <td class="donation-purpose">${donation.purpose}</td>
+                        <td class="donation-status ${statusClass}">${statusText}</td>
+                    </tr>
+                `;
+            }).join('');
+        }
+    }
+}
+
+// Лента изменений донатов и подписок (Server-Sent Events): вместо повторной загрузки
+// списков таблица последних донатов обновляется по событиям. EventSource сам
+// переподключается и передает Last-Event-ID - пропущенные события сервер досылает,
+// а если они потеряны (перезапуск сервера), присылает reset
+let donationEvents = null;
+let donationsRefreshTimer = null;
+let donationsReloadPending = false;
+
+function subscribeDonationEvents() {
+    if (donationEvents || typeof EventSource === 'undefined') return;
+    donationEvents = new EventSource('http://localhost:5000/api/admin/events');
+    
+    donationEvents.addEventListener('donation.created', (event) => {
+        const donation = JSON.parse(event.data);
+        recentDonations = [
+            { ...donation, purpose: translatePurpose(donation.purpose) },
+            ...recentDonations.filter(d => d.id !== donation.id)
+        ].slice(0, RECENT_DONATIONS_LIMIT);
+        renderRecentDonations();
+        scheduleDonationsRefresh(false);
+    });
+    
+    donationEvents.addEventListener('donation.status', (event) => {
+        const change = JSON.parse(event.data);
+        recentDonations = recentDonations.map(d => d.id === change.id
+            ? { ...d, status: change.status, paid_at: change.paid_at || d.paid_at }
+            : d);
+        renderRecentDonations();
+        scheduleDonationsRefresh(false);
+    });
+    
+    // Регулярное списание добавляет донат, которого нет в событии целиком - перечитываем
+    // список условным запросом; reset - события потеряны, перечитываем все
+    donationEvents.addEventListener('subscription.charged', () => scheduleDonationsRefresh(true));
+    donationEvents.addEventListener('reset', () => scheduleDonationsRefresh(true));
+}
+
+// Пачка событий - один запрос: сумма за месяц (и при необходимости список) обновляются
+// через секунду после последнего события условными запросами (ETag)
+function scheduleDonationsRefresh(reloadList) {
+    donationsReloadPending = donationsReloadPending || reloadList;
+    clearTimeout(donationsRefreshTimer);
+    donationsRefreshTimer = setTimeout(() => {
+        if (donationsReloadPending) {
+            loadRecentDonations();
+        }
+        donationsReloadPending = false;
+        refreshMonthlyDonations();
+    }, 1000);
+}
+
+// Обновить сумму донатов за текущий месяц из сводки дашборда
+async function refreshMonthlyDonations() {
+    try {
+        const now = new Date();
+        const dashboard = await fetchDashboard(now.getMonth(), now.getFullYear());
+        const donationsStat = document.querySelectorAll('.stats-overview .stat-number')[1];
+        if (dashboard && donationsStat) {
+            donationsStat.textContent = (dashboard.month_total || 0).toLocaleString('ru-RU') + ' ₽';
+        }
+    } catch (error) {
+        console.warn('Не удалось обновить сумму за месяц:', error);
+    }
+}
+
 // Текущий выбранный месяц для графика (по умолчанию: текущий месяц)
 let selectedChartMonth = new Date().getMonth();
 let selectedChartYear = new Date().getFullYear();
@@ -592,46 +669,13 @@ async function loadDonationsChart(month = null, year = null) {
             });
         }
         
-        // 2. Пытаемся загрузить данные из API (новые данные)
-        let apiDonations = [];
+        // 2. Пытаемся загрузить суммы по дням из API (новые данные)
+        let apiDailyTotals = [];
         try {
-            const response = await fetch(`http://localhost:5000/api/admin/donations?limit=1000`);
-            if (response.ok) {
-                const allApiDonations = await response.json();
-                console.log('График: Всего донатов из API:', allApiDonations.length);
-                console.log('График: Примеры донатов из API:', allApiDonations.slice(0, 3).map(d => ({
-                    id: d.id,
-                    status: d.status,
-                    date: d.paid_at || d.created_at,
-                    amount: d.amount,
-                    name: d.public_name
-                })));
-                
-                apiDonations = allApiDonations.filter(d => {
-                    // В тестовом режиме считаем pending, completed и succeeded как завершенные
-                    const status = (d.status || '').toLowerCase();
-                    const statusOk = status === 'succeeded' || status === 'completed' || status === 'pending';
-                    const publicName = (d.public_name || '').toLowerCase();
-                    const isFake = excludeNames.some(name => publicName.includes(name));
-                    const dateStr = d.paid_at || d.created_at;
-                    if (!dateStr) {
-                        console.log('График: Донат без даты пропущен:', d.id);
-                        return false;
-                    }
-                    const donationDate = new Date(dateStr);
-                    if (isNaN(donationDate.getTime())) {
-                        console.log('График: Некорректная дата доната:', d.id, dateStr);
-                        return false;
-                    }
-                    const sameMonth = donationDate.getMonth() === targetMonth && donationDate.getFullYear() === targetYear;
-                    const result = statusOk && !isFake && sameMonth;
-                    if (!result && statusOk && !isFake) {
-                        console.log('График: Донат не подходит по месяцу:', d.id, 'Дата:', donationDate.toISOString(), 'Целевой месяц:', targetMonth + 1, targetYear);
-                    }
-                    return result;
-                });
-            } else {
-                console.warn('График: API вернул ошибку:', response.status, response.statusText);
+            const dashboard = await fetchDashboard(targetMonth, targetYear);
+            if (dashboard) {
+                apiDailyTotals = (dashboard.by_day || []).filter(d => d.amount > 0);
+                console.log('График: Дней с донатами из API:', apiDailyTotals.length);
             }
         } catch (apiError) {
             console.warn('API недоступен для графика, используем только локальные данные:', apiError);
@@ -641,20 +685,13 @@ async function loadDonationsChart(month = null, year = null) {
         const donationsMap = new Map();
         let donationCounter = 0; // Счетчик для донатов без ID
         
-        // Сначала добавляем данные из API (новые, имеют приоритет)
-        apiDonations.forEach(d => {
-            const dateStr = d.paid_at || d.created_at;
-            const donationDate = new Date(dateStr);
-            // Используем ID если есть, иначе создаем уникальный ключ с временем
-            const key = d.id ? `api_${d.id}` : `api_${dateStr}_${d.amount}_${(d.public_name || '').toLowerCase()}_${donationCounter++}`;
-            
-            if (!donationsMap.has(key)) {
-                donationsMap.set(key, {
-                    date: dateStr,
-                    amount: d.amount || 0,
-                    day: donationDate.getDate()
-                });
-            }
+        // Сначала добавляем данные из API (уже сгруппированы по дням на сервере)
+        apiDailyTotals.forEach(d => {
+            donationsMap.set(`api_day_${d.day}`, {
+                date: new Date(targetYear, targetMonth, d.day).toISOString(),
+                amount: d.amount,
+                day: d.day
+            });
         });
         
         // Затем добавляем локальные данные (старые), которые еще не были обработаны
@@ -693,7 +730,7 @@ async function loadDonationsChart(month = null, year = null) {
         // Логируем данные для отладки
         console.log('График: Месяц:', targetMonth + 1, 'Год:', targetYear);
         console.log('График: Локальных донатов за месяц:', localDonations.length);
-        console.log('График: API донатов за месяц:', apiDonations.length);
+        console.log('График: Дней с донатами из API:', apiDailyTotals.length);
         console.log('График: Всего уникальных донатов:', allMonthlyDonations.length);
         console.log('График: Детали донатов:', allMonthlyDonations.map(d => ({ day: d.day, amount: d.amount, date: d.date })));
         console.log('График: Пожертвований по дням:', Object.keys(donationsByDay).length);
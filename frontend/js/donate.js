@@ -117,6 +117,24 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Дождаться ссылки на оплату (long poll: сервер держит запрос, пока платеж не создан)
+    async function waitForPaymentUrl(statusUrl, attempts = 4) {
+        for (let i = 0; i < attempts; i++) {
+            const response = await fetch(`http://localhost:5000${statusUrl}?wait=25`);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            const payment = await response.json();
+            if (payment.payment_status === 'created') {
+                return payment.payment_url;
+            }
+            if (payment.payment_status === 'failed') {
+                throw new Error(payment.error || 'Не удалось создать платеж');
+            }
+        }
+        throw new Error('Платежная система не отвечает, попробуйте позже');
+    }
+
     // Обработка платежа после ввода карты или выбора способа оплаты
     async function processDonationPayment(donationData) {
         if (!donationData) return;
@@ -139,7 +157,12 @@ document.addEventListener('DOMContentLoaded', function() {
             }
             
             const result = await response.json();
-            
+
+            // Платеж создается на сервере асинхронно - ждем ссылку на оплату
+            if (!result.payment_url && result.payment_status_url) {
+                result.payment_url = await waitForPaymentUrl(result.payment_status_url);
+            }
+
             // Проверяем, нужно ли перенаправлять на страницу оплаты
             if (result.payment_url && !result.payment_url.includes('mock_payment')) {
                 // Реальная оплата - перенаправляем на страницу оплаты
@@ -954,27 +977,29 @@ async function loadRecentDonations(page = 0, append = false) {
         // 2. Загружаем данные из API (новые данные)
         let apiDonations = [];
         try {
-            const response = await fetch(`http://localhost:5000/api/admin/donations?limit=100`);
-            if (response.ok) {
-                const allApiDonations = await response.json();
-                apiDonations = allApiDonations
-                    .filter(d => {
-                        // В тестовом режиме считаем pending, completed и succeeded как завершенные
-                        const status = (d.status || '').toLowerCase();
-                        const isCompleted = status === 'succeeded' || status === 'completed' || status === 'pending';
+            // Статус фильтрует сервер (в тестовом режиме pending считается завершенным).
+            // Страницы читаются по next_cursor, пока не наберется на текущую страницу
+            // списка и одна запись сверх нее - по ней видно, есть ли продолжение
+            const enough = (page + 1) * RECENT_DONATIONS_PER_PAGE + 1;
+            const allApiDonations = await window.donationsDB.fetchAdminDonations(
+                { status: 'succeeded,pending' },
+                {
+                    keep: d => {
                         const publicName = (d.public_name || '').toLowerCase();
-                        const isFake = excludeNames.some(name => publicName.includes(name));
-                        return isCompleted && !isFake;
-                    })
-                    .map(d => ({
-                        name: shortenName(d.public_name || 'Анонимно'),
-                        amount: d.amount,
-                        date: d.paid_at || d.created_at,
-                        status: d.status,
-                        id: d.id,
-                        source: 'api'
-                    }));
-            }
+                        return !excludeNames.some(name => publicName.includes(name));
+                    },
+                    enough,
+                    pageSize: Math.max(enough, 100)
+                }
+            );
+            apiDonations = allApiDonations.map(d => ({
+                name: shortenName(d.public_name || 'Анонимно'),
+                amount: d.amount,
+                date: d.paid_at || d.created_at,
+                status: d.status,
+                id: d.id,
+                source: 'api'
+            }));
         } catch (apiError) {
             console.warn('API недоступен, используем только локальные данные:', apiError);
         }
@@ -146,6 +146,68 @@ async function addDonation(donation) {
     }
 }
 
+// Условные GET-запросы к API (ETag / If-None-Match).
+// Ответ запоминается вместе с ETag; повторный запрос отправляет If-None-Match,
+// и если данные на сервере не менялись, сервер отвечает 304 без тела,
+// а функция возвращает сохраненные данные.
+const CONDITIONAL_CACHE_LIMIT = 50;
+const conditionalCache = new Map(); // url -> { etag, data }
+
+async function fetchJSONConditional(url, options = {}) {
+    const cached = conditionalCache.get(url);
+    const headers = new Headers(options.headers || {});
+    if (cached) {
+        headers.set('If-None-Match', cached.etag);
+    }
+
+    const response = await fetch(url, { ...options, headers });
+    if (response.status === 304 && cached) {
+        // Освежаем позицию записи: вытесняются дольше всех не использованные
+        conditionalCache.delete(url);
+        conditionalCache.set(url, cached);
+        return { ok: true, status: 304, notModified: true, data: cached.data, headers: response.headers };
+    }
+    if (!response.ok) {
+        return { ok: false, status: response.status, statusText: response.statusText, notModified: false, data: null, headers: response.headers };
+    }
+
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    conditionalCache.delete(url);
+    if (etag) {
+        conditionalCache.set(url, { etag, data });
+        if (conditionalCache.size > CONDITIONAL_CACHE_LIMIT) {
+            conditionalCache.delete(conditionalCache.keys().next().value);
+        }
+    }
+    return { ok: true, status: response.status, notModified: false, data, headers: response.headers };
+}
+
+// Донаты из /api/admin/donations с переходом по next_cursor.
+// filters - серверные фильтры (status, purpose, date_from, date_to, is_recurring),
+// keep - отбор строк в браузере, enough - сколько отобранных строк достаточно:
+// по умолчанию страницы читаются, пока next_cursor не станет null.
+const ADMIN_DONATIONS_PAGE_SIZE = 1000;
+
+async function fetchAdminDonations(filters = {}, { keep = () => true, enough = Infinity, pageSize = ADMIN_DONATIONS_PAGE_SIZE } = {}) {
+    const donations = [];
+    let cursor = null;
+    do {
+        const params = new URLSearchParams({ ...filters, limit: pageSize });
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        const response = await fetch(`http://localhost:5000/api/admin/donations?${params.toString()}`);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const page = await response.json();
+        donations.push(...(page.donations || []).filter(keep));
+        cursor = page.next_cursor;
+    } while (cursor && donations.length < enough);
+    return donations;
+}
+
 // Экспорт функций
 window.donationsDB = {
     loadDonationsData,
@@ -155,6 +217,8 @@ window.donationsDB = {
     getMonthlyTotal,
     getTotalDonations,
     addDonation,
+    fetchJSONConditional,
+    fetchAdminDonations,
     donationsData: null // Будет установлено при загрузке данных
 };
 
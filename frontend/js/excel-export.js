@@ -67,8 +67,29 @@ function translatePurpose(purpose) {
     return excelPurposeMap[purpose] || purpose;
 }
 
+// Скачать выгрузку, которую сервер формирует потоково (вся история, без лимита в 1000 строк)
+function downloadServerExport(format = 'xlsx', filters = {}) {
+    const params = new URLSearchParams({ format, ...filters });
+    const link = document.createElement('a');
+    link.href = `http://localhost:5000/api/admin/donations/export?${params.toString()}`;
+    link.download = '';
+    document.body.appendChild(link);
+    link.click();
+    link.remove();
+}
+
 // Экспорт пожертвований в Excel
 async function exportDonationsToExcel() {
+    // В админке файл собирает сервер: браузер только скачивает его,
+    // поэтому большие выгрузки не подвешивают вкладку
+    if (isAdminPage()) {
+        downloadServerExport('xlsx');
+        if (typeof showMessage === 'function') {
+            showMessage('Выгрузка начата, файл скачивается...', 'info');
+        }
+        return;
+    }
+    
     try {
         const XLSX = await loadXLSXLibrary();
         
@@ -147,34 +168,33 @@ async function getDonationsData(forceReload = true) {
     
     // Сначала пытаемся загрузить из API (самые актуальные данные)
     try {
-        const response = await fetch('http://localhost:5000/api/admin/donations?limit=1000');
-        if (response.ok) {
-            const apiDonations = await response.json();
-            const excludeNames = ['влад', 'nikita', 'никита'];
-            donations = apiDonations
-                .filter(d => {
-                    // В тестовом режиме считаем pending, completed и succeeded как завершенные
-                    const status = (d.status || '').toLowerCase();
-                    const statusOk = status === 'succeeded' || status === 'completed' || status === 'pending';
+        // Статус фильтрует сервер (в тестовом режиме pending считается завершенным),
+        // все страницы читаются по next_cursor
+        const excludeNames = ['влад', 'nikita', 'никита'];
+        const apiDonations = await window.donationsDB.fetchAdminDonations(
+            { status: 'succeeded,pending' },
+            {
+                keep: d => {
                     const publicName = (d.public_name || '').toLowerCase();
-                    const isFake = excludeNames.some(name => publicName.includes(name));
-                    return statusOk && !isFake;
-                })
-                    .map(d => ({
-                        date: d.paid_at ? new Date(d.paid_at) : (d.created_at ? new Date(d.created_at) : new Date()),
-                        amount: d.amount || 0,
-                        donorName: d.public_name || 'Анонимно',
-                        message: translatePurpose(d.purpose) || 'Общие нужды', // Переводим назначение на русский
-                        transactionId: `DON-${d.id || Date.now()}`,
-                        phone: d.phone || '',
-                        email: d.email || ''
-                    }))
-                .sort((a, b) => b.date - a.date); // Сортируем по дате (новые первыми)
-            
-            if (donations.length > 0) {
-                console.log('Loaded donations from API:', donations.length);
-                return donations;
+                    return !excludeNames.some(name => publicName.includes(name));
+                }
             }
+        );
+        donations = apiDonations
+            .map(d => ({
+                date: d.paid_at ? new Date(d.paid_at) : (d.created_at ? new Date(d.created_at) : new Date()),
+                amount: d.amount || 0,
+                donorName: d.public_name || 'Анонимно',
+                message: translatePurpose(d.purpose) || 'Общие нужды', // Переводим назначение на русский
+                transactionId: `DON-${d.id || Date.now()}`,
+                phone: d.phone || '',
+                email: d.email || ''
+            }))
+            .sort((a, b) => b.date - a.date); // Сортируем по дате (новые первыми)
+        
+        if (donations.length > 0) {
+            console.log('Loaded donations from API:', donations.length);
+            return donations;
         }
     } catch (apiError) {
         console.warn('API недоступен, используем локальные данные:', apiError);
@@ -425,6 +445,7 @@ async function exportFinancialReport() {
 
 // Экспорт функций глобально
 window.exportDonationsToExcel = exportDonationsToExcel;
+window.downloadServerExport = downloadServerExport;
 window.exportDonations = exportDonations;
 window.saveDonation = saveDonation;
 window.exportFinancialReport = exportFinancialReport;
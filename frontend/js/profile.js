@@ -703,6 +703,118 @@ function tProfile(key, fallback) {
     return fallback;
 }
 
+// История пожертвований грузится страницами: следующая - по кнопке «Показать еще»
+const DONATION_HISTORY_PAGE_SIZE = 10;
+// Курсор следующей страницы из API (next_cursor) и параметры запроса истории
+let donationHistoryNextCursor = null;
+let donationHistoryParams = null;
+// Уже загруженные, но еще не показанные пожертвования (локальная БД)
+let donationHistoryPending = [];
+
+const DONATION_PURPOSE_NAMES = {
+    'food': 'Корм для животных',
+    'medical': 'Ветеринарное лечение',
+    'maintenance': 'Содержание приюта',
+    'general': 'Общие нужды'
+};
+
+function formatDonationDate(date) {
+    return date.toLocaleDateString('ru-RU', {
+        year: 'numeric',
+        month: 'long',
+        day: 'numeric'
+    });
+}
+
+// Пожертвование из /api/donations/history в формате списка профиля
+function mapApiDonation(d) {
+    const dateStr = d.paid_at || d.created_at;
+    const date = dateStr ? new Date(dateStr) : new Date();
+    const rawStatus = (d.status || '').toLowerCase();
+    // В тестовом режиме считаем pending как завершенный
+    const normalizedStatus = (rawStatus === 'pending') ? 'completed' : (rawStatus || 'completed');
+    return {
+        rawDate: date.toISOString(),
+        date: formatDonationDate(date),
+        amount: d.amount || 0,
+        purpose: DONATION_PURPOSE_NAMES[d.purpose] || d.purpose || 'Общие нужды',
+        status: normalizedStatus
+    };
+}
+
+function donationItemHtml(d) {
+    const statusKey = (d.status || '').toLowerCase();
+    let statusText;
+    if (statusKey === 'completed' || statusKey === 'succeeded') {
+        statusText = tProfile('profile.donationStatusCompleted', 'Завершено');
+    } else if (statusKey === 'pending') {
+        statusText = tProfile('profile.donationStatusPending', 'В обработке');
+    } else if (statusKey === 'failed') {
+        statusText = tProfile('profile.donationStatusFailed', 'Ошибка');
+    } else {
+        statusText = d.status || '';
+    }
+    const statusClass = statusKey === 'succeeded' ? 'completed' : (statusKey || 'unknown');
+    return `
+        <div class="donation-item">
+            <div class="donation-date">${d.date}</div>
+            <div class="donation-amount">${d.amount.toLocaleString('ru-RU')} ₽</div>
+            <div class="donation-purpose">${d.purpose}</div>
+            <div class="donation-status ${statusClass}">${statusText}</div>
+        </div>
+    `;
+}
+
+// Одна страница истории из API; cursor - next_cursor предыдущей страницы
+function fetchDonationHistoryPage(cursor) {
+    const params = new URLSearchParams(donationHistoryParams);
+    if (cursor) params.set('cursor', cursor);
+    return window.donationsDB.fetchJSONConditional(
+        `http://localhost:5000/api/donations/history?${params.toString()}`
+    );
+}
+
+// Кнопка «Показать еще»: видна, пока есть непоказанные или незагруженные пожертвования
+function updateShowMoreDonationsButton(donationList) {
+    let btn = document.getElementById('showMoreDonations');
+    const hasMore = donationHistoryPending.length > 0 || Boolean(donationHistoryNextCursor);
+    if (!hasMore) {
+        if (btn) btn.remove();
+        return;
+    }
+    if (!btn) {
+        donationList.insertAdjacentHTML('beforeend', `
+            <button id="showMoreDonations" class="btn btn-outline btn-small" style="margin-top: 0.75rem;">
+                ${tProfile('profile.showMoreDonations', 'Показать еще')}
+            </button>
+        `);
+        btn = document.getElementById('showMoreDonations');
+        btn.addEventListener('click', () => showMoreDonations(donationList, btn));
+    }
+}
+
+// Показать следующую страницу: из уже загруженных или запросом с next_cursor
+async function showMoreDonations(donationList, btn) {
+    btn.disabled = true;
+    try {
+        if (donationHistoryPending.length === 0 && donationHistoryNextCursor) {
+            const result = await fetchDonationHistoryPage(donationHistoryNextCursor);
+            if (!result.ok) {
+                throw new Error(`HTTP ${result.status}`);
+            }
+            donationHistoryPending = (result.data.donations || []).map(mapApiDonation);
+            donationHistoryNextCursor = result.data.next_cursor || null;
+        }
+        const page = donationHistoryPending.splice(0, DONATION_HISTORY_PAGE_SIZE);
+        btn.insertAdjacentHTML('beforebegin', page.map(donationItemHtml).join(''));
+    } catch (error) {
+        console.error('Error loading more donations:', error);
+    } finally {
+        btn.disabled = false;
+        updateShowMoreDonationsButton(donationList);
+    }
+}
+
 // Загрузка истории пожертвований
 async function loadDonationHistory() {
     try {
@@ -716,46 +828,31 @@ async function loadDonationHistory() {
         const userId = (normalizedPhone === normalizedTestPhone || userPhone === testPhone) ? 'anna_petrova' : 'user_' + normalizedPhone;
         
         let donations = [];
+        // Итоги за все время: из API (по всем страницам) или по локальной БД
+        let totals = null;
+        donationHistoryNextCursor = null;
+        donationHistoryPending = [];
 
-        // 1. Пытаемся загрузить историю пожертвований из API (основной источник правды)
+        // 1. Пытаемся загрузить первую страницу истории из API (основной источник правды)
         try {
-            const response = await fetch('http://localhost:5000/api/admin/donations?limit=1000');
-            if (response.ok) {
-                const apiDonations = await response.json();
-                const userEmail = localStorage.getItem('userEmail') || '';
-
-                const purposeMap = {
-                    'food': 'Корм для животных',
-                    'medical': 'Ветеринарное лечение',
-                    'maintenance': 'Содержание приюта',
-                    'general': 'Общие нужды'
-                };
-
-                const userDonations = apiDonations.filter(d => {
-                    const samePhone = d.phone === userPhone;
-                    const sameEmail = userEmail && d.email === userEmail;
-                    return samePhone || sameEmail;
-                });
-
-                donations = userDonations.map(d => {
-                    const dateStr = d.paid_at || d.created_at;
-                    const date = dateStr ? new Date(dateStr) : new Date();
-                    const formattedDate = date.toLocaleDateString('ru-RU', {
-                        year: 'numeric',
-                        month: 'long',
-                        day: 'numeric'
-                    });
-                    const rawStatus = (d.status || '').toLowerCase();
-                    // В тестовом режиме считаем pending как завершенный
-                    const normalizedStatus = (rawStatus === 'pending') ? 'completed' : (rawStatus || 'completed');
-                    return {
-                        rawDate: date.toISOString(),
-                        date: formattedDate,
-                        amount: d.amount || 0,
-                        purpose: purposeMap[d.purpose] || d.purpose || 'Общие нужды',
-                        status: normalizedStatus
-                    };
-                }).sort((a, b) => new Date(b.rawDate) - new Date(a.rawDate));
+            // История только текущего пользователя: сервер ищет по user_id, телефону и email
+            const userEmail = localStorage.getItem('userEmail') || '';
+            const storedUserId = localStorage.getItem('userId');
+            const params = new URLSearchParams({ phone: userPhone, limit: String(DONATION_HISTORY_PAGE_SIZE) });
+            if (userEmail) params.set('email', userEmail);
+            if (storedUserId && /^\d+$/.test(storedUserId)) params.set('user_id', storedUserId);
+            donationHistoryParams = params;
+
+            const result = await fetchDonationHistoryPage(null);
+            if (result.ok) {
+                const history = result.data;
+                // Сервер отдает новые первыми; следующие страницы - по next_cursor
+                donations = (history.donations || []).map(mapApiDonation);
+                donationHistoryNextCursor = history.next_cursor || null;
+                const lifetime = history.totals && history.totals.lifetime;
+                if (lifetime) {
+                    totals = { count: lifetime.count, amount: lifetime.amount };
+                }
             }
         } catch (apiError) {
             console.warn('API недоступен для истории пожертвований, используем локальную БД:', apiError);
@@ -763,6 +860,7 @@ async function loadDonationHistory() {
 
         // 2. Если из API ничего не получили — используем локальную БД (donationsDB)
         if (donations.length === 0 && window.donationsDB) {
+            donationHistoryNextCursor = null;
             // Загружаем все пожертвования и фильтруем по userId, телефону или email
             const allDonations = await window.donationsDB.getAllDonations();
             const userEmail = localStorage.getItem('userEmail') || '';
@@ -774,21 +872,24 @@ async function loadDonationHistory() {
                 return sameUserId || samePhone || sameEmail;
             });
             
-            donations = userDonations.map(d => {
+            const localDonations = userDonations.map(d => {
                 const date = new Date(d.date);
-                const formattedDate = date.toLocaleDateString('ru-RU', {
-                    year: 'numeric',
-                    month: 'long',
-                    day: 'numeric'
-                });
                 return {
                     rawDate: d.date,
-                    date: formattedDate,
+                    date: formatDonationDate(date),
                     amount: d.amount,
                     purpose: d.purpose,
                     status: d.status
                 };
             }).sort((a, b) => new Date(b.rawDate) - new Date(a.rawDate));
+            if (localDonations.length > 0) {
+                totals = {
+                    count: localDonations.length,
+                    amount: localDonations.reduce((sum, d) => sum + (d.amount || 0), 0)
+                };
+            }
+            donations = localDonations.slice(0, DONATION_HISTORY_PAGE_SIZE);
+            donationHistoryPending = localDonations.slice(DONATION_HISTORY_PAGE_SIZE);
         }
         
         // Обновление списка пожертвований в HTML
@@ -804,93 +905,21 @@ async function loadDonationHistory() {
                     </div>
                 `;
             } else {
-                const maxVisible = 5;
-                const visible = donations.slice(0, maxVisible);
-                const hidden = donations.slice(maxVisible);
-                
-                const visibleHtml = visible.map(d => {
-                    const statusKey = (d.status || '').toLowerCase();
-                    let statusText;
-                    if (statusKey === 'completed' || statusKey === 'succeeded') {
-                        statusText = tProfile('profile.donationStatusCompleted', 'Завершено');
-                    } else if (statusKey === 'pending') {
-                        statusText = tProfile('profile.donationStatusPending', 'В обработке');
-                    } else if (statusKey === 'failed') {
-                        statusText = tProfile('profile.donationStatusFailed', 'Ошибка');
-                    } else {
-                        statusText = d.status || '';
-                    }
-                    const statusClass = statusKey === 'succeeded' ? 'completed' : (statusKey || 'unknown');
-                    return `
-                        <div class="donation-item">
-                            <div class="donation-date">${d.date}</div>
-                            <div class="donation-amount">${d.amount.toLocaleString('ru-RU')} ₽</div>
-                            <div class="donation-purpose">${d.purpose}</div>
-                            <div class="donation-status ${statusClass}">${statusText}</div>
-                        </div>
-                    `;
-                }).join('');
-                
-                const hiddenHtml = hidden.map(d => {
-                    const statusKey = (d.status || '').toLowerCase();
-                    let statusText;
-                    if (statusKey === 'completed' || statusKey === 'succeeded') {
-                        statusText = tProfile('profile.donationStatusCompleted', 'Завершено');
-                    } else if (statusKey === 'pending') {
-                        statusText = tProfile('profile.donationStatusPending', 'В обработке');
-                    } else if (statusKey === 'failed') {
-                        statusText = tProfile('profile.donationStatusFailed', 'Ошибка');
-                    } else {
-                        statusText = d.status || '';
-                    }
-                    const statusClass = statusKey === 'succeeded' ? 'completed' : (statusKey || 'unknown');
-                    return `
-                        <div class="donation-item donation-item-hidden" style="display: none;">
-                            <div class="donation-date">${d.date}</div>
-                            <div class="donation-amount">${d.amount.toLocaleString('ru-RU')} ₽</div>
-                            <div class="donation-purpose">${d.purpose}</div>
-                            <div class="donation-status ${statusClass}">${statusText}</div>
-                        </div>
-                    `;
-                }).join('');
-                
-                const showMoreButton = hidden.length > 0
-                    ? `<button id="showMoreDonations" class="btn btn-outline btn-small" style="margin-top: 0.75rem;">
-                            ${tProfile('profile.showMoreDonations', 'Показать все пожертвования')}
-                       </button>`
-                    : '';
-                
-                donationList.innerHTML = visibleHtml + hiddenHtml + showMoreButton;
-                
-                if (hidden.length > 0) {
-                    const btn = document.getElementById('showMoreDonations');
-                    if (btn) {
-                        btn.addEventListener('click', function() {
-                            const hiddenItems = donationList.querySelectorAll('.donation-item-hidden');
-                            hiddenItems.forEach(item => {
-                                // Используем тот же layout, что и для видимых элементов
-                                item.style.display = 'grid';
-                            });
-                            btn.style.display = 'none';
-                        });
-                    }
-                }
+                donationList.innerHTML = donations.map(donationItemHtml).join('');
+                updateShowMoreDonationsButton(donationList);
             }
         }
         
-        // Обновление статистики профиля с реальными данными пожертвований
-        if (donations.length > 0) {
-            // Вычисление общей суммы из фактических сумм пожертвований
-            const totalAmount = donations.reduce((sum, d) => sum + (d.amount || 0), 0);
-            
+        // Обновление статистики профиля по итогам за все время, а не по показанной странице
+        if (totals && totals.count > 0) {
             const statNumber = document.getElementById('statDonationsCount');
             const statAmount = document.getElementById('statTotalAmount');
-            if (statNumber) statNumber.textContent = donations.length;
-            if (statAmount) statAmount.textContent = totalAmount.toLocaleString('ru-RU') + ' ₽';
+            if (statNumber) statNumber.textContent = totals.count;
+            if (statAmount) statAmount.textContent = totals.amount.toLocaleString('ru-RU') + ' ₽';
             
             // Сохранение в localStorage для loadUserData
-            localStorage.setItem('userTotalDonations', donations.length);
-            localStorage.setItem('userTotalAmount', totalAmount);
+            localStorage.setItem('userTotalDonations', totals.count);
+            localStorage.setItem('userTotalAmount', totals.amount);
         }
         
         // Обеспечить видимость секции профиля после загрузки данных
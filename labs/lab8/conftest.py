@@ -0,0 +1,78 @@
+"""
+Общая настройка тестов лабораторной работы №8
+
+- backend/ добавляется в sys.path, чтобы работал импорт `from database import ...`
+  внутри backend/app.py;
+- тесты работают с временной БД (SHELTER_DB_PATH), а не с backend/shelter.db;
+- ограничение частоты запросов по умолчанию выключено (RATE_LIMIT_ENABLED);
+- фоновые воркеры и обслуживание БД в app.py не запускаются: воркеры запускают тесты,
+  которым они нужны, а после каждого теста они останавливаются;
+- общие фикстуры client и db для тестов API и БД.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+_tmp_dir = tempfile.mkdtemp(prefix='shelter-tests-')
+os.environ.setdefault('SHELTER_DB_PATH', os.path.join(_tmp_dir, 'shelter.db'))
+# Ограничение частоты проверяется отдельно (test_rate_limit.py), остальным тестам оно мешает
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+# Фоновые потоки app.py: воркеры, оставшиеся от прошлого теста, натыкались бы на строки,
+# удаленные фикстурой db, а обслуживание БД проверяется отдельно (test_database.py)
+os.environ.setdefault('PAYMENT_WORKERS', '0')
+os.environ.setdefault('WEBHOOK_WORKERS', '0')
+os.environ.setdefault('SHELTER_DB_MAINTENANCE_INTERVAL', '0')
+
+
+# ==================== FIXTURES ==================== #
+
+def _clear_tables(session):
+    """Удалить строки всех таблиц, которые заполняют тесты (дочерние - первыми)"""
+    from database import (Donation, DonationDailyStat, PaymentIntent, PaymentMethod, Subscription,
+                          User, WebhookEvent)
+
+    session.rollback()
+    for model in (WebhookEvent, PaymentIntent, Donation, DonationDailyStat, Subscription, PaymentMethod, User):
+        session.query(model).delete()
+    session.commit()
+
+
+@pytest.fixture(autouse=True)
+def stop_background_workers():
+    """Остановить воркеры платежей и webhook, запущенные тестом"""
+    yield
+    import payment_outbox
+    import webhook_queue
+
+    payment_outbox.stop_payment_workers()
+    webhook_queue.stop_webhook_workers()
+
+
+@pytest.fixture
+def client():
+    """Тестовый клиент Flask с пустым кэшем ответов"""
+    from backend.app import app
+    from response_cache import response_cache
+
+    app.testing = True
+    response_cache.clear()
+    with app.test_client() as c:
+        yield c
+
+
+@pytest.fixture
+def db():
+    """Сессия временной БД; таблицы очищаются до и после теста"""
+    from backend.app import SessionLocal
+
+    session = SessionLocal()
+    _clear_tables(session)
+    yield session
+    _clear_tables(session)
+    session.close()
@@ -0,0 +1,39 @@
+"""
+Юнит-тесты для сравнения результатов бенчмарка с базовой линией (benchmark.py)
+"""
+import benchmark
+
+
+def report(**p50_by_name):
+    return {'results': {'10000': {
+        name: benchmark.summarize([p50 / 1000] * benchmark.MIN_CALLS, 1) for name, p50 in p50_by_name.items()
+    }}}
+
+
+def test_summarize_percentiles_and_rows_per_second():
+    """Позитивный тест: p50/p99 и строк в секунду по списку задержек"""
+    stats = benchmark.summarize([0.001] * 98 + [0.010, 0.020], rows=1000)
+
+    assert stats['calls'] == 100
+    assert stats['p50_ms'] == 1.0
+    assert stats['p99_ms'] == 20.0
+    assert stats['rows_per_sec'] == round(1000 / 0.128, 1)
+
+
+def test_compare_flags_only_real_regressions():
+    """
+    Негативный тест: регрессия - рост p50 больше порога и больше MIN_REGRESSION_MS
+
+    Ожидаемое поведение:
+    - list: 10 -> 20 ms - регрессия
+    - send_code: 0.2 -> 0.5 ms - в 2.5 раза, но меньше 0.5 ms - шум
+    - create: 10 -> 12 ms - в пределах порога
+    - webhook нет в базовой линии - не сравнивается
+    - recurring: мало вызовов - не сравнивается
+    """
+    baseline = report(list=10, send_code=0.2, create=10)
+    current = report(list=20, send_code=0.5, create=12, webhook=5)
+    baseline['results']['10000']['recurring'] = benchmark.summarize([0.1] * 3, 100)
+    current['results']['10000']['recurring'] = benchmark.summarize([0.5] * 3, 100)
+
+    assert benchmark.compare(current, baseline, threshold=1.5) == [('10000', 'list', 10.0, 20.0)]
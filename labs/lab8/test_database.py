@@ -0,0 +1,56 @@
+"""
+Юнит-тесты для настройки и обслуживания БД
+
+Этот модуль содержит тесты для:
+- PRAGMA, которые выставляются каждому соединению SQLite
+- optimize_database: PRAGMA optimize и checkpoint журнала WAL
+- запуска обслуживания в процессе API под любым WSGI-сервером
+"""
+import backend.app as app_module
+from database import engine, optimize_database, SQLITE_BUSY_TIMEOUT_MS
+
+
+def test_connection_pragmas_applied():
+    """
+    Позитивный тест: новое соединение работает в режиме WAL с busy_timeout
+
+    Ожидаемое поведение:
+    - journal_mode = wal, synchronous = NORMAL (1), temp_store = MEMORY (2)
+    - busy_timeout совпадает с настройкой
+    """
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert conn.exec_driver_sql('PRAGMA synchronous').scalar() == 1
+        assert conn.exec_driver_sql('PRAGMA temp_store').scalar() == 2
+        assert conn.exec_driver_sql('PRAGMA busy_timeout').scalar() == SQLITE_BUSY_TIMEOUT_MS
+
+
+def test_optimize_database_checkpoints_wal():
+    """
+    Позитивный тест: обслуживание БД выполняется без ошибок
+
+    Ожидаемое поведение:
+    - checkpoint не заблокирован (busy = 0)
+    """
+    result = optimize_database()
+
+    assert result['busy'] == 0
+    assert result['checkpointed'] <= result['log_pages']
+
+
+def test_db_maintenance_starts_with_app(monkeypatch):
+    """
+    Позитивный тест: обслуживание БД запускается без python app.py
+
+    Сценарий: приложение обслуживает запрос как WSGI-приложение (тестовый клиент)
+    Ожидаемое поведение: перед первым запросом процесса запущено обслуживание БД
+    """
+    started = []
+    monkeypatch.setattr(app_module, 'start_db_maintenance', lambda: started.append(True))
+    monkeypatch.setattr(app_module, '_background_pid', None)
+
+    with app_module.app.test_client() as client:
+        client.get('/healthz')
+        client.get('/healthz')
+
+    assert started == [True]
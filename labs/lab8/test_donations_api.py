@@ -0,0 +1,423 @@
+"""
+Юнит-тесты для эндпоинтов пожертвований
+
+Этот модуль содержит тесты для HTTP эндпоинтов:
+- /api/admin/donations: keyset-пагинация и серверные фильтры
+- /api/admin/donations/monthly-stats: статистика по дням
+- /api/donations/history: история донатов одного пользователя
+- /api/admin/dashboard: сводка для главной страницы админки
+- /api/admin/donations/export: потоковая выгрузка в CSV и XLSX
+- /api/admin/donations?stream=1: построчный ответ NDJSON
+"""
+import io
+import json
+import zipfile
+from datetime import datetime, timedelta
+from xml.etree import ElementTree
+
+import backend.app as app_module
+from backend.app import Donation
+from database import DonationDailyStat
+from donation_stats import rebuild_daily_stats, verify_daily_stats
+
+
+# ==================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==================== #
+
+def add_donations(db, count, **overrides):
+    """Добавить count донатов с created_at, убывающим на минуту"""
+    base = datetime(2025, 3, 15, 12, 0, 0)
+    for i in range(count):
+        fields = {
+            'public_name': f'Донор {i}',
+            'amount': 100 + i,
+            'purpose': 'food',
+            'status': 'succeeded',
+            'created_at': base - timedelta(minutes=i),
+        }
+        fields.update(overrides)
+        db.add(Donation(**fields))
+    db.commit()
+
+
+# ==================== ТЕСТЫ ДЛЯ /api/admin/donations ==================== #
+
+def test_donations_cursor_pagination_walks_all_rows(client, db):
+    """
+    Позитивный тест: обход всех страниц по курсору
+
+    Ожидаемое поведение:
+    - каждая страница не больше limit
+    - записи не повторяются и идут по убыванию created_at
+    - у последней страницы next_cursor равен null
+    """
+    add_donations(db, 7)
+
+    seen = []
+    cursor = None
+    while True:
+        url = '/api/admin/donations?limit=3' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page['donations']) <= 3
+        seen.extend(page['donations'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    assert len(seen) == 7
+    assert len({d['id'] for d in seen}) == 7
+    created = [d['created_at'] for d in seen]
+    assert created == sorted(created, reverse=True)
+
+
+def test_donations_cursor_handles_equal_created_at(client, db):
+    """
+    Позитивный тест: одинаковый created_at у нескольких записей
+
+    Ожидаемое поведение:
+    - id используется как второй ключ, записи не теряются на границе страниц
+    """
+    add_donations(db, 5, created_at=datetime(2025, 3, 1, 10, 0, 0))
+
+    first = client.get('/api/admin/donations?limit=2').get_json()
+    rest = client.get(f"/api/admin/donations?limit=10&cursor={first['next_cursor']}").get_json()
+
+    ids = [d['id'] for d in first['donations']] + [d['id'] for d in rest['donations']]
+    assert len(set(ids)) == 5
+    assert rest['next_cursor'] is None
+
+
+def test_donations_server_side_filters(client, db):
+    """
+    Позитивный тест: фильтры status (в том числе список через запятую), purpose,
+    is_recurring и диапазон дат
+    """
+    add_donations(db, 2, purpose='medical', status='pending')
+    add_donations(db, 3, purpose='food', is_recurring=True,
+                  created_at=datetime(2025, 1, 10, 9, 0, 0))
+
+    response = client.get('/api/admin/donations?purpose=medical&status=pending')
+    assert len(response.get_json()['donations']) == 2
+
+    response = client.get('/api/admin/donations?is_recurring=true')
+    assert len(response.get_json()['donations']) == 3
+
+    response = client.get('/api/admin/donations?date_from=2025-01-01&date_to=2025-01-31')
+    assert len(response.get_json()['donations']) == 3
+
+    add_donations(db, 1, status='canceled')
+    response = client.get('/api/admin/donations?status=succeeded,pending')
+    assert {d['status'] for d in response.get_json()['donations']} == {'succeeded', 'pending'}
+    assert len(response.get_json()['donations']) == 5
+
+
+def test_donations_invalid_cursor(client, db):
+    """
+    Негативный тест: поврежденный курсор
+
+    Ожидаемое поведение:
+    - HTTP статус 400 и сообщение об ошибке
+    """
+    response = client.get('/api/admin/donations?cursor=not-a-cursor')
+
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+# ==================== ТЕСТЫ ДЛЯ /api/admin/donations/monthly-stats ==================== #
+
+def test_monthly_stats_groups_by_effective_date(client, db):
+    """
+    Позитивный тест: группировка по дням по paid_at, а при его отсутствии по created_at
+
+    Сценарий:
+    - донат создан в феврале, но оплачен 3 марта - попадает в март
+    - pending-донат без paid_at от 5 марта - попадает в март
+    - отмененный донат не учитывается
+    """
+    db.add(Donation(public_name='A', amount=500, purpose='food', status='succeeded',
+                    created_at=datetime(2025, 2, 27, 10, 0), paid_at=datetime(2025, 3, 3, 9, 0)))
+    db.add(Donation(public_name='B', amount=200, purpose='food', status='pending',
+                    created_at=datetime(2025, 3, 5, 23, 59)))
+    db.add(Donation(public_name='C', amount=900, purpose='food', status='canceled',
+                    created_at=datetime(2025, 3, 5, 12, 0)))
+    db.commit()
+
+    data = client.get('/api/admin/donations/monthly-stats?year=2025&month=3').get_json()
+
+    assert data['total'] == 700
+    assert len(data['by_day']) == 31
+    assert data['by_day'][2] == {'day': 3, 'amount': 500}
+    assert data['by_day'][4] == {'day': 5, 'amount': 200}
+
+    february = client.get('/api/admin/donations/monthly-stats?year=2025&month=2').get_json()
+    assert february['total'] == 0
+
+
+def test_monthly_stats_invalid_month(client, db):
+    """
+    Негативный тест: номер месяца вне диапазона 1-12
+
+    Ожидаемое поведение:
+    - HTTP статус 400
+    """
+    response = client.get('/api/admin/donations/monthly-stats?year=2025&month=13')
+
+    assert response.status_code == 400
+
+
+# ==================== ТЕСТЫ ДЛЯ СВОДКИ donation_daily_stats ==================== #
+
+def test_daily_stats_follow_status_transitions(db):
+    """
+    Позитивный тест: сводка обновляется при создании и смене статуса доната
+
+    Сценарий:
+    - pending-донат создан 28 февраля
+    - 2 марта он оплачен: строка переезжает в (2 марта, succeeded)
+    - сводка совпадает с пересчетом по таблице donations
+    """
+    donation = Donation(public_name='A', amount=150.5, purpose='medical', status='pending',
+                        created_at=datetime(2025, 2, 28, 23, 0))
+    db.add(donation)
+    db.commit()
+
+    donation.status = 'succeeded'
+    donation.paid_at = datetime(2025, 3, 2, 8, 0)
+    db.commit()
+
+    rows = {(r.day.isoformat(), r.status): (r.donations_count, r.amount_kopecks)
+            for r in db.query(DonationDailyStat).all()}
+    assert rows[('2025-02-28', 'pending')] == (0, 0)
+    assert rows[('2025-03-02', 'succeeded')] == (1, 15050)
+    assert verify_daily_stats(db) == []
+
+
+def test_daily_stats_rebuild_detects_and_fixes_drift(db):
+    """
+    Негативный тест: сводка разошлась с donations (вставка в обход ORM)
+
+    Ожидаемое поведение:
+    - verify находит расхождение
+    - после rebuild расхождений нет
+    """
+    db.add(Donation(public_name='A', amount=300, purpose='food', status='succeeded',
+                    created_at=datetime(2025, 4, 1, 10, 0)))
+    db.commit()
+    db.query(DonationDailyStat).delete()
+    db.commit()
+
+    assert len(verify_daily_stats(db)) == 1
+
+    rebuild_daily_stats(db)
+
+    assert verify_daily_stats(db) == []
+
+
+# ==================== ТЕСТЫ ДЛЯ /api/donations/history ==================== #
+
+def test_donation_history_returns_only_owner_rows(client, db):
+    """
+    Позитивный тест: история одного пользователя с итогами
+
+    Сценарий:
+    - два доната с телефоном пользователя (один записан в исходном формате), один по email
+    - донат другого человека в ответ не попадает
+    - отмененный донат есть в истории, но не входит в итоги
+    """
+    add_donations(db, 1, phone='+7 (999) 123-45-67', purpose='food', amount=500)
+    add_donations(db, 1, phone='+79991234567', purpose='medical', amount=300)
+    add_donations(db, 1, email='user@mail.ru', purpose='food', amount=200, status='canceled')
+    add_donations(db, 1, phone='+70000000000', amount=10000)
+
+    response = client.get('/api/donations/history?phone=%2B7%20(999)%20123-45-67&email=user@mail.ru')
+    assert response.status_code == 200
+    data = response.get_json()
+
+    assert len(data['donations']) == 3
+    assert data['next_cursor'] is None
+    assert data['totals']['lifetime'] == {'count': 2, 'amount': 800}
+    assert data['totals']['by_purpose']['food'] == {'count': 1, 'amount': 500}
+
+
+def test_donation_history_requires_identifier(client, db):
+    """
+    Негативный тест: не передан ни user_id, ни phone, ни email
+
+    Ожидаемое поведение:
+    - HTTP статус 400
+    """
+    response = client.get('/api/donations/history')
+
+    assert response.status_code == 400
+
+
+# ==================== ТЕСТЫ ДЛЯ /api/admin/dashboard ==================== #
+
+def test_dashboard_excludes_test_donors(client, db):
+    """
+    Позитивный тест: сводка за месяц без тестовых доноров
+
+    Сценарий:
+    - два обычных доната в марте и донат тестового донора "Влад"
+    - тестовый донор не входит ни в сумму, ни в последние донаты
+    """
+    add_donations(db, 2, amount=1000, created_at=datetime(2025, 3, 10, 12, 0))
+    add_donations(db, 1, amount=5000, public_name='Влад Тестовый',
+                  created_at=datetime(2025, 3, 10, 13, 0))
+
+    response = client.get('/api/admin/dashboard?year=2025&month=3')
+    assert response.status_code == 200
+    data = response.get_json()
+
+    assert data['month_total'] == 2000
+    assert data['donations_count'] == 2
+    assert data['by_day'][9] == {'day': 10, 'amount': 2000}
+    assert all('Влад' not in d['public_name'] for d in data['recent_donations'])
+    assert len(data['recent_donations']) == 2
+    assert data['active_subscriptions'] == 0
+
+
+# ==================== ТЕСТЫ ДЛЯ /api/admin/donations/export ==================== #
+
+def test_export_csv_with_filters(client, db):
+    """
+    Позитивный тест: CSV-выгрузка с фильтром по назначению
+
+    Ожидаемое поведение:
+    - заголовок и по строке на каждый подходящий донат
+    - назначение переведено на русский
+    """
+    add_donations(db, 3, purpose='medical')
+    add_donations(db, 2, purpose='food')
+
+    response = client.get('/api/admin/donations/export?format=csv&purpose=medical')
+    assert response.status_code == 200
+    assert 'attachment' in response.headers['Content-Disposition']
+
+    lines = response.get_data().decode('utf-8-sig').strip().splitlines()
+    assert len(lines) == 4
+    assert lines[0].startswith('Дата;Время;Сумма (₽)')
+    assert all('Ветеринарное лечение' in line for line in lines[1:])
+
+
+def test_export_xlsx_is_valid_workbook(client, db):
+    """
+    Позитивный тест: XLSX-выгрузка открывается как zip с листом в формате SpreadsheetML
+
+    Ожидаемое поведение:
+    - в листе строка заголовка и по строке на каждый донат
+    """
+    add_donations(db, 1200)
+
+    response = client.get('/api/admin/donations/export?format=xlsx')
+    assert response.status_code == 200
+
+    archive = zipfile.ZipFile(io.BytesIO(response.get_data()))
+    assert archive.testzip() is None
+    sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+    namespace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+    assert len(sheet.findall(f'{namespace}sheetData/{namespace}row')) == 1201
+
+
+def test_export_unknown_format(client, db):
+    """
+    Негативный тест: неподдерживаемый формат выгрузки
+
+    Ожидаемое поведение:
+    - HTTP статус 400
+    """
+    response = client.get('/api/admin/donations/export?format=pdf')
+
+    assert response.status_code == 400
+
+
+# ==================== ТЕСТЫ ДЛЯ NDJSON ==================== #
+
+def test_donations_ndjson_stream_returns_all_rows(client, db):
+    """
+    Позитивный тест: ?stream=1 отдает всю выборку по строке JSON на донат
+
+    Сценарий:
+    - 1200 донатов - больше MAX_PAGE_SIZE и больше одной порции чтения
+    - без limit приходят все строки, порядок и поля те же, что у обычного списка
+    - ответ потоковый: строки - сами записи, без обертки и next_cursor
+    """
+    add_donations(db, 1200)
+
+    response = client.get('/api/admin/donations?stream=1')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+
+    lines = response.get_data().decode('utf-8').splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert len(rows) == 1200
+    assert rows[:50] == client.get('/api/admin/donations?limit=50').get_json()['donations']
+
+
+def test_donations_ndjson_accept_header_filters_and_chunks(client, db, monkeypatch):
+    """
+    Позитивный тест: Accept: application/x-ndjson с фильтрами, limit и курсором
+
+    Ожидаемое поведение:
+    - фильтры и cursor работают так же, как у постраничного списка
+    - строки уходят порциями по STREAM_CHUNK_ROWS, а не одним куском
+    """
+    monkeypatch.setattr(app_module, 'STREAM_CHUNK_ROWS', 2)
+    add_donations(db, 5, purpose='medical')
+    add_donations(db, 3, purpose='food')
+    headers = {'Accept': 'application/x-ndjson'}
+
+    response = client.get('/api/admin/donations?purpose=medical', headers=headers, buffered=False)
+    chunks = list(response.response)
+    response.close()
+    assert len(chunks) == 3
+    rows = [json.loads(line) for line in b''.join(chunks).decode('utf-8').splitlines()]
+    assert [row['purpose'] for row in rows] == ['medical'] * 5
+
+    cursor = client.get('/api/admin/donations?purpose=medical&limit=2').get_json()['next_cursor']
+    response = client.get(f'/api/admin/donations?purpose=medical&limit=2&cursor={cursor}', headers=headers)
+    rest = [json.loads(line) for line in response.get_data().decode('utf-8').splitlines()]
+    assert [row['id'] for row in rest] == [row['id'] for row in rows[2:4]]
+
+
+def test_donations_ndjson_invalid_cursor(client, db):
+    """
+    Негативный тест: поврежденный курсор в потоковом режиме
+
+    Ожидаемое поведение:
+    - HTTP статус 400 в JSON до начала потока
+    """
+    response = client.get('/api/admin/donations?stream=1&cursor=not-a-cursor')
+
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_daily_stats_follow_bulk_update_and_delete(client, db):
+    """
+    Позитивный тест: массовые query.update() / query.delete() не оставляют сводку устаревшей
+
+    Сценарий:
+    - итоги марта закэшированы
+    - массовая отмена pending-донатов, затем массовое удаление части донатов
+    Ожидаемое поведение: после каждой записи verify без расхождений, итоги месяца пересчитаны
+    """
+    add_donations(db, 3, status='pending')
+    add_donations(db, 2, purpose='medical', created_at=datetime(2025, 3, 1, 9, 0))
+    url = '/api/admin/donations/monthly-stats?year=2025&month=3'
+    before = client.get(url).get_json()['total']
+
+    db.query(Donation).filter(Donation.status == 'pending').update(
+        {Donation.status: 'canceled'}, synchronize_session=False
+    )
+    db.commit()
+    assert verify_daily_stats(db) == []
+    assert client.get(url).get_json()['total'] == before - (100 + 101 + 102)
+
+    db.query(Donation).filter(Donation.purpose == 'medical').delete(synchronize_session=False)
+    db.commit()
+    assert verify_daily_stats(db) == []
+    assert client.get(url).get_json()['total'] == before - (100 + 101 + 102) - (100 + 101)
@@ -0,0 +1,180 @@
+"""
+Юнит-тесты для ленты изменений админки (events.py, GET /api/admin/events)
+
+Этот модуль содержит тесты для:
+- возобновления по Last-Event-ID и события reset при потере событий
+- пинга простаивающего соединения
+- публикации событий путями записи: отмена подписки, регулярное списание
+- ограничения числа подключений и метрик ленты
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.app import Donation, Subscription, User, PaymentMethod
+from events import EventHub, event_hub
+from metrics import events_collector
+from recurring_charges import run_due_charges
+
+
+# ==================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==================== #
+
+def parse_events(text: str) -> list:
+    """Разобрать text/event-stream в список (event, id, data) без комментариев и retry"""
+    events = []
+    for block in text.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith((':', 'retry')))
+        if 'event' in fields:
+            events.append((fields['event'], fields['id'], json.loads(fields['data'])))
+    return events
+
+
+def read_chunks(stream, count: int) -> str:
+    """Прочитать count кусков бесконечного потока и закрыть его"""
+    chunks = [next(stream) for _ in range(count)]
+    stream.close()
+    return ''.join(chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk for chunk in chunks)
+
+
+# ==================== ТЕСТЫ ==================== #
+
+def test_resume_from_last_event_id():
+    """
+    Позитивный тест: переподключение с Last-Event-ID
+
+    Сценарий:
+    - опубликованы три события, клиент видел первое
+    - после переподключения приходят второе и третье, по порядку и с id
+    """
+    hub = EventHub(buffer_size=10)
+    first = hub.publish('donation.created', {'id': 1})
+    hub.publish('donation.status', {'id': 1, 'status': 'succeeded'})
+    third = hub.publish('donation.created', {'id': 2, 'public_name': 'Донор'})
+
+    events = parse_events(read_chunks(hub.stream(first), 2))
+
+    assert [(name, data['id']) for name, _, data in events] == [('donation.status', 1), ('donation.created', 2)]
+    assert events[-1][1] == third
+    assert events[-1][2]['public_name'] == 'Донор'
+
+
+@pytest.mark.parametrize('last_event_id', ['other-1', 'evicted'])
+def test_reset_when_events_lost(last_event_id):
+    """
+    Негативный тест: пропущенных событий нет в буфере
+
+    - id чужого потока (процесс перезапущен)
+    - событие вытеснено из буфера
+    Ожидаемое поведение: событие reset, после него - новые события
+    """
+    hub = EventHub(buffer_size=2)
+    evicted = hub.publish('donation.created', {'id': 1})
+    for donation_id in (2, 3, 4):
+        hub.publish('donation.created', {'id': donation_id})
+
+    stream = hub.stream(evicted if last_event_id == 'evicted' else last_event_id)
+    head = next(stream) + next(stream)
+    hub.publish('donation.created', {'id': 5})
+    events = parse_events(head + next(stream))
+    stream.close()
+
+    assert [name for name, _, _ in events] == ['reset', 'donation.created']
+    assert events[1][2] == {'id': 5}
+
+
+def test_idle_stream_sends_ping():
+    """
+    Позитивный тест: без событий поток шлет комментарий-пинг
+
+    Ожидаемое поведение: новый клиент без Last-Event-ID не получает старые события
+    """
+    hub = EventHub()
+    hub.publish('donation.created', {'id': 1})
+
+    text = read_chunks(hub.stream(heartbeat=0.01), 2)
+
+    assert text.startswith('retry: ')
+    assert text.endswith(': ping\n\n')
+    assert parse_events(text) == []
+
+
+def test_cancel_subscription_published_to_feed(client, db):
+    """
+    Позитивный тест: отмена подписки через API появляется в ленте
+
+    Сценарий:
+    - клиент подключен к /api/admin/events (запомнен id последнего события)
+    - подписка отменяется, клиент переподключается с Last-Event-ID
+    Ожидаемое поведение: событие subscription.canceled с id подписки
+    """
+    user = User(phone='+79005550020')
+    db.add(user)
+    db.flush()
+    subscription = Subscription(user_id=user.id, amount=300, purpose='food', frequency='monthly', status='active')
+    db.add(subscription)
+    db.commit()
+
+    last_event_id = event_hub.publish('donation.created', {'id': 0})
+    assert client.post(f'/api/subscriptions/{subscription.id}/cancel').status_code == 200
+
+    response = client.get('/api/admin/events', headers={'Last-Event-ID': last_event_id}, buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    events = parse_events(read_chunks(iter(response.response), 2))
+
+    assert ('subscription.canceled', {'id': subscription.id, 'user_id': user.id}) in [
+        (name, data) for name, _, data in events
+    ]
+
+
+def test_recurring_charge_published_to_feed(db):
+    """
+    Позитивный тест: регулярное списание (запись в обход ORM) публикует subscription.charged
+    """
+    user = User(phone='+79005550021')
+    db.add(user)
+    db.flush()
+    method = PaymentMethod(user_id=user.id, provider_payment_token='tok')
+    db.add(method)
+    db.flush()
+    subscription = Subscription(user_id=user.id, payment_method_id=method.id, amount=300, purpose='medical',
+                                frequency='monthly', status='active',
+                                next_charge_at=datetime.utcnow() - timedelta(hours=1))
+    db.add(subscription)
+    db.commit()
+
+    last_event_id = event_hub.publish('donation.created', {'id': 0})
+    run_due_charges(lambda **kwargs: {'id': f"pay-{kwargs['idempotence_key']}"})
+
+    events = parse_events(read_chunks(event_hub.stream(last_event_id), 2))
+    charged = [data for name, _, data in events if name == 'subscription.charged']
+    assert len(charged) == 1
+    assert charged[0]['id'] == subscription.id
+    assert charged[0]['amount'] == 300.0
+    assert charged[0]['purpose'] == 'medical'
+    assert db.get(Donation, charged[0]['donation_id']).subscription_id == subscription.id
+
+
+def test_too_many_clients_and_metrics(client, monkeypatch):
+    """
+    Негативный тест: подключений больше EVENTS_MAX_CLIENTS - 503
+
+    Ожидаемое поведение: счетчик клиентов освобождается при закрытии ответа
+    и вместе с опубликованными событиями попадает в метрики
+    """
+    monkeypatch.setattr(event_hub, 'max_clients', 1)
+    first = client.get('/api/admin/events', buffered=False)
+    assert first.status_code == 200
+    assert event_hub.stats()['clients'] == 1
+
+    assert client.get('/api/admin/events').status_code == 503
+
+    first.close()
+    assert event_hub.stats()['clients'] == 0
+
+    hub = EventHub()
+    hub.publish('donation.created', {'id': 1})
+    text = '\n'.join(events_collector(lambda: hub)())
+    assert 'shelter_events_published_total{type="donation.created"} 1' in text
+    assert 'shelter_events_clients 0' in text
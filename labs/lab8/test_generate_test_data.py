@@ -0,0 +1,56 @@
+"""
+Юнит-тесты для массового режима генератора тестовых данных (generate_test_data.py --bulk)
+
+Этот модуль содержит тесты для:
+- детерминированности: одинаковый seed дает одинаковые строки
+- generate_bulk_data: количество строк, связи и сводка donation_daily_stats
+"""
+import random
+
+import generate_test_data
+from backend.app import Donation, Subscription, User
+from donation_stats import verify_daily_stats
+
+
+def test_bulk_rows_are_deterministic():
+    """
+    Позитивный тест: пачка донатов зависит только от seed и номера пачки
+
+    Ожидаемое поведение:
+    - одинаковый seed -> одинаковые строки, другой seed -> другие
+    - у каждого пользователя свой телефон (номер вычисляется из id)
+    """
+    plan = generate_test_data.build_bulk_plan(seed=7, days=365)
+    plan['users'] = 1000
+    plan['subscription_owners'] = [1, 2, 3]
+
+    first = generate_test_data._donation_rows(plan, random.Random('7-donations-0'), 1, 500)
+    second = generate_test_data._donation_rows(plan, random.Random('7-donations-0'), 1, 500)
+    other = generate_test_data._donation_rows(plan, random.Random('8-donations-0'), 1, 500)
+
+    assert first == second
+    assert first != other
+    phones = {generate_test_data.bulk_user_attrs(plan, user_id)[1] for user_id in range(1, 100001)}
+    assert len(phones) == 100000
+
+
+def test_generate_bulk_data_writes_consistent_dataset(db):
+    """
+    Позитивный тест: массовая генерация небольшого набора
+
+    Сценарий:
+    - 200 пользователей, 3000 донатов, 40 подписок, 60 способов оплаты пачками по 500
+    - донаты ссылаются на существующих пользователей и подписки
+    - сводка donation_daily_stats совпадает с пересчетом по donations
+    """
+    result = generate_test_data.generate_bulk_data(200, 3000, 40, 60, seed=1, batch_size=500)
+
+    assert result['donations'] == 3000
+    assert db.query(User).count() == 200
+    assert db.query(Donation).count() == 3000
+    assert db.query(Subscription).count() == 40
+    assert db.query(Donation).filter(Donation.user_id.isnot(None), ~Donation.user_id.in_(
+        db.query(User.id))).count() == 0
+    assert db.query(Donation).filter(Donation.is_recurring.is_(True)).count() > 0
+    assert db.query(Donation).filter(Donation.amount < 100).count() == 0
+    assert verify_daily_stats(db) == []
@@ -0,0 +1,181 @@
+"""
+Юнит-тесты для быстрого чтения списков и JSON-провайдера (json_provider.py)
+
+Этот модуль содержит тесты для:
+- списков донатов, подписок и истории, собранных из кортежей колонок:
+  ответ совпадает с прежней сериализацией ORM-объектов
+- JSON-провайдера на orjson: тот же JSON, что у встроенного провайдера Flask
+- выбора провайдера по JSON_PROVIDER
+- построчного ответа NDJSON для списка подписок
+"""
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from backend.app import Donation, Subscription, User
+from json_provider import OrjsonProvider, init_app
+
+
+# ==================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==================== #
+
+def isoformat(value):
+    """Дата так, как ее раньше отдавали эндпоинты (через ORM)"""
+    return value.isoformat() if value else None
+
+
+# ==================== ТЕСТЫ ==================== #
+
+def test_donation_list_matches_orm_serialization(client, db):
+    """
+    Позитивный тест: список донатов из кортежей совпадает с сериализацией ORM
+
+    Сценарий:
+    - донаты с копейками, с нулевыми микросекундами, без даты оплаты,
+      с кириллицей в имени и с флагом регулярного платежа
+    - /api/admin/donations и /api/donations/history отдают те же значения,
+      что isoformat()/float()/bool по загруженным объектам
+    """
+    user = User(phone='+79005550010')
+    db.add(user)
+    db.flush()
+    db.add_all([
+        Donation(user_id=user.id, public_name='Анна "Лапа"', amount=Decimal('123.45'), purpose='food',
+                 status='succeeded', paid_at=datetime(2024, 5, 1, 12, 0, 0), is_recurring=True,
+                 created_at=datetime(2024, 5, 1, 11, 59, 59, 123456)),
+        Donation(user_id=user.id, public_name='Донор', amount=Decimal('100.00'), purpose='medical',
+                 status='pending', paid_at=None, phone='+79005550010',
+                 created_at=datetime(2024, 5, 2, 8, 30, 0)),
+    ])
+    db.commit()
+
+    db.expire_all()
+    expected = {
+        d.id: {
+            'id': d.id, 'public_name': d.public_name, 'amount': float(d.amount), 'purpose': d.purpose,
+            'status': d.status, 'paid_at': isoformat(d.paid_at), 'created_at': isoformat(d.created_at),
+            'phone': d.phone, 'email': d.email, 'is_recurring': d.is_recurring,
+        }
+        for d in db.query(Donation).all()
+    }
+
+    donations = client.get('/api/admin/donations?limit=10').get_json()['donations']
+    assert {d['id']: d for d in donations} == expected
+    assert isinstance(donations[0]['is_recurring'], bool)
+
+    history = client.get(f'/api/donations/history?user_id={user.id}').get_json()['donations']
+    history_fields = ('id', 'amount', 'purpose', 'status', 'paid_at', 'created_at', 'is_recurring')
+    assert {d['id']: d for d in history} == {
+        donation_id: {name: row[name] for name in history_fields} for donation_id, row in expected.items()
+    }
+
+
+def test_subscription_list_matches_orm_serialization(client, db):
+    """
+    Позитивный тест: список подписок из кортежей совпадает с сериализацией ORM
+
+    Ожидаемое поведение: пустые даты списаний - null, сумма - число
+    """
+    user = User(phone='+79005550011')
+    db.add(user)
+    db.flush()
+    subscription = Subscription(user_id=user.id, amount=Decimal('250.50'), purpose='general',
+                                frequency='monthly', status='active',
+                                next_charge_at=datetime(2024, 6, 1, 9, 0, 0), last_charge_at=None)
+    db.add(subscription)
+    db.commit()
+    db.refresh(subscription)
+
+    result = client.get(f'/api/subscriptions?user_id={user.id}').get_json()
+    assert result == [{
+        'id': subscription.id,
+        'user_id': user.id,
+        'amount': 250.5,
+        'purpose': 'general',
+        'frequency': 'monthly',
+        'status': 'active',
+        'next_charge_at': '2024-06-01T09:00:00',
+        'last_charge_at': None,
+        'created_at': subscription.created_at.isoformat(),
+    }]
+
+
+def test_orjson_provider_matches_default_provider():
+    """
+    Позитивный тест: orjson дает тот же JSON, что встроенный провайдер Flask
+
+    Сценарий:
+    - ключи отсортированы, числа, null, bool, кириллица, datetime (RFC 822) и Decimal
+    - после разбора ответы равны; тело orjson не длиннее (UTF-8 вместо \\uXXXX)
+    """
+    pytest.importorskip('orjson')
+    fast_app = Flask('fast')
+    default_app = Flask('default')
+    assert init_app(fast_app, 'orjson') == 'orjson'
+    assert isinstance(fast_app.json, OrjsonProvider)
+
+    payload = {'b': [1, 2.5, None, True], 'a': 'Кот "Барсик"', 'when': datetime(2024, 5, 1, 12, 0),
+               'amount': Decimal('10.50')}
+    with fast_app.app_context():
+        fast = fast_app.json.response(payload)
+    with default_app.app_context():
+        default = default_app.json.response(payload)
+
+    assert fast.mimetype == 'application/json'
+    assert json.loads(fast.get_data()) == json.loads(default.get_data())
+    assert list(json.loads(fast.get_data())) == sorted(payload)
+    assert len(fast.get_data()) <= len(default.get_data())
+    assert fast_app.json.loads(fast_app.json.dumps(payload)) == json.loads(default_app.json.dumps(payload))
+
+
+def test_orjson_provider_falls_back_for_big_integers():
+    """
+    Негативный тест: целое больше 64 бит orjson не кодирует
+
+    Ожидаемое поведение: ответ строится встроенным json, а не падает
+    """
+    pytest.importorskip('orjson')
+    fast_app = Flask('fast')
+    init_app(fast_app, 'orjson')
+    with fast_app.app_context():
+        response = fast_app.json.response({'value': 2 ** 70})
+    assert json.loads(response.get_data()) == {'value': 2 ** 70}
+
+
+def test_init_app_provider_choice():
+    """
+    Позитивный/негативный тест: выбор провайдера по JSON_PROVIDER
+
+    - default оставляет встроенный провайдер Flask
+    - неизвестное значение - ValueError
+    """
+    plain_app = Flask('plain')
+    assert init_app(plain_app, 'default') == 'default'
+    assert type(plain_app.json) is DefaultJSONProvider
+
+    with pytest.raises(ValueError):
+        init_app(Flask('bad'), 'ujson')
+
+
+def test_subscriptions_ndjson_matches_json_list(client, db):
+    """
+    Позитивный тест: Accept: application/x-ndjson для списка подписок
+
+    Ожидаемое поведение: те же записи, что в JSON-списке, по одной на строку
+    """
+    user = User(phone='+79005550012')
+    db.add(user)
+    db.flush()
+    for amount in (100, 200, 300):
+        db.add(Subscription(user_id=user.id, amount=amount, purpose='food', frequency='monthly', status='active'))
+    db.commit()
+
+    url = f'/api/subscriptions?user_id={user.id}'
+    response = client.get(url, headers={'Accept': 'application/x-ndjson'})
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data().decode('utf-8').splitlines()]
+    assert rows == client.get(url).get_json()
+    assert len(rows) == 3
@@ -0,0 +1,83 @@
+"""
+Юнит-тесты для метрик Prometheus (metrics.py)
+
+Этот модуль содержит тесты для:
+- гистограмм задержки по маршруту, методу и коду ответа
+- числа SQL-запросов на HTTP-запрос
+- GET /healthz
+"""
+import re
+
+import pytest
+
+from backend.app import app
+from metrics import metrics
+
+
+# ==================== FIXTURES ==================== #
+
+@pytest.fixture
+def client():
+    """Тестовый клиент Flask с обнуленными метриками"""
+    app.testing = True
+    metrics.reset()
+    with app.test_client() as c:
+        yield c
+
+
+def sample(text, line_prefix):
+    """Значение строки метрики, начинающейся с line_prefix"""
+    match = re.search(rf'^{re.escape(line_prefix)} (\S+)$', text, re.MULTILINE)
+    assert match, f'нет метрики {line_prefix}'
+    return float(match.group(1))
+
+
+# ==================== ТЕСТЫ ==================== #
+
+def test_request_latency_and_sql_count_per_route(client):
+    """
+    Позитивный тест: запросы учитываются по шаблону маршрута
+
+    Сценарий:
+    - два GET /api/subscriptions и один GET несуществующего платежа (404)
+    - в /metrics счетчики гистограммы по маршруту и коду, а не по пути с id
+    - каждый запрос к подпискам выполнил хотя бы один SQL-запрос
+    """
+    client.get('/api/subscriptions')
+    client.get('/api/subscriptions?status=canceled')
+    assert client.get('/api/donations/999999/payment').status_code == 404
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+
+    labels = '{route="/api/subscriptions",method="GET",status="200"'
+    assert sample(text, f'shelter_http_request_duration_seconds_bucket{labels},le="+Inf"}}') == 2
+    assert sample(text, 'shelter_http_request_duration_seconds_count{route="/api/donations/<int:donation_id>/payment",'
+                        'method="GET",status="404"}') == 1
+    assert '999999' not in text
+
+    queries = sample(text, 'shelter_http_request_sql_queries_sum{route="/api/subscriptions",method="GET"}')
+    assert queries >= 2
+    assert sample(text, 'shelter_sql_queries_total{source="request"}') >= queries
+
+
+def test_provider_and_rate_limit_metrics_are_exported(client):
+    """Позитивный тест: счетчики клиента YooMoney и ограничителя частоты есть в выводе"""
+    text = client.get('/metrics').get_data(as_text=True)
+
+    assert '# TYPE shelter_yoomoney_request_duration_seconds histogram' in text
+    assert 'shelter_yoomoney_requests_total ' in text
+    assert sample(text, 'shelter_yoomoney_circuit_state{state="closed"}') == 1
+    assert 'shelter_rate_limit_requests_total{rule="send-code:phone",result="allowed"}' in text
+
+
+def test_healthz(client):
+    """Позитивный тест: /healthz проверяет БД и возвращает задержку"""
+    response = client.get('/healthz')
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['status'] == 'ok'
+    assert data['db_latency_ms'] >= 0
@@ -0,0 +1,170 @@
+"""
+Юнит-тесты для асинхронного создания платежей (outbox)
+
+Этот модуль содержит тесты для:
+- POST /api/donations: донат и задание на платеж пишутся без обращения к провайдеру
+- GET /api/donations/<id>/payment: ожидание ссылки на оплату
+- воркеров payment_outbox: повтор с тем же Idempotence-Key, окончательная ошибка,
+  запуск один раз на процесс
+
+Вместо YooMoney используется локальная заглушка fake_yoomoney.
+"""
+import time
+
+import pytest
+
+import backend.app as app_module
+import payment_outbox
+from backend.app import Donation
+from database import PaymentIntent
+from fake_yoomoney import FakeYooMoney
+from yoomoney_client import YooMoneyClient
+
+
+# ==================== FIXTURES ==================== #
+
+@pytest.fixture
+def provider(monkeypatch):
+    """Локальная заглушка YooMoney, на которую направлен create_yoomoney_payment, и воркеры платежей"""
+    server = FakeYooMoney().start()
+    monkeypatch.setattr(app_module, 'YOOMONEY_SHOP_ID', 'shop')
+    monkeypatch.setattr(app_module, 'YOOMONEY_SECRET_KEY', 'secret')
+    # Без повторов внутри клиента: повторы в этих тестах - забота outbox
+    monkeypatch.setattr(app_module, 'yoomoney_client', YooMoneyClient(server.url, 'secret', max_retries=0))
+    monkeypatch.setattr(payment_outbox, 'PAYMENT_RETRY_BASE_SECONDS', 0)
+    # Воркеры останавливает общая фикстура stop_background_workers (conftest.py)
+    payment_outbox.start_payment_workers(app_module.create_yoomoney_payment, workers=2)
+    yield server
+    server.stop()
+
+
+def post_donation(client, amount=500):
+    return client.post('/api/donations', json={
+        'amount': amount,
+        'purpose': 'food',
+        'full_name': 'Иван Петров',
+        'anonymous': True
+    })
+
+
+# ==================== ТЕСТЫ ==================== #
+
+def test_create_donation_does_not_wait_for_provider(client, db, provider):
+    """
+    Позитивный тест: медленный провайдер не задерживает прием доната
+
+    Сценарий:
+    - провайдер отвечает через 1 секунду
+    - POST /api/donations отвечает сразу (202) без ссылки на оплату
+    - long poll возвращает ссылку, когда воркер создал платеж
+    """
+    provider.delay = 1.0
+
+    started = time.monotonic()
+    response = post_donation(client)
+    elapsed = time.monotonic() - started
+
+    assert response.status_code == 202
+    assert elapsed < 0.5
+    data = response.get_json()
+    assert data['status'] == 'pending'
+    assert data['payment_url'] is None
+
+    poll = client.get(f"{data['payment_status_url']}?wait=10").get_json()
+    assert poll['payment_status'] == 'created'
+    donation = db.get(Donation, data['donation_id'])
+    assert poll['payment_url'].endswith(f'/checkout/{donation.provider_payment_id}')
+
+
+def test_payment_retry_uses_same_idempotence_key(client, db, provider):
+    """
+    Позитивный тест: после ошибки провайдера платеж создается повтором
+
+    Ожидаемое поведение:
+    - два запроса к провайдеру с одним и тем же Idempotence-Key
+    - задание завершено со второй попытки
+    """
+    provider.failures_left = 1
+
+    data = post_donation(client).get_json()
+    poll = client.get(f"/api/donations/{data['donation_id']}/payment?wait=10").get_json()
+
+    assert poll['payment_status'] == 'created'
+    assert poll['attempts'] == 2
+    assert len(provider.requests) == 2
+    assert provider.requests[0] == provider.requests[1]
+
+
+def test_payment_fails_after_max_attempts(client, db, provider, monkeypatch):
+    """
+    Негативный тест: провайдер все время отвечает ошибкой
+
+    Ожидаемое поведение:
+    - после PAYMENT_MAX_ATTEMPTS попыток задание и донат помечаются failed
+    """
+    monkeypatch.setattr(payment_outbox, 'PAYMENT_MAX_ATTEMPTS', 2)
+    provider.failures_left = 10
+
+    data = post_donation(client).get_json()
+    poll = client.get(f"/api/donations/{data['donation_id']}/payment?wait=10").get_json()
+
+    assert poll['payment_status'] == 'failed'
+    assert poll['error']
+    assert db.get(Donation, data['donation_id']).status == 'failed'
+
+
+def test_claim_intents_is_exclusive(db):
+    """
+    Позитивный тест: одно задание не достается двум воркерам
+
+    Сценарий:
+    - задание в очереди, воркер A забирает его
+    - воркер B ничего не получает, пока не истечет аренда
+    """
+    donation = Donation(public_name='A', amount=300, purpose='food', status='pending')
+    db.add(donation)
+    payment_outbox.enqueue_payment(db, donation, 'test', 'http://localhost/', {})
+    db.commit()
+    intent_id = db.query(PaymentIntent.id).filter(PaymentIntent.donation_id == donation.id).scalar()
+
+    claimed_a = payment_outbox.claim_intents('worker-a', limit=100)
+    claimed_b = payment_outbox.claim_intents('worker-b', limit=100)
+
+    assert intent_id in claimed_a
+    assert intent_id not in claimed_b
+
+
+def test_payment_status_unknown_donation(client, db):
+    """
+    Негативный тест: задания для доната нет
+
+    Ожидаемое поведение:
+    - HTTP статус 404
+    """
+    response = client.get('/api/donations/999999/payment')
+
+    assert response.status_code == 404
+
+
+def test_background_jobs_start_once_per_process(client, db, monkeypatch):
+    """
+    Позитивный тест: воркеры запускаются перед первым запросом процесса, а не каждым донатом
+
+    Сценарий:
+    - процесс еще не обслуживал запросов, затем три запроса, в том числе POST /api/donations
+    - после fork (другой pid) первый запрос запускает задачи заново
+    Ожидаемое поведение: start_background_jobs вызван один раз на процесс
+    """
+    calls = []
+    monkeypatch.setattr(app_module, 'start_background_jobs', lambda: calls.append('start'))
+    monkeypatch.setattr(app_module, '_background_pid', None)
+
+    client.get('/api/donations/999999/payment')
+    assert post_donation(client).status_code == 202
+    client.get('/api/donations/999999/payment')
+    assert calls == ['start']
+
+    monkeypatch.setattr(app_module, '_background_pid', -1)
+    client.get('/api/donations/999999/payment')
+    assert calls == ['start', 'start']
+    assert not [t for t in payment_outbox._workers if t.is_alive()]
@@ -0,0 +1,129 @@
+"""
+Юнит-тесты для диагностики запросов к БД (database.py)
+
+Этот модуль содержит тесты для:
+- query_budget: бюджет запросов для тестов и бенчмарков
+- query_scope: поиск одинаковых запросов в цикле (N+1) с местом вызова
+- лога медленных запросов с EXPLAIN QUERY PLAN
+- validate_database: проверка связей без запроса на каждую строку
+"""
+import pytest
+from sqlalchemy import event
+
+import database
+from backend.app import Donation, User
+from database import QueryBudgetExceeded, query_budget, query_scope
+from generate_test_data import validate_database
+
+
+# ==================== FIXTURES ==================== #
+
+@pytest.fixture
+def users(db):
+    """Пять пользователей"""
+    created = [User(phone=f'+7999000000{i}') for i in range(5)]
+    db.add_all(created)
+    db.commit()
+    return [u.id for u in created]
+
+
+# ==================== ТЕСТЫ ==================== #
+
+def test_query_budget_reports_loop_call_site(db, users):
+    """
+    Негативный тест: запрос на каждого пользователя превышает бюджет
+
+    Ожидаемое поведение:
+    - один запрос с IN укладывается в бюджет 1
+    - цикл из пяти одинаковых запросов - QueryBudgetExceeded
+    - в сообщении число запросов и строка теста, откуда они выполнялись
+    """
+    with query_budget(1) as scope:
+        db.query(User).filter(User.id.in_(users)).all()
+    assert scope.count == 1
+
+    with pytest.raises(QueryBudgetExceeded) as error:
+        with query_budget(3, 'users_loop'):
+            for user_id in users:
+                db.query(User).filter(User.id == user_id).first()
+
+    message = str(error.value)
+    assert 'users_loop: 5 запросов' in message
+    assert '5x test_query_diagnostics.py' in message
+
+
+def test_query_scope_logs_repeated_statement(db, users, monkeypatch, capsys):
+    """
+    Позитивный тест: в режиме диагностики повторяющийся запрос попадает в лог один раз
+
+    Сценарий:
+    - порог 3 повтора, 5 одинаковых запросов
+    - в логе имя scope и место вызова, сообщение не дублируется
+    """
+    monkeypatch.setattr(database, 'DB_DIAGNOSTICS', True)
+    with query_scope('job', repeat_threshold=3) as scope:
+        for user_id in users:
+            db.query(User).filter(User.id == user_id).first()
+
+    assert scope.repeated()[0][0] == 5
+    output = capsys.readouterr().out
+    assert output.count('[DB] Повторяющийся запрос в job') == 1
+    assert 'test_query_diagnostics.py' in output
+
+
+def test_slow_query_log_includes_plan(db, users, monkeypatch, capsys):
+    """Позитивный тест: запрос дольше порога логируется вместе с EXPLAIN QUERY PLAN"""
+    monkeypatch.setattr(database, 'DB_DIAGNOSTICS', True)
+    monkeypatch.setattr(database, 'DB_SLOW_QUERY_MS', 0)
+    with query_scope('slow'):
+        db.query(User).filter(User.phone == '+79990000001').first()
+
+    output = capsys.readouterr().out
+    assert '[DB] Медленный запрос' in output
+    assert 'FROM users' in output
+    assert 'SEARCH users USING' in output
+
+
+def test_validate_database_finds_orphans_in_constant_queries(db, users):
+    """
+    Негативный тест: донат ссылается на несуществующего пользователя
+
+    Ожидаемое поведение:
+    - ошибка с числом таких донатов
+    - число запросов не зависит от числа строк
+    """
+    db.add_all([Donation(public_name='Аноним', amount=500, purpose='food', user_id=users[0]),
+                Donation(public_name='Аноним', amount=500, purpose='food', user_id=999999)])
+    db.commit()
+
+    with query_budget(10):
+        errors, warnings = validate_database(db)
+
+    assert errors == ['Найдены пожертвования с несуществующими пользователями: 1']
+    assert warnings == []
+
+
+def test_query_budget_removes_engine_listeners(db, users):
+    """
+    Позитивный тест: после query_budget события движка отключены
+
+    Сценарий:
+    - вложенные бюджеты: подписка одна, снимается при выходе из внешнего
+    - бюджет, завершившийся QueryBudgetExceeded, тоже отписывается
+    Ожидаемое поведение: запросы вне бюджета не проходят через диагностику
+    """
+    def subscribed():
+        return event.contains(database.engine, 'before_cursor_execute', database._before_cursor_execute)
+
+    assert not subscribed()
+    with query_budget(2, name='outer'):
+        with query_budget(1, name='inner'):
+            db.query(User).first()
+        assert subscribed()
+        db.query(User).first()
+    assert not subscribed()
+
+    with pytest.raises(QueryBudgetExceeded):
+        with query_budget(0, name='exceeded'):
+            db.query(User).first()
+    assert not subscribed()
@@ -0,0 +1,172 @@
+"""
+Юнит-тесты для ограничения частоты запросов (rate_limit.py)
+
+Этот модуль содержит тесты для:
+- token bucket: исчерпание ведра, пополнение со временем
+- SQLite-бэкенда: ведро общее для двух экземпляров (процессов API),
+  пополнившиеся ведра удаляются из файла
+- эндпоинтов /api/auth/send-code и POST /api/donations: 429 с Retry-After
+"""
+import os
+
+import pytest
+
+import backend.app as app_module
+from backend.app import Donation
+from rate_limit import MemoryBuckets, RateLimiter, SQLiteBuckets
+
+
+# ==================== FIXTURES ==================== #
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """Включенный ограничитель с маленькими ведрами вместо rate_limiter приложения"""
+    limiter = RateLimiter(rules={
+        'send-code:phone': (2, 60),
+        'send-code:ip': (100, 60),
+        'donations:ip': (1, 60),
+        'donations:phone': (100, 60),
+    }, enabled=True)
+    monkeypatch.setattr(app_module, 'rate_limiter', limiter)
+    return limiter
+
+
+# ==================== ТЕСТЫ ==================== #
+
+@pytest.mark.parametrize('buckets', ['memory', 'sqlite'])
+def test_bucket_refills_over_time(buckets, tmp_path):
+    """
+    Позитивный тест: ведро на 2 запроса, пополнение 1 токен в секунду
+
+    Сценарий:
+    - 2 запроса разрешены, третий - ждать 1 секунду
+    - через 0.5 секунды ждать еще 0.5, через 1 секунду запрос разрешен
+    - другой ключ не затронут
+    """
+    if buckets == 'memory':
+        store = MemoryBuckets()
+    else:
+        store = SQLiteBuckets(os.path.join(tmp_path, 'rate.db'))
+
+    assert store.take('a', 2, 1.0, now=100.0) == 0
+    assert store.take('a', 2, 1.0, now=100.0) == 0
+    assert store.take('a', 2, 1.0, now=100.0) == pytest.approx(1.0)
+    assert store.take('a', 2, 1.0, now=100.5) == pytest.approx(0.5)
+    assert store.take('a', 2, 1.0, now=101.0) == 0
+    assert store.take('b', 2, 1.0, now=101.0) == 0
+
+
+def test_memory_buckets_evict_only_refilled(monkeypatch):
+    """
+    Негативный тест: переполнение ведер в памяти не сбрасывает пустое ведро
+
+    Сценарий:
+    - max_keys=2, ведро 'a' исчерпано, затем запросы с новых ключей 'b' и 'c'
+    - 'c' ждет, пока пополнится самое старое ведро, 'a' по-прежнему ограничен
+    - когда 'a' пополнилось, оно вытесняется и 'c' получает место
+    """
+    store = MemoryBuckets(max_keys=2)
+    assert store.take('a', 1, 0.5, now=100.0) == 0
+    assert store.take('a', 1, 0.5, now=100.0) == pytest.approx(2.0)
+    assert store.take('b', 1, 0.5, now=100.5) == 0
+
+    assert store.take('c', 1, 0.5, now=101.0) == pytest.approx(1.0)
+    assert store.take('a', 1, 0.5, now=101.0) == pytest.approx(1.0)
+
+    assert store.take('c', 1, 0.5, now=103.0) == 0
+    assert store.take('b', 1, 0.5, now=103.0) == 0
+    assert store.take('c', 1, 0.5, now=103.0) == pytest.approx(2.0)
+
+
+def test_sqlite_buckets_are_shared(tmp_path):
+    """Позитивный тест: два процесса API тратят токены одного ведра"""
+    path = os.path.join(tmp_path, 'rate.db')
+    first, second = SQLiteBuckets(path), SQLiteBuckets(path)
+
+    assert first.take('ip', 2, 0.1, now=10.0) == 0
+    assert second.take('ip', 2, 0.1, now=10.0) == 0
+    assert first.take('ip', 2, 0.1, now=10.0) > 0
+
+
+def test_sqlite_buckets_prune_refilled(tmp_path):
+    """
+    Позитивный тест: файл ведер не растет бесконечно
+
+    Сценарий:
+    - ведро 'a' (2 токена, 1 в секунду) пополняется к 101, 'b' (1 токен, 0.5 в секунду) - к 102
+    - очистка в 101.5 удаляет только 'a'; 'b' по-прежнему ограничен
+    - с prune_every=2 каждая вторая проверка удаляет пополнившиеся ведра сама
+    """
+    store = SQLiteBuckets(os.path.join(tmp_path, 'rate.db'), prune_every=0)
+    store.take('a', 2, 1.0, now=100.0)
+    store.take('b', 1, 0.5, now=100.0)
+
+    assert store.prune(101.5) == 1
+    assert store.take('b', 1, 0.5, now=101.5) == pytest.approx(0.5)
+
+    store.prune_every = 2
+    store.take('c', 1, 1.0, now=200.0)
+    store.take('d', 1, 1.0, now=201.5)
+    keys = [row[0] for row in store._conn().execute('SELECT key FROM rate_buckets')]
+    assert keys == ['d']
+
+
+def test_send_code_is_limited_per_phone(client, limiter):
+    """
+    Негативный тест: слишком частые коды на один номер
+
+    Ожидаемое поведение:
+    - третий запрос за минуту -> 429, заголовок Retry-After, в JSON retry_after
+    - другой номер не ограничен
+    - счетчики отражают разрешенные и отклоненные запросы
+    """
+    for _ in range(2):
+        assert client.post('/api/auth/send-code', json={'phone': '+7 999 123-45-67'}).status_code == 200
+
+    response = client.post('/api/auth/send-code', json={'phone': '+79991234567'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['retry_after'] == int(response.headers['Retry-After'])
+
+    assert client.post('/api/auth/send-code', json={'phone': '+79990000000'}).status_code == 200
+    assert limiter.stats()['send-code:phone'] == {'allowed': 3, 'limited': 1}
+
+
+def test_create_donation_is_limited_per_ip(client, db, limiter):
+    """
+    Негативный тест: второй донат с того же IP за минуту отклоняется до записи в БД
+    """
+    payload = {'amount': 500, 'purpose': 'food', 'anonymous': True}
+    first = client.post('/api/donations', json=payload, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    assert first.status_code == 202
+
+    second = client.post('/api/donations', json=payload, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    assert second.status_code == 429
+    assert 'Retry-After' in second.headers
+
+    other = client.post('/api/donations', json=payload, environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert other.status_code == 202
+    assert db.query(Donation).count() == 2
+
+
+def test_forwarded_for_cannot_be_spoofed(client, db, limiter, monkeypatch):
+    """
+    Негативный тест: клиент за прокси подставляет свой X-Forwarded-For
+
+    Сценарий:
+    - API за одним nginx (RATE_LIMIT_TRUST_PROXY=1), nginx дописывает адрес клиента справа
+    - клиент каждый раз присылает новый адрес слева
+    Ожидаемое поведение: ведро выбирается по адресу от nginx, второй донат - 429;
+    другой клиент за тем же прокси не ограничен
+    """
+    monkeypatch.setattr(app_module, 'RATE_LIMIT_TRUST_PROXY', 1)
+    payload = {'amount': 500, 'purpose': 'food', 'anonymous': True}
+
+    def post(forwarded_for):
+        return client.post('/api/donations', json=payload, headers={'X-Forwarded-For': forwarded_for},
+                           environ_base={'REMOTE_ADDR': '10.0.0.254'})
+
+    assert post('1.1.1.1, 203.0.113.5').status_code == 202
+    assert post('2.2.2.2, 203.0.113.5').status_code == 429
+    assert post('203.0.113.6').status_code == 202
+    assert db.query(Donation).count() == 2
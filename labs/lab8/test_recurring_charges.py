@@ -0,0 +1,185 @@
+"""
+Юнит-тесты для обработчика регулярных списаний
+
+Этот модуль содержит тесты для recurring_charges.py:
+- списание по наступившим подпискам и перенос даты следующего списания
+- аренда подписок: параллельные обработчики не списывают дважды
+- ошибка провайдера и подписка без способа оплаты
+- пакетная обработка: число SQL-запросов не зависит от размера пачки
+"""
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+import recurring_charges
+from backend.app import Donation, Subscription, User, PaymentMethod, engine
+from donation_stats import verify_daily_stats
+
+NOW = datetime(2025, 3, 1, 10, 0, 0)
+
+
+# ==================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==================== #
+
+class FakePayments:
+    """create_payment для тестов: запоминает ключи идемпотентности"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.keys = []
+        self._lock = threading.Lock()
+
+    def __call__(self, amount, description, return_url, metadata, idempotence_key=None, **kwargs):
+        with self._lock:
+            self.keys.append(idempotence_key)
+        if self.fail:
+            raise RuntimeError('provider is down')
+        return {'id': f'pay-{idempotence_key}', 'status': 'pending'}
+
+
+def add_subscriptions(db, count, due=True, with_token=True):
+    """Добавить count подписок с отдельными пользователями"""
+    for i in range(count):
+        user = User(phone=f'+7900{len(db.query(User).all()):07d}', full_name=f'Донор {i}')
+        db.add(user)
+        db.flush()
+        method = None
+        if with_token:
+            method = PaymentMethod(user_id=user.id, provider_payment_token=f'tok-{user.id}')
+            db.add(method)
+            db.flush()
+        db.add(Subscription(
+            user_id=user.id,
+            payment_method_id=method.id if method else None,
+            amount=300,
+            purpose='food',
+            frequency='monthly',
+            status='active',
+            next_charge_at=NOW - timedelta(hours=1) if due else NOW + timedelta(days=3)
+        ))
+    db.commit()
+
+
+# ==================== ТЕСТЫ ==================== #
+
+def test_run_due_charges_charges_due_subscriptions(db):
+    """
+    Позитивный тест: списание по наступившим подпискам
+
+    Сценарий:
+    - 5 подписок к списанию, 2 еще не наступили, 1 без способа оплаты
+    - по каждой наступившей создан донат, дата следующего списания сдвинута на месяц
+    - подписка без способа оплаты приостановлена
+    """
+    add_subscriptions(db, 5)
+    add_subscriptions(db, 2, due=False)
+    add_subscriptions(db, 1, with_token=False)
+    payments = FakePayments()
+
+    result = recurring_charges.run_due_charges(payments, batch_size=2, concurrency=3, now=NOW)
+
+    assert result['charged'] == 5
+    assert result['paused'] == 1
+    assert db.query(Donation).filter(Donation.is_recurring.is_(True)).count() == 5
+    assert db.query(Subscription).filter(Subscription.status == 'paused').count() == 1
+    assert db.query(Subscription).filter(Subscription.next_charge_at == datetime(2025, 4, 1, 9, 0)).count() == 5
+    assert db.query(Subscription).filter(Subscription.claimed_by.isnot(None)).count() == 0
+
+
+def test_parallel_runners_do_not_double_charge(db):
+    """
+    Позитивный тест: несколько обработчиков одновременно
+
+    Ожидаемое поведение:
+    - каждая подписка списана ровно один раз (один запрос к провайдеру и один донат)
+    """
+    add_subscriptions(db, 40)
+    payments = FakePayments()
+
+    runners = [
+        threading.Thread(target=recurring_charges.run_due_charges, args=(payments,),
+                         kwargs={'worker_id': f'runner-{n}', 'batch_size': 5, 'concurrency': 4, 'now': NOW})
+        for n in range(3)
+    ]
+    for runner in runners:
+        runner.start()
+    for runner in runners:
+        runner.join()
+
+    assert len(payments.keys) == 40
+    assert len(set(payments.keys)) == 40
+    assert db.query(Donation).count() == 40
+
+
+def test_provider_failure_postpones_retry(db):
+    """
+    Негативный тест: провайдер вернул ошибку
+
+    Ожидаемое поведение:
+    - дата списания не сдвинута, pending-донат остался без платежа
+    - повторная попытка откладывается на RECURRING_RETRY_SECONDS
+    - повтор использует тот же донат, а не создает второй
+    """
+    add_subscriptions(db, 1)
+
+    result = recurring_charges.run_due_charges(FakePayments(fail=True), now=NOW)
+    assert result['failed'] == 1
+    donation = db.query(Donation).one()
+    assert donation.provider_payment_id is None
+
+    # Сразу после ошибки подписка не берется повторно
+    assert recurring_charges.claim_due_subscriptions('other', now=NOW) == []
+
+    subscription = db.query(Subscription).one()
+    assert subscription.next_charge_at == NOW - timedelta(hours=1)
+    assert subscription.claim_expires_at > datetime.utcnow()
+
+    # Срок повтора прошел
+    subscription.claim_expires_at = None
+    db.commit()
+    result = recurring_charges.run_due_charges(FakePayments(), now=NOW)
+    assert result['charged'] == 1
+    db.expire_all()
+    assert db.query(Donation).one().provider_payment_id.startswith('pay-recurring-')
+
+
+def test_expired_lease_is_reclaimed(db):
+    """
+    Позитивный тест: подписку упавшего обработчика забирает другой после истечения аренды
+    """
+    add_subscriptions(db, 1)
+
+    assert len(recurring_charges.claim_due_subscriptions('crashed', now=NOW)) == 1
+    assert recurring_charges.claim_due_subscriptions('other', now=NOW) == []
+
+    later = NOW + timedelta(seconds=recurring_charges.RECURRING_LEASE_SECONDS + 1)
+    assert len(recurring_charges.claim_due_subscriptions('other', now=later)) == 1
+
+
+def test_batch_uses_constant_number_of_statements(db):
+    """
+    Позитивный тест: число SQL-запросов на пачку не зависит от числа подписок
+
+    Сценарий:
+    - 60 подписок к списанию и 5 без способа оплаты обрабатываются одной пачкой
+    - считаются все запросы к БД (executemany - один запрос)
+    """
+    add_subscriptions(db, 60)
+    add_subscriptions(db, 5, with_token=False)
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        result = recurring_charges.run_due_charges(FakePayments(), batch_size=100, now=NOW)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    assert result['charged'] == 60
+    assert result['paused'] == 5
+    assert len(statements) <= 15
+    assert db.query(Donation).count() == 60
+    assert verify_daily_stats(db) == []
@@ -0,0 +1,263 @@
+"""
+Юнит-тесты для кэша ответов админских эндпоинтов (response_cache.py)
+
+Этот модуль содержит тесты для:
+- попадания в кэш и сброса по версии данных при записи донатов и подписок
+- итогов закрытого месяца: запись в текущем месяце их не сбрасывает
+- версий данных при записи в обход ORM (регулярные списания)
+- вытеснения по LRU и метрик hit/miss
+- ETag по версиям данных и ответа 304 на If-None-Match
+"""
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.app import app, Donation, Subscription, User, PaymentMethod
+from database import month_version, query_budget, read_data_versions, engine
+from metrics import response_cache_collector
+from recurring_charges import run_due_charges
+from response_cache import ResponseCache
+
+
+# ==================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==================== #
+
+def add_donation(db, amount, when, status='succeeded'):
+    """Добавить донат через ORM (как это делают API и webhook)"""
+    donation = Donation(public_name='Донор', amount=amount, purpose='food', status=status,
+                        paid_at=when, created_at=when)
+    db.add(donation)
+    db.commit()
+    return donation
+
+
+# ==================== ТЕСТЫ ==================== #
+
+def test_admin_donations_cached_until_donation_write(client, db):
+    """
+    Позитивный тест: список донатов берется из кэша до следующей записи
+
+    Сценарий:
+    - первый запрос строит ответ (MISS), повтор с теми же параметрами - HIT
+    - другие параметры - отдельная запись кэша
+    - новый донат увеличивает версию: следующий ответ пересчитан и содержит его
+    """
+    add_donation(db, 100, datetime.utcnow())
+
+    first = client.get('/api/admin/donations?limit=10')
+    second = client.get('/api/admin/donations?limit=10')
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_json() == first.get_json()
+    assert client.get('/api/admin/donations?limit=5').headers['X-Cache'] == 'MISS'
+
+    add_donation(db, 250, datetime.utcnow())
+
+    third = client.get('/api/admin/donations?limit=10')
+    assert third.headers['X-Cache'] == 'MISS'
+    assert len(third.get_json()['donations']) == len(first.get_json()['donations']) + 1
+
+
+def test_subscriptions_cache_reset_by_cancel(client, db):
+    """
+    Позитивный тест: отмена подписки через API сбрасывает кэш списка подписок
+
+    Ожидаемое поведение: после отмены подписка пропадает из списка активных
+    """
+    user = User(phone='+79005550001')
+    db.add(user)
+    db.flush()
+    subscription = Subscription(user_id=user.id, amount=300, purpose='food', frequency='monthly', status='active')
+    db.add(subscription)
+    db.commit()
+
+    client.get('/api/subscriptions')
+    assert client.get('/api/subscriptions').headers['X-Cache'] == 'HIT'
+
+    assert client.post(f'/api/subscriptions/{subscription.id}/cancel').status_code == 200
+
+    response = client.get('/api/subscriptions')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert subscription.id not in [s['id'] for s in response.get_json()]
+
+
+def test_closed_month_stats_survive_current_month_writes(client, db):
+    """
+    Позитивный тест: итоги закрытого месяца не сбрасываются записями в текущем
+
+    Сценарий:
+    - статистика прошлого месяца закэширована
+    - донат в текущем месяце: прошлый месяц по-прежнему HIT
+    - донат, оплаченный в прошлом месяце: итоги пересчитаны
+    """
+    now = datetime.utcnow()
+    last_month = datetime(now.year, now.month, 1) - timedelta(days=1)
+    url = f'/api/admin/donations/monthly-stats?year={last_month.year}&month={last_month.month}'
+    add_donation(db, 100, last_month)
+
+    before = client.get(url)
+    assert before.headers['X-Cache'] == 'MISS'
+
+    add_donation(db, 500, now)
+    assert client.get(url).headers['X-Cache'] == 'HIT'
+
+    add_donation(db, 40, last_month)
+    after = client.get(url)
+    assert after.headers['X-Cache'] == 'MISS'
+    assert after.get_json()['total'] == before.get_json()['total'] + 40
+
+
+def test_recurring_charge_bumps_versions(db):
+    """
+    Позитивный тест: регулярное списание (вставка донатов в обход ORM)
+    увеличивает версии донатов, подписок и месяца списания
+    """
+    user = User(phone='+79005550002')
+    db.add(user)
+    db.flush()
+    method = PaymentMethod(user_id=user.id, provider_payment_token='tok')
+    db.add(method)
+    db.flush()
+    db.add(Subscription(user_id=user.id, payment_method_id=method.id, amount=300, purpose='food',
+                        frequency='monthly', status='active',
+                        next_charge_at=datetime.utcnow() - timedelta(hours=1)))
+    db.commit()
+
+    now = datetime.utcnow()
+    names = ('donations', 'subscriptions', month_version(now.year, now.month))
+    with engine.connect() as conn:
+        before = read_data_versions(conn, names)
+
+    run_due_charges(lambda **kwargs: {'id': f"pay-{kwargs['idempotence_key']}"})
+
+    with engine.connect() as conn:
+        after = read_data_versions(conn, names)
+    assert all(new > old for new, old in zip(after, before))
+
+
+def test_lru_eviction_and_metrics():
+    """
+    Позитивный тест: кэш ограничен по числу записей, счетчики попадают в метрики
+
+    Сценарий:
+    - кэш на две записи: третья вытесняет дольше всех не использованную
+    - устаревшая версия - промах (stale), запись удаляется
+    """
+    cache = ResponseCache(max_entries=2, max_bytes=1024, ttl=0, enabled=True)
+    with app.test_request_context():
+        for name in ('a', 'b'):
+            cache.put(cache.make_key('/r', {'q': name}), (1,), app.response_class(name))
+        assert cache.get(cache.make_key('/r', {'q': 'a'}), (1,)) is not None
+
+        cache.put(cache.make_key('/r', {'q': 'c'}), (1,), app.response_class('c'))
+        assert cache.get(cache.make_key('/r', {'q': 'b'}), (1,)) is None
+        assert cache.get(cache.make_key('/r', {'q': 'a'}), (1,)).get_data(as_text=True) == 'a'
+        assert cache.get(cache.make_key('/r', {'q': 'a'}), (2,)) is None
+
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 1
+    assert stats['routes']['/r'] == {'hit': 2, 'miss': 1, 'stale': 1, 'store': 3, 'not_modified': 0}
+
+    text = '\n'.join(response_cache_collector(lambda: cache)())
+    assert re.search(r'^shelter_response_cache_requests_total\{route="/r",result="hit"\} 2$', text, re.MULTILINE)
+    assert 'shelter_response_cache_evictions_total 1' in text
+
+
+@pytest.mark.parametrize('url', [
+    '/api/admin/donations?limit=10',
+    '/api/admin/donations/monthly-stats',
+    '/api/admin/dashboard',
+    '/api/donations/history?phone=%2B79005550003',
+    '/api/subscriptions',
+])
+def test_if_none_match_returns_304_without_main_query(client, url):
+    """
+    Позитивный тест: совпавший ETag - 304 без основного запроса
+
+    Ожидаемое поведение:
+    - ответ 200 содержит сильный ETag (без W/)
+    - повтор с If-None-Match получает 304 без тела и с тем же ETag
+    - для 304 выполняется один SQL-запрос - чтение версий данных
+    """
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('"') and not etag.startswith('W/')
+
+    with query_budget(1, name=url):
+        second = client.get(url, headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.get_data() == b''
+    assert second.headers['ETag'] == etag
+
+
+def test_etag_changes_after_write(client, db):
+    """
+    Позитивный тест: после записи доната старый ETag не совпадает
+
+    Сценарий:
+    - история донора получена, ETag запомнен
+    - донор делает новый донат
+    - запрос со старым If-None-Match получает 200 с новым ETag и новым донатом
+    """
+    donation = add_donation(db, 100, datetime.utcnow())
+    donation.phone = '+79005550004'
+    db.commit()
+    url = '/api/donations/history?phone=%2B79005550004'
+
+    first = client.get(url)
+    assert len(first.get_json()['donations']) == 1
+
+    second_donation = add_donation(db, 300, datetime.utcnow())
+    second_donation.phone = '+79005550004'
+    db.commit()
+
+    response = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != first.headers['ETag']
+    assert len(response.get_json()['donations']) == 2
+
+
+def test_etag_depends_on_path_and_query(client, db):
+    """
+    Негативный тест: ETag одной страницы прислан на другую
+
+    Сценарий:
+    - ETag получен для /api/admin/donations?limit=1 и status=succeeded
+    - тот же If-None-Match на другой limit и другой маршрут с теми же версиями
+    Ожидаемое поведение: 200 с другим ETag; порядок параметров на ETag не влияет
+    """
+    add_donation(db, 100, datetime.utcnow())
+    add_donation(db, 200, datetime.utcnow())
+    db.commit()
+
+    first = client.get('/api/admin/donations?limit=1&status=succeeded')
+    etag = first.headers['ETag']
+
+    reordered = client.get('/api/admin/donations?status=succeeded&limit=1', headers={'If-None-Match': etag})
+    assert reordered.status_code == 304
+
+    other_page = client.get('/api/admin/donations?limit=2&status=succeeded', headers={'If-None-Match': etag})
+    assert other_page.status_code == 200
+    assert other_page.headers['ETag'] != etag
+    assert len(other_page.get_json()['donations']) == 2
+
+    other_route = client.get('/api/donations/history?phone=%2B79005550005', headers={'If-None-Match': etag})
+    assert other_route.status_code == 200
+
+
+@pytest.mark.parametrize('url', [
+    '/api/admin/donations?cursor=bad',
+    '/api/admin/donations?date_from=not-a-date',
+    '/api/donations/history?phone=%2B79005550006&cursor=bad',
+])
+def test_invalid_params_rejected_before_etag(client, url):
+    """
+    Негативный тест: некорректный курсор или фильтр с If-None-Match: *
+
+    Ожидаемое поведение: 400, а не 304 - параметры проверяются до сравнения ETag
+    """
+    response = client.get(url, headers={'If-None-Match': '*'})
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,125 @@
+"""
+Юнит-тесты для хранилищ сессий подтверждения (session_store.py)
+
+Этот модуль содержит тесты для:
+- MemorySessionStore: удаление истекших сессий, ограничение размера (LRU)
+- SQLiteSessionStore: сессии видны другому экземпляру (другому процессу API)
+- SessionStore: бэкенд без всех методов интерфейса не создается
+"""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from session_store import MemorySessionStore, SessionStore, SQLiteSessionStore
+
+
+def make_session(phone='+79991234567', minutes=5):
+    now = datetime.utcnow()
+    return {
+        'phone': phone,
+        'code': '1234',
+        'method': 'sms',
+        'created_at': now,
+        'expires_at': now + timedelta(minutes=minutes)
+    }
+
+
+# ==================== ТЕСТЫ ==================== #
+
+def test_memory_store_purges_expired_sessions():
+    """
+    Позитивный тест: истекшие сессии удаляются без обхода всего хранилища
+
+    Сценарий:
+    - 3 сессии уже истекли, затем добавляются живые
+    - следующие записи удаляют истекшие, живые остаются
+    - сессия, записанная заново после истечения, остается
+    """
+    store = MemorySessionStore()
+    for n in range(3):
+        store[f'old-{n}'] = make_session(minutes=-1)
+
+    # Истекшая, но еще не удаленная сессия доступна: эндпоинт ответит "Код истек"
+    assert store.get('old-2')['code'] == '1234'
+
+    store['alive'] = make_session()
+    store['renewed'] = make_session(minutes=-1)
+    store['renewed'] = make_session()
+    store['new'] = make_session()
+
+    assert store.get('old-2') is None
+    assert len(store) == 3
+    assert store.expired == 4
+    assert 'renewed' in store
+
+
+def test_memory_store_evicts_least_recently_used():
+    """
+    Позитивный тест: при превышении max_size вытесняется давно не использованная сессия
+    """
+    store = MemorySessionStore(max_size=3)
+    for name in ('a', 'b', 'c'):
+        store[name] = make_session()
+    store.get('a')
+
+    store['d'] = make_session()
+
+    assert store.get('b') is None
+    assert {name for name in 'acd' if name in store} == {'a', 'c', 'd'}
+    assert store.evicted == 1
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    """
+    Позитивный тест: сессия, созданная одним процессом, проверяется другим
+
+    Ожидаемое поведение:
+    - второй экземпляр с тем же файлом читает сессию, datetime восстанавливаются
+    - удаление видно обоим экземплярам, повторное удаление - KeyError, pop - нет
+    - purge_expired удаляет только истекшие сессии
+    """
+    path = os.path.join(tmp_path, 'sessions.db')
+    sender, verifier = SQLiteSessionStore(path), SQLiteSessionStore(path)
+    session = make_session()
+
+    sender['sid'] = session
+    sender['expired'] = make_session(minutes=-1)
+
+    assert verifier.get('sid') == session
+    assert isinstance(verifier['sid']['expires_at'], datetime)
+
+    assert verifier.purge_expired() == 1
+    assert len(sender) == 1
+
+    del verifier['sid']
+    assert sender.get('sid') is None
+    assert sender.pop('sid') is None
+    try:
+        del sender['sid']
+        assert False, 'ожидался KeyError'
+    except KeyError:
+        pass
+    sender.close()
+    verifier.close()
+
+
+def test_incomplete_store_cannot_be_created():
+    """
+    Негативный тест: бэкенд реализовал не все методы SessionStore
+
+    Ожидаемое поведение: TypeError при создании, а не NotImplementedError
+    при первом обращении из эндпоинта
+    """
+    class DictStore(SessionStore):
+        def __init__(self):
+            self.data = {}
+
+        def __setitem__(self, session_id, session):
+            self.data[session_id] = session
+
+        def get(self, session_id, default=None):
+            return self.data.get(session_id, default)
+
+    with pytest.raises(TypeError):
+        DictStore()
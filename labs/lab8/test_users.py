@@ -0,0 +1,112 @@
+"""
+Юнит-тесты для получения и создания пользователей по телефону
+
+Этот модуль содержит тесты для:
+- get_or_create_user: один UPSERT ... RETURNING, запись только при изменении данных
+- resolve_user_ids: пакетное сопоставление телефонов и id для миграции
+- existing_donation_ids: проверка уже перенесенных донатов пачкой
+"""
+from datetime import datetime
+
+from backend.app import Donation, User, get_or_create_user
+from database import existing_donation_ids, query_budget, resolve_user_ids
+
+
+# ==================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==================== #
+
+def total_changes(db) -> int:
+    """Сколько строк SQLite изменило на соединении сессии"""
+    return db.connection().exec_driver_sql('SELECT total_changes()').scalar()
+
+
+# ==================== ТЕСТЫ ==================== #
+
+def test_get_or_create_user_single_statement(db):
+    """
+    Позитивный тест: новый пользователь и изменение данных - один запрос
+
+    Сценарий:
+    - новый телефон: пользователь создан одним INSERT ... RETURNING
+    - тот же телефон с новым email: обновлен тем же запросом, id не меняется
+    - пустое имя не затирает сохраненное
+    """
+    with query_budget(1, name='create'):
+        user = get_or_create_user('+79005550030', 'old@example.com', 'Анна', db)
+    assert user.id is not None
+    assert user.created_at is not None
+
+    with query_budget(1, name='update'):
+        updated = get_or_create_user('+79005550030', 'new@example.com', '', db)
+    db.commit()
+
+    assert updated.id == user.id
+    assert updated.email == 'new@example.com'
+    assert updated.full_name == 'Анна'
+    assert db.query(User).filter(User.phone == '+79005550030').count() == 1
+
+
+def test_get_or_create_user_unchanged_does_not_write(db):
+    """
+    Позитивный тест: повторный донор с теми же данными
+
+    Ожидаемое поведение:
+    - строка пользователя не перезаписывается (total_changes не растет)
+    - возвращается тот же пользователь (UPSERT + чтение по телефону)
+    """
+    user = get_or_create_user('+79005550031', 'donor@example.com', 'Борис', db)
+    db.commit()
+
+    before = total_changes(db)
+    with query_budget(2, name='unchanged'):
+        same = get_or_create_user('+79005550031', 'donor@example.com', None, db)
+
+    assert same.id == user.id
+    assert total_changes(db) == before
+
+
+def test_resolve_user_ids_batch(db):
+    """
+    Позитивный тест: тысячи телефонов - по запросу на пачку
+
+    Сценарий:
+    - 2500 новых телефонов и один существующий, у которого меняется имя
+    - повторяющийся телефон: берутся последние непустые email и имя
+    - пустой телефон пропускается
+    """
+    existing = get_or_create_user('+79005550032', None, 'Старое имя', db)
+    db.commit()
+
+    users = [(f'+7001{n:07d}', f'user{n}@example.com', f'Донор {n}') for n in range(2500)]
+    users += [('+79005550032', '', 'Новое имя'), ('+70010000001', None, 'Повтор'), ('', 'x@example.com', 'Без телефона')]
+
+    # 2501 телефон - две пачки; в обеих все строки вставлены или изменены, SELECT не нужен
+    with query_budget(2, name='resolve_user_ids'):
+        ids = resolve_user_ids(db.connection(), users)
+    db.commit()
+
+    assert len(ids) == 2501
+    assert ids['+79005550032'] == existing.id
+    assert len(set(ids.values())) == 2501
+    repeated = db.get(User, ids['+70010000001'])
+    assert (repeated.email, repeated.full_name) == ('user1@example.com', 'Повтор')
+    db.refresh(existing)
+    assert existing.full_name == 'Новое имя'
+
+    # Повторный запуск: данные не изменились - ничего не записывается, id те же
+    before = total_changes(db)
+    assert resolve_user_ids(db.connection(), users) == ids
+    assert total_changes(db) == before
+
+
+def test_existing_donation_ids(db):
+    """
+    Позитивный тест: уже перенесенные донаты находятся одним запросом
+
+    Ожидаемое поведение: None и отсутствующие id не считаются существующими
+    """
+    db.add(Donation(id=501, public_name='Донор', amount=100, purpose='food', status='succeeded',
+                    created_at=datetime(2025, 1, 1)))
+    db.commit()
+
+    with query_budget(1, name='existing_donation_ids'):
+        assert existing_donation_ids(db.connection(), [501, 502, None]) == {501}
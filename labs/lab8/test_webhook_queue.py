@@ -0,0 +1,248 @@
+"""
+Юнит-тесты для очереди webhook YooMoney
+
+Этот модуль содержит тесты для:
+- POST /api/yoomoney/webhook: проверка подписи по исходному телу, запись в очередь
+- повторной доставки: одно событие применяется один раз
+- воркеров webhook_queue: пачка событий, создание подписки, повтор для неизвестного платежа
+- асинхронных webhook заглушки fake_yoomoney через настоящий WSGI-сервер
+
+Воркеры в тестах не запускаются в фоне: пачки применяются вызовом run_once.
+"""
+import hashlib
+import hmac
+import json
+import threading
+
+import pytest
+import requests
+from sqlalchemy import event
+from werkzeug.serving import make_server
+
+import backend.app as app_module
+import webhook_queue
+from backend.app import app, Donation, Subscription, User
+from database import WebhookEvent, engine
+from fake_yoomoney import FakeYooMoney
+
+
+# ==================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==================== #
+
+def add_donation(db, payment_id, **kwargs):
+    donation = Donation(public_name='Аноним', amount=500, purpose='food', status='pending',
+                        provider_payment_id=payment_id, **kwargs)
+    db.add(donation)
+    db.commit()
+    return donation
+
+
+def webhook_body(payment_id, status='succeeded', **payment):
+    return json.dumps({
+        'type': 'notification',
+        'event': f'payment.{status}',
+        'object': dict({'id': payment_id, 'status': status}, **payment)
+    }, ensure_ascii=False).encode('utf-8')
+
+
+def post_webhook(client, body, signature=''):
+    return client.post('/api/yoomoney/webhook', data=body,
+                       content_type='application/json',
+                       headers={'X-YooMoney-Signature': signature})
+
+
+# ==================== ТЕСТЫ ==================== #
+
+def test_webhook_is_queued_and_acknowledged(client, db):
+    """
+    Позитивный тест: webhook принимается без обработки доната
+
+    Сценарий:
+    - событие записано в webhook_events, ответ 200
+    - донат еще pending: его обновит воркер
+    - повторная доставка того же события тоже получает 200, но не дублируется
+    """
+    donation = add_donation(db, 'pay-1')
+    body = webhook_body('pay-1')
+
+    assert post_webhook(client, body).status_code == 200
+    assert post_webhook(client, body).status_code == 200
+
+    assert db.query(WebhookEvent).count() == 1
+    db.refresh(donation)
+    assert donation.status == 'pending'
+
+    assert webhook_queue.run_once('test') == 1
+    db.refresh(donation)
+    assert donation.status == 'succeeded'
+    assert donation.paid_at is not None
+    assert db.query(WebhookEvent).one().status == 'done'
+
+
+def test_webhook_signature_is_checked_on_raw_body(client, db, monkeypatch):
+    """
+    Негативный тест: неверная подпись отклоняется
+
+    Ожидаемое поведение:
+    - подпись HMAC-SHA256 от исходных байт тела принимается (даже если JSON
+      сериализован не так, как это сделал бы json.dumps на сервере)
+    - неверная подпись -> 401, событие не записано
+    """
+    monkeypatch.setattr(app_module, 'YOOMONEY_WEBHOOK_SECRET', 'whsec')
+    body = b'{"object": {"status": "succeeded", "id": "pay-2"},  "event": "payment.succeeded"}'
+    signature = hmac.new(b'whsec', body, hashlib.sha256).hexdigest()
+
+    assert post_webhook(client, body, 'bad-signature').status_code == 401
+    assert db.query(WebhookEvent).count() == 0
+
+    assert post_webhook(client, body, signature).status_code == 200
+    assert db.query(WebhookEvent).one().payment_id == 'pay-2'
+
+
+@pytest.mark.parametrize('body', [
+    b'{"event": "payment.succeeded", "object": {}}',
+    b'not json',
+    b'[]',
+    b'"x"',
+    b'1',
+    b'{"event": "payment.succeeded", "object": "pay-3"}',
+    b'{"event": "payment.succeeded", "object": [1]}',
+    b'{"event": "payment.succeeded", "object": {"id": {"nested": 1}}}',
+    b'{"event": ["payment.succeeded"], "object": {"id": "pay-3"}}',
+])
+def test_webhook_without_payment_id_is_rejected(client, db, body):
+    """
+    Негативный тест: тело без object.id, не JSON или JSON не того вида
+
+    Ожидаемое поведение: 400, а не 500 (на 500 YooMoney повторял бы доставку), событие не записано
+    """
+    response = post_webhook(client, body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+    assert db.query(WebhookEvent).count() == 0
+
+
+def test_batch_applies_events_and_creates_subscription(client, db):
+    """
+    Позитивный тест: пачка из разных событий применяется одним проходом
+
+    Сценарий:
+    - 20 успешных платежей, 1 отмененный и 1 регулярный с сохраненной картой
+    - регулярный платеж создает способ оплаты и подписку
+    """
+    for n in range(20):
+        add_donation(db, f'pay-ok-{n}')
+        post_webhook(client, webhook_body(f'pay-ok-{n}'))
+    add_donation(db, 'pay-cancel')
+    post_webhook(client, webhook_body('pay-cancel', status='canceled'))
+
+    user = User(phone='+79001112233', full_name='Донор')
+    db.add(user)
+    db.commit()
+    add_donation(db, 'pay-recurring', user_id=user.id, is_recurring=True)
+    post_webhook(client, webhook_body('pay-recurring', payment_method={'id': 'tok-1', 'card': {'last4': '4242'}}))
+
+    assert webhook_queue.run_once('test', limit=100) == 22
+
+    assert db.query(Donation).filter(Donation.status == 'succeeded').count() == 21
+    assert db.query(Donation).filter(Donation.status == 'canceled').count() == 1
+    subscription = db.query(Subscription).one()
+    assert subscription.payment_method.provider_payment_token == 'tok-1'
+    assert db.query(Donation).filter(Donation.provider_payment_id == 'pay-recurring').one().subscription_id == subscription.id
+    assert db.query(WebhookEvent).filter(WebhookEvent.status != 'done').count() == 0
+
+
+def test_failing_first_event_rolls_back_only_itself(client, db):
+    """
+    Негативный тест: первое событие пачки падает при применении
+
+    Сценарий:
+    - у первого события поврежденное тело, у второго - успешный платеж
+    - транзакция пачки открыта BEGIN IMMEDIATE до первого SAVEPOINT
+    Ожидаемое поведение:
+    - первое событие failed, его донат не изменился
+    - второе событие применено, оба результата сохранены одним коммитом
+    """
+    add_donation(db, 'pay-broken')
+    add_donation(db, 'pay-fine')
+    db.add(WebhookEvent(payment_id='pay-broken', event_type='payment.succeeded', payload='{not json'))
+    db.commit()
+    post_webhook(client, webhook_body('pay-fine'))
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0].upper() if statement.strip() else '')
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        assert webhook_queue.run_once('test') == 2
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert statements.index('BEGIN') < statements.index('SAVEPOINT')
+
+    db.expire_all()
+    broken = db.query(WebhookEvent).filter(WebhookEvent.payment_id == 'pay-broken').one()
+    assert (broken.status, broken.last_error) == ('failed', 'Invalid JSON payload')
+    assert db.query(WebhookEvent).filter(WebhookEvent.payment_id == 'pay-fine').one().status == 'done'
+    assert db.query(Donation).filter(Donation.provider_payment_id == 'pay-broken').one().status == 'pending'
+    assert db.query(Donation).filter(Donation.provider_payment_id == 'pay-fine').one().status == 'succeeded'
+
+
+def test_unknown_payment_is_retried_then_failed(client, db, monkeypatch):
+    """
+    Негативный тест: донат с таким ID платежа еще не сохранен
+
+    Ожидаемое поведение:
+    - событие возвращается в очередь, а не теряется
+    - если донат появился, следующий проход применяет событие
+    - после WEBHOOK_MAX_ATTEMPTS попыток событие помечается failed
+    """
+    monkeypatch.setattr(webhook_queue, 'WEBHOOK_RETRY_SECONDS', 0)
+    monkeypatch.setattr(webhook_queue, 'WEBHOOK_MAX_ATTEMPTS', 2)
+    post_webhook(client, webhook_body('pay-late'))
+    post_webhook(client, webhook_body('pay-missing'))
+
+    webhook_queue.run_once('test')
+    assert db.query(WebhookEvent).filter(WebhookEvent.status == 'queued').count() == 2
+
+    donation = add_donation(db, 'pay-late')
+    webhook_queue.run_once('test')
+
+    db.refresh(donation)
+    assert donation.status == 'succeeded'
+    statuses = {e.payment_id: (e.status, e.last_error) for e in db.query(WebhookEvent)}
+    assert statuses == {'pay-late': ('done', None), 'pay-missing': ('failed', 'Donation not found')}
+
+
+def test_fake_provider_delivers_signed_webhooks(client, db, monkeypatch):
+    """
+    Позитивный тест: заглушка YooMoney сама присылает webhook о созданном платеже
+
+    Сценарий:
+    - API работает на WSGI-сервере werkzeug, заглушка знает его адрес и секрет подписи
+    - создается платеж, донат сохраняется с его ID
+    - через webhook_delay заглушка доставляет payment.succeeded, подпись проходит
+    - воркер применяет событие: донат succeeded
+    """
+    monkeypatch.setattr(app_module, 'YOOMONEY_WEBHOOK_SECRET', 'hook-secret')
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    provider = FakeYooMoney(
+        webhook_url=f'http://127.0.0.1:{server.server_port}/api/yoomoney/webhook',
+        webhook_delay=0.05,
+        webhook_secret='hook-secret'
+    ).start()
+    try:
+        payment = requests.post(provider.url, json={'amount': {'value': '500.0'}}).json()
+        donation = add_donation(db, payment['id'])
+
+        assert provider.wait_webhooks(5)
+        assert provider.webhook_stats == {'scheduled': 1, 'delivered': 1, 'retried': 0, 'failed': 0}
+        assert webhook_queue.run_once('test') == 1
+    finally:
+        provider.stop()
+        server.shutdown()
+
+    db.refresh(donation)
+    assert donation.status == 'succeeded'
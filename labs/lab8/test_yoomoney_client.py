@@ -0,0 +1,200 @@
+"""
+Юнит-тесты для HTTP-клиента YooMoney
+
+Этот модуль содержит тесты для:
+- пула keep-alive соединений
+- повторов с тем же Idempotence-Key и таймаутов
+- circuit breaker
+
+Вместо YooMoney используется локальная заглушка fake_yoomoney.
+"""
+import time
+
+import pytest
+import requests
+
+from fake_yoomoney import FakeYooMoney
+from yoomoney_client import YooMoneyClient, YooMoneyError, CircuitOpenError
+
+PAYLOAD = {'amount': {'value': '500.0', 'currency': 'RUB'}, 'metadata': {'donation_id': 1}}
+
+
+# ==================== FIXTURES ==================== #
+
+@pytest.fixture
+def provider():
+    """Локальная заглушка YooMoney"""
+    server = FakeYooMoney().start()
+    yield server
+    server.stop()
+
+
+def make_client(provider, **options):
+    options.setdefault('backoff', 0.01)
+    return YooMoneyClient(provider.url, 'secret', **options)
+
+
+# ==================== ТЕСТЫ ==================== #
+
+def test_client_reuses_connection(provider):
+    """
+    Позитивный тест: последовательные платежи идут через одно keep-alive соединение
+
+    Ожидаемое поведение:
+    - 20 платежей, у заглушки одно клиентское соединение
+    - счетчики учли все запросы
+    """
+    client = make_client(provider)
+
+    for i in range(20):
+        assert client.create_payment(PAYLOAD)['status'] == 'pending'
+
+    assert len(provider.connections) == 1
+    stats = client.stats()
+    assert stats['requests'] == 20
+    assert stats['succeeded'] == 20
+    assert sum(stats['latency_buckets'].values()) == 20
+
+
+def test_client_retries_with_same_idempotence_key(provider):
+    """
+    Позитивный тест: ошибка 500 повторяется с тем же ключом идемпотентности
+
+    Ожидаемое поведение:
+    - два запроса к провайдеру с одним ключом, платеж создан
+    """
+    provider.failures_left = 1
+    client = make_client(provider)
+
+    payment = client.create_payment(PAYLOAD, idempotence_key='donation-1')
+
+    assert payment['id'].startswith('fake-')
+    assert provider.requests == ['donation-1', 'donation-1']
+    assert client.stats()['retries'] == 1
+
+
+def test_client_does_not_retry_client_errors(provider):
+    """
+    Негативный тест: ошибка 4xx (неверный запрос) не повторяется
+
+    Ожидаемое поведение:
+    - один запрос, YooMoneyError, circuit breaker остается замкнутым
+    """
+    provider.failures_left = 1
+    provider.failure_status = 400
+    client = make_client(provider)
+
+    with pytest.raises(YooMoneyError):
+        client.create_payment(PAYLOAD)
+
+    assert len(provider.requests) == 1
+    assert client.breaker.state == 'closed'
+
+
+def test_client_read_timeout(provider):
+    """
+    Негативный тест: провайдер не отвечает дольше read_timeout
+
+    Ожидаемое поведение:
+    - YooMoneyError без ожидания полного ответа, счетчик timeouts
+    """
+    provider.delay = 1.0
+    client = make_client(provider, read_timeout=0.1, max_retries=0)
+
+    started = time.monotonic()
+    with pytest.raises(YooMoneyError):
+        client.create_payment(PAYLOAD)
+
+    assert time.monotonic() - started < 0.8
+    assert client.stats()['timeouts'] == 1
+
+
+def test_circuit_breaker_fails_fast_and_recovers(provider):
+    """
+    Позитивный тест: цепь размыкается после серии ошибок и замыкается после успешной пробы
+
+    Сценарий:
+    - две ошибки подряд размыкают цепь
+    - следующий вызов отклоняется без запроса к провайдеру
+    - после reset_timeout пробный запрос проходит и замыкает цепь
+    """
+    provider.failures_left = 2
+    client = make_client(provider, max_retries=0, failure_threshold=2, reset_timeout=0.2)
+
+    for _ in range(2):
+        with pytest.raises(YooMoneyError):
+            client.create_payment(PAYLOAD)
+
+    with pytest.raises(CircuitOpenError):
+        client.create_payment(PAYLOAD)
+    assert len(provider.requests) == 2
+    assert client.stats()['circuit_rejected'] == 1
+
+    time.sleep(0.25)
+    client.create_payment(PAYLOAD)
+    assert client.breaker.state == 'closed'
+
+
+def test_circuit_breaker_probe_always_resolves(provider, monkeypatch):
+    """
+    Негативный тест: пробный запрос в half_open падает не таймаутом и не обрывом соединения
+
+    Сценарий:
+    - цепь разомкнута, проба получает TooManyRedirects
+    - проба считается ошибкой: цепь снова open, а не зависает в half_open
+    - после reset_timeout следующая проба проходит и замыкает цепь
+    - исключение не из requests освобождает место пробы без изменения состояния
+    """
+    provider.failures_left = 1
+    client = make_client(provider, max_retries=0, failure_threshold=1, reset_timeout=0.1)
+    with pytest.raises(YooMoneyError):
+        client.create_payment(PAYLOAD)
+    assert client.breaker.state == 'open'
+
+    time.sleep(0.15)
+    post = client.session.post
+
+    def redirect_loop(*args, **kwargs):
+        raise requests.TooManyRedirects('Exceeded 30 redirects.')
+
+    monkeypatch.setattr(client.session, 'post', redirect_loop)
+    with pytest.raises(YooMoneyError) as error:
+        client.create_payment(PAYLOAD)
+    assert not isinstance(error.value, CircuitOpenError)
+    assert client.breaker.state == 'open'
+    assert client.stats()['request_errors'] == 1
+
+    time.sleep(0.15)
+
+    def broken_payload(*args, **kwargs):
+        raise TypeError('Object of type set is not JSON serializable')
+
+    monkeypatch.setattr(client.session, 'post', broken_payload)
+    with pytest.raises(TypeError):
+        client.create_payment(PAYLOAD)
+    assert client.breaker.state == 'half_open'
+
+    monkeypatch.setattr(client.session, 'post', post)
+    assert client.create_payment(PAYLOAD)['status'] == 'pending'
+    assert client.breaker.state == 'closed'
+
+
+def test_provider_error_rate():
+    """
+    Негативный тест: заглушка с долей ошибок 100% - клиент исчерпывает повторы
+
+    Ожидаемое поведение:
+    - YooMoneyError после 1 + max_retries попыток
+    - с error_rate=0 тот же клиент снова создает платежи
+    """
+    provider = FakeYooMoney(error_rate=1.0).start()
+    try:
+        client = make_client(provider, max_retries=2, failure_threshold=10)
+        with pytest.raises(YooMoneyError):
+            client.create_payment(PAYLOAD)
+        assert len(provider.requests) == 3
+
+        provider.error_rate = 0.0
+        assert client.create_payment(PAYLOAD)['status'] == 'pending'
+    finally:
+        provider.stop()